@@ -0,0 +1,73 @@
+// SPDX-License-Identifier: MIT
+
+pragma solidity ^0.8.0;
+
+import "./Token.sol";
+import "./TokenCrowdsale.sol";
+import "@openzeppelin/contracts/proxy/Clones.sol";
+
+contract CrowdsaleFactory {
+    address public immutable tokenImplementation;
+    address public immutable crowdsaleImplementation;
+
+    event SaleCreated(
+        address indexed owner,
+        address crowdsale,
+        address token
+    );
+
+    constructor() {
+        Token _token = new Token();
+        tokenImplementation = address(_token);
+        // The implementation sale only provides code for the clones, which
+        // never read its storage, so any valid configuration will do
+        crowdsaleImplementation = address(
+            new TokenCrowdsale(
+                TokenCrowdsale.CrowdsaleConfig(
+                    1,
+                    0,
+                    payable(address(this)),
+                    address(_token),
+                    2,
+                    0,
+                    1,
+                    block.timestamp,
+                    block.timestamp + 1,
+                    1,
+                    address(this),
+                    address(this),
+                    address(this)
+                )
+            )
+        );
+    }
+
+    // The config's token is ignored, every sale gets a fresh token clone
+    // owned by the sale. The sale itself is owned by the caller
+    function createSale(TokenCrowdsale.CrowdsaleConfig memory _config)
+        public
+        returns (address crowdsale)
+    {
+        address token = Clones.clone(tokenImplementation);
+        crowdsale = Clones.clone(crowdsaleImplementation);
+
+        Token(token).initialize(crowdsale);
+        _config.token = token;
+        TokenCrowdsale(payable(crowdsale)).initialize(_config, msg.sender);
+
+        emit SaleCreated(msg.sender, crowdsale, token);
+    }
+
+    function createSales(TokenCrowdsale.CrowdsaleConfig[] calldata _configs)
+        external
+        returns (address[] memory crowdsales)
+    {
+        crowdsales = new address[](_configs.length);
+        for (uint256 i = 0; i < _configs.length; ) {
+            crowdsales[i] = createSale(_configs[i]);
+            unchecked {
+                ++i;
+            }
+        }
+    }
+}
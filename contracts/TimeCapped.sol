@@ -2,9 +2,12 @@
 
 pragma solidity ^0.8.0;
 
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
+
 contract TimeCapped {
-    uint256 private _openingTime;
-    uint256 private _closingTime;
+    // Packed so isOpen() costs a single storage read
+    uint64 private _openingTime;
+    uint64 private _closingTime;
 
     modifier onlyWhileOpen() {
         require(isOpen(), "Not Open");
@@ -17,6 +20,10 @@ contract TimeCapped {
     }
 
     constructor(uint256 openingTime_, uint256 closingTime_) {
+        _setTimeCap(openingTime_, closingTime_);
+    }
+
+    function _setTimeCap(uint256 openingTime_, uint256 closingTime_) internal {
         require(
             openingTime_ >= block.timestamp,
             "Opening Time cannot be before the current time"
@@ -25,8 +32,8 @@ contract TimeCapped {
             closingTime_ > openingTime_,
             "Opening Time should be before closing time"
         );
-        _openingTime = openingTime_;
-        _closingTime = closingTime_;
+        _openingTime = SafeCast.toUint64(openingTime_);
+        _closingTime = SafeCast.toUint64(closingTime_);
     }
 
     function openingTime() public view returns (uint256) {
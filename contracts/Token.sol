@@ -17,16 +17,32 @@ pragma solidity ^0.8.0;
 
 import "@openzeppelin/contracts/token/ERC20/ERC20.sol";
 import "@openzeppelin/contracts/access/Ownable.sol";
+import "@openzeppelin/contracts/proxy/utils/Initializable.sol";
 
 // import "@openzeppelin/contracts/token/ERC20/extensions/ERC20Pausable.sol";
 
-contract Token is ERC20, Ownable {
+contract Token is ERC20, Ownable, Initializable {
     bool private _canMint;
 
-    constructor() ERC20("ICO Token", "iTok") {
+    constructor() ERC20("ICO Token", "iTok") initializer {
         _canMint = true;
     }
 
+    // Clones share this contract's code but not the storage written by the
+    // constructor, so they are set up here instead
+    function initialize(address _owner) external initializer {
+        _transferOwnership(_owner);
+        _canMint = true;
+    }
+
+    function name() public pure override returns (string memory) {
+        return "ICO Token";
+    }
+
+    function symbol() public pure override returns (string memory) {
+        return "iTok";
+    }
+
     function mint(address _account, uint256 _amount)
         external
         onlyOwner
@@ -4,43 +4,127 @@ pragma solidity ^0.8.0;
 
 import "./Token.sol";
 import "./TimeCapped.sol";
+import "./VestingVault.sol";
 import "./WhitelistedCrowdsale.sol";
 import "@openzeppelin/contracts/access/Ownable.sol";
+import "@openzeppelin/contracts/proxy/utils/Initializable.sol";
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
+
+contract TokenCrowdsale is
+    Ownable,
+    Initializable,
+    TimeCapped,
+    WhitelistedCrowdsale
+{
+    struct CrowdsaleConfig {
+        uint256 rate;
+        // Optional packed time tiers, see rate(). Zero sells at a flat rate
+        uint256 rateSchedule;
+        address payable wallet;
+        address token;
+        uint256 cap;
+        uint256 investorMinCap;
+        uint256 investorMaxCap;
+        uint256 openingTime;
+        uint256 closingTime;
+        uint256 goal;
+        address foundersAddress;
+        address foundationAddress;
+        address partnersAddress;
+    }
 
-contract TokenCrowdsale is Ownable, TimeCapped, WhitelistedCrowdsale {
-    uint256 public rate;
-    address payable public wallet;
-    Token public token;
+    // A purchase signed by its purchaser, paid from the purchaser's relay
+    // deposit and submitted by a relayer. The beneficiary is whitelisted by
+    // proof when one is given, then by voucher, then by the whitelist mapping
+    struct PurchaseIntent {
+        address purchaser;
+        address beneficiary;
+        uint256 amount;
+        uint256 deadline;
+        bytes signature;
+        bytes32[] proof;
+        uint256 voucherMaxAmount;
+        uint256 voucherExpiry;
+        bytes voucherSignature;
+    }
 
-    uint256 public cap;
-    uint256 public investorMinCap;
-    uint256 public investorMaxCap;
-    mapping(address => uint256) public contributions;
+    // Both balances of an investor share a single storage slot
+    struct Investor {
+        uint128 contribution;
+        uint128 tokensOwned;
+    }
 
-    mapping(address => uint256) public beneficiaryTokensOwned;
-    address[] public tokenHolders;
+    uint256 public constant tokenSalePercentage = 60;
+    uint256 public constant foundersPercentage = 20;
+    uint256 public constant foundationPercentage = 15;
+    uint256 public constant partnersPercentage = 5;
 
-    uint256 public amountRaised;
-    uint256 public goal;
-    bool public didWithdrawFunds;
-    bool public finalized;
+    // The schedule packs up to this many 64 bit tiers, each holding the
+    // tier's start in seconds after opening (high 32 bits) and its rate (low
+    // 32 bits). Tiers after the first one with a zero rate are unused
+    uint256 public constant MAX_RATE_TIERS = 4;
+
+    // Gas forwarded to each recipient of refundBatch, enough for smart
+    // contract wallets but not for one recipient to drain the batch
+    uint256 public constant REFUND_CALL_GAS = 30_000;
 
-    uint256 public tokenSalePercentage = 60;
-    uint256 public foundersPercentage = 20;
-    uint256 public foundationPercentage = 15;
-    uint256 public partnersPercentage = 5;
+    bytes32 public constant PURCHASE_TYPEHASH =
+        keccak256(
+            "Purchase(address purchaser,address beneficiary,uint256 amount,uint256 nonce,uint256 deadline)"
+        );
+
+    // Reasons a relayed purchase is skipped, the first five are the purchase
+    // rules buyToken reverts on
+    uint256 internal constant PURCHASE_ZERO_VALUE = 1;
+    uint256 internal constant PURCHASE_BELOW_MIN_CAP = 2;
+    uint256 internal constant PURCHASE_ABOVE_MAX_CAP = 3;
+    uint256 internal constant PURCHASE_CAP_EXCEEDED = 4;
+    uint256 internal constant PURCHASE_ZERO_BENEFICIARY = 5;
+    uint256 internal constant RELAY_EXPIRED = 6;
+    uint256 internal constant RELAY_BAD_SIGNATURE = 7;
+    uint256 internal constant RELAY_DEPOSIT_TOO_LOW = 8;
+    uint256 internal constant RELAY_NOT_WHITELISTED = 9;
+    uint256 internal constant RELAY_VOUCHER_EXCEEDED = 10;
+
+    // Set in the initializer rather than immutable so factory clones, which
+    // share this contract's code, can each hold their own configuration
+    address payable public wallet;
+    Token public token;
+
+    // Every purchase reads the caps and the rate schedule, which take three
+    // slots, the whole schedule being a single storage read
+    uint128 public investorMinCap;
+    uint128 public investorMaxCap;
+    uint128 public cap;
+    uint128 public goal;
+    uint256 public rateSchedule;
 
     address public foundersAddress;
     address public foundationAddress;
     address public partnersAddress;
+    // When set, finalize mints the allocations into the vault instead
+    VestingVault public vestingVault;
 
     enum CrowdsaleState {
         PreICO,
         ICO
     }
 
+    // amountRaised and tokensSold are updated together on every purchase and
+    // share a slot, as do the finalize flags and the sale state
+    uint128 public amountRaised;
+    uint128 public tokensSold;
+    bool public didWithdrawFunds;
+    bool public finalized;
     CrowdsaleState private state;
 
+    mapping(address => Investor) private investors;
+    // Next nonce a purchaser's intent has to be signed with
+    mapping(address => uint256) public relayNonces;
+    // Ether escrowed by purchasers for their relayed purchases. It is not
+    // part of amountRaised until an intent spends it
+    mapping(address => uint256) public relayDeposits;
+
     event TokensPurchased(
         address indexed purchaser,
         address indexed beneficiary,
@@ -50,64 +134,148 @@ contract TokenCrowdsale is Ownable, TimeCapped, WhitelistedCrowdsale {
 
     event FundsWithdrawn(address indexed wallet, uint256 amount);
     event RefundClaimed(address indexed refundee, uint256 amount);
+    event RefundFailed(address indexed refundee, uint256 amount);
+    event RelayDeposited(address indexed purchaser, uint256 amount);
+    event RelayDepositWithdrawn(address indexed purchaser, uint256 amount);
+    event RelayedPurchaseFailed(
+        uint256 index,
+        address indexed purchaser,
+        address indexed beneficiary,
+        uint256 reason
+    );
+    event TokensClaimed(address indexed beneficiary, uint256 amount);
 
     event CrowdsaleFinalized();
+    event VestingVaultSet(address indexed vault);
+
+    constructor(CrowdsaleConfig memory _config)
+        TimeCapped(_config.openingTime, _config.closingTime)
+        initializer
+    {
+        _initialize(_config);
+    }
+
+    // Entry point for clones deployed by CrowdsaleFactory
+    function initialize(CrowdsaleConfig calldata _config, address _owner)
+        external
+        initializer
+    {
+        _setTimeCap(_config.openingTime, _config.closingTime);
+        _initialize(_config);
+        _transferOwnership(_owner);
+    }
 
-    constructor(
-        uint256 _rate,
-        address payable _wallet,
-        address _token,
-        uint256 _cap,
-        uint256 _investorMinCap,
-        uint256 _investorMaxCap,
-        uint256 _openingTime,
-        uint256 _closingTime,
-        uint256 _goal,
-        address _foundersAddress,
-        address _foundationAddress,
-        address _partnersAddress
-    ) TimeCapped(_openingTime, _closingTime) {
-        require(_rate > 0, "Crowdsale rate is 0");
-        require(_wallet != address(0), "Wallet is the zero address");
-        require(address(_token) != address(0), "Token is the zero address");
-        require(_cap > 0, "Cap limit is zero");
+    function _initialize(CrowdsaleConfig memory _config) internal {
+        require(_config.wallet != address(0), "Wallet is the zero address");
+        require(_config.token != address(0), "Token is the zero address");
+        require(_config.cap > 0, "Cap limit is zero");
+        require(_config.cap <= type(uint128).max, "Cap limit is too large");
         require(
-            (_investorMinCap < _investorMaxCap),
+            (_config.investorMinCap < _config.investorMaxCap),
             "Investor minimum cap should be less than the max cap"
         );
         require(
-            (_investorMaxCap > 0 && _investorMaxCap < _cap),
+            (_config.investorMaxCap > 0 &&
+                _config.investorMaxCap < _config.cap),
             "Investor max cap should be less than the max cap of crowdsale and shouldn't be zero"
         );
-        require(_goal > 0, "Goal should be greater than zero");
+        require(_config.goal > 0, "Goal should be greater than zero");
         require(
-            _goal <= _cap,
+            _config.goal <= _config.cap,
             "Goal should be less than/equal to the crowdsale cap"
         );
 
         require(
-            _foundersAddress != address(0),
+            _config.foundersAddress != address(0),
             "Crowdsale: Founders address cannot be address 0"
         );
         require(
-            _foundationAddress != address(0),
+            _config.foundationAddress != address(0),
             "Crowdsale: Foundation address cannot be address 0"
         );
         require(
-            _partnersAddress != address(0),
+            _config.partnersAddress != address(0),
             "Crowdsale: Partners address cannot be address 0"
         );
 
-        rate = _rate;
-        wallet = _wallet;
-        token = Token(_token);
-        cap = _cap;
-        investorMinCap = _investorMinCap;
-        investorMaxCap = _investorMaxCap;
-        goal = _goal;
-        foundersAddress = _foundersAddress;
-        foundationAddress = _foundationAddress;
-        partnersAddress = _partnersAddress;
+        if (_config.rateSchedule == 0) {
+            require(_config.rate > 0, "Crowdsale rate is 0");
+            rateSchedule = SafeCast.toUint32(_config.rate);
+        } else {
+            _checkRateSchedule(_config.rateSchedule);
+            rateSchedule = _config.rateSchedule;
+        }
+        wallet = _config.wallet;
+        token = Token(_config.token);
+        // The caps and goal are at most cap, which was checked to fit in uint128
+        cap = uint128(_config.cap);
+        investorMinCap = uint128(_config.investorMinCap);
+        investorMaxCap = uint128(_config.investorMaxCap);
+        goal = uint128(_config.goal);
+        foundersAddress = _config.foundersAddress;
+        foundationAddress = _config.foundationAddress;
+        partnersAddress = _config.partnersAddress;
+    }
+
+    function _checkRateSchedule(uint256 _schedule) internal pure {
+        require(
+            uint32(_schedule >> 32) == 0,
+            "Crowdsale: First rate tier should start at opening"
+        );
+        require(uint32(_schedule) > 0, "Crowdsale rate is 0");
+        uint256 previousStart = 0;
+        bool ended = false;
+        for (uint256 i = 1; i < MAX_RATE_TIERS; ) {
+            uint256 tier = _schedule >> (64 * i);
+            if (uint32(tier) == 0) {
+                ended = true;
+            } else {
+                uint256 start = uint32(tier >> 32);
+                require(
+                    !ended && start > previousStart,
+                    "Crowdsale: Rate tiers should start in increasing order"
+                );
+                previousStart = start;
+            }
+            unchecked {
+                ++i;
+            }
+        }
+    }
+
+    function rate() public view returns (uint256) {
+        uint256 schedule = rateSchedule;
+        uint256 opening = openingTime();
+        uint256 elapsed = block.timestamp > opening
+            ? block.timestamp - opening
+            : 0;
+
+        uint256 currentRate = uint32(schedule);
+        for (uint256 i = 1; i < MAX_RATE_TIERS; ) {
+            uint256 tier = schedule >> (64 * i);
+            if (uint32(tier) == 0 || elapsed < uint32(tier >> 32)) break;
+            currentRate = uint32(tier);
+            unchecked {
+                ++i;
+            }
+        }
+        return currentRate;
+    }
+
+    function contributions(address _beneficiary)
+        external
+        view
+        returns (uint256)
+    {
+        return investors[_beneficiary].contribution;
+    }
+
+    function beneficiaryTokensOwned(address _beneficiary)
+        public
+        view
+        returns (uint256)
+    {
+        return investors[_beneficiary].tokensOwned;
     }
 
     function capLimitReached() external view returns (bool) {
@@ -124,7 +292,8 @@ contract TokenCrowdsale is Ownable, TimeCapped, WhitelistedCrowdsale {
             "Crowdsale: Cannot set ICO state to an older state"
         );
         state = _state;
-        if (state == CrowdsaleState.ICO) rate = 10;
+        // Switching to ICO by hand replaces any schedule with a flat rate
+        if (state == CrowdsaleState.ICO) rateSchedule = 10;
     }
 
     fallback() external payable {
@@ -141,46 +310,243 @@ contract TokenCrowdsale is Ownable, TimeCapped, WhitelistedCrowdsale {
             checkWhitelistedUser(_beneficiary),
             "Crowdsale: Beneficiary is not whitelisted"
         );
-        require(msg.value != 0, "Ether amount should be more than 0");
+        _buyToken(msg.sender, _beneficiary, msg.value);
+        return true;
+    }
+
+    function buyTokenWithProof(address _beneficiary, bytes32[] calldata _proof)
+        external
+        payable
+        onlyWhileOpen
+        returns (bool)
+    {
         require(
-            _beneficiary != address(0),
-            "Beneficiary address is the zero address"
+            checkWhitelistedProof(_beneficiary, _proof),
+            "Crowdsale: Beneficiary is not whitelisted"
         );
+        _buyToken(msg.sender, _beneficiary, msg.value);
+        return true;
+    }
 
-        contributions[_beneficiary] += msg.value;
+    // A voucher caps the beneficiary's total contribution at _maxAmount and can
+    // be reused until then, so it needs no storage of its own
+    function buyTokenWithVoucher(
+        address _beneficiary,
+        uint256 _maxAmount,
+        uint256 _expiry,
+        bytes calldata _signature
+    ) external payable onlyWhileOpen returns (bool) {
         require(
-            contributions[_beneficiary] >= investorMinCap,
-            "Ether amount is less than the minimum contribution amount"
+            checkWhitelistedVoucher(_beneficiary, _maxAmount, _expiry, _signature),
+            "Crowdsale: Beneficiary is not whitelisted"
         );
+        _buyToken(msg.sender, _beneficiary, msg.value);
         require(
-            contributions[_beneficiary] <= investorMaxCap,
-            "Ether amount is more than the max contribution amount"
+            investors[_beneficiary].contribution <= _maxAmount,
+            "Crowdsale: Voucher amount exceeded"
         );
+        return true;
+    }
 
-        amountRaised += msg.value;
-        require(amountRaised <= cap, "Crowdsale cap exceeded");
+    // Escrows ether for relayed purchases, which only spend from the deposit
+    // of the purchaser who signed them
+    function depositForRelay() external payable {
+        require(msg.value != 0, "Ether amount should be more than 0");
+        relayDeposits[msg.sender] += msg.value;
+        emit RelayDeposited(msg.sender, msg.value);
+    }
 
-        uint256 tokensToIssue = calculateTokens(msg.value);
-        require(
-            token.mint(address(this), tokensToIssue),
-            "Crowdsale: Token minting failed"
+    function withdrawRelayDeposit(uint256 _amount) external returns (bool) {
+        uint256 deposit = relayDeposits[msg.sender];
+        require(_amount <= deposit, "Crowdsale: Relay deposit too low");
+        relayDeposits[msg.sender] = deposit - _amount;
+
+        (bool sent, ) = payable(msg.sender).call{value: _amount}("");
+        require(sent, "Crowdsale: Transaction failed");
+        emit RelayDepositWithdrawn(msg.sender, _amount);
+        return true;
+    }
+
+    // A failing intent is skipped rather than reverting the batch. It keeps
+    // its nonce and deposit, so it can be relayed again before its deadline
+    // or replaced by another intent signed with the same nonce
+    function relayPurchases(PurchaseIntent[] calldata _intents)
+        external
+        onlyWhileOpen
+        returns (uint256 succeeded)
+    {
+        for (uint256 i = 0; i < _intents.length; ) {
+            PurchaseIntent calldata intent = _intents[i];
+            uint256 reason = _relayPurchase(intent);
+            if (reason == 0) {
+                ++succeeded;
+            } else {
+                emit RelayedPurchaseFailed(
+                    i,
+                    intent.purchaser,
+                    intent.beneficiary,
+                    reason
+                );
+            }
+            unchecked {
+                ++i;
+            }
+        }
+    }
+
+    function _relayPurchase(PurchaseIntent calldata _intent)
+        internal
+        returns (uint256)
+    {
+        if (block.timestamp > _intent.deadline) return RELAY_EXPIRED;
+        address purchaser = _intent.purchaser;
+        uint256 nonce = relayNonces[purchaser];
+        (address signer, ECDSA.RecoverError error) = ECDSA.tryRecover(
+            _hashPurchaseIntent(_intent, nonce),
+            _intent.signature
+        );
+        if (error != ECDSA.RecoverError.NoError || signer != purchaser) {
+            return RELAY_BAD_SIGNATURE;
+        }
+        uint256 deposit = relayDeposits[purchaser];
+        if (deposit < _intent.amount) return RELAY_DEPOSIT_TOO_LOW;
+
+        (uint256 reason, uint256 contribution, ) = _checkPurchase(
+            _intent.beneficiary,
+            _intent.amount
         );
-        if (beneficiaryTokensOwned[_beneficiary] == 0) {
-            tokenHolders.push(_beneficiary);
+        if (reason == 0) reason = _checkIntentWhitelist(_intent, contribution);
+        if (reason != 0) return reason;
+
+        relayNonces[purchaser] = nonce + 1;
+        relayDeposits[purchaser] = deposit - _intent.amount;
+        _buyToken(purchaser, _intent.beneficiary, _intent.amount);
+        return 0;
+    }
+
+    function _hashPurchaseIntent(PurchaseIntent calldata _intent, uint256 _nonce)
+        internal
+        view
+        returns (bytes32)
+    {
+        return
+            _hashTypedDataV4(
+                keccak256(
+                    abi.encode(
+                        PURCHASE_TYPEHASH,
+                        _intent.purchaser,
+                        _intent.beneficiary,
+                        _intent.amount,
+                        _nonce,
+                        _intent.deadline
+                    )
+                )
+            );
+    }
+
+    // Checks only the whitelisting the intent carries, the same way
+    // buyTokenWithProof, buyTokenWithVoucher and buyToken do
+    function _checkIntentWhitelist(
+        PurchaseIntent calldata _intent,
+        uint256 _contribution
+    ) internal view returns (uint256) {
+        if (_intent.proof.length != 0) {
+            return
+                checkWhitelistedProof(_intent.beneficiary, _intent.proof)
+                    ? 0
+                    : RELAY_NOT_WHITELISTED;
+        }
+        if (_intent.voucherSignature.length != 0) {
+            if (
+                !checkWhitelistedVoucher(
+                    _intent.beneficiary,
+                    _intent.voucherMaxAmount,
+                    _intent.voucherExpiry,
+                    _intent.voucherSignature
+                )
+            ) return RELAY_NOT_WHITELISTED;
+            return
+                _contribution <= _intent.voucherMaxAmount
+                    ? 0
+                    : RELAY_VOUCHER_EXCEEDED;
         }
-        beneficiaryTokensOwned[_beneficiary] += tokensToIssue;
+        return
+            checkWhitelistedUser(_intent.beneficiary)
+                ? 0
+                : RELAY_NOT_WHITELISTED;
+    }
+
+    // Every purchase rule as a reason code instead of a revert, so relayed
+    // purchases can skip an intent that breaks one. Returns the beneficiary's
+    // contribution and the amount raised after the purchase
+    function _checkPurchase(address _beneficiary, uint256 _value)
+        internal
+        view
+        returns (
+            uint256 reason,
+            uint256 contribution,
+            uint256 raised
+        )
+    {
+        if (_value == 0) return (PURCHASE_ZERO_VALUE, 0, 0);
+        if (_beneficiary == address(0)) return (PURCHASE_ZERO_BENEFICIARY, 0, 0);
+        contribution = investors[_beneficiary].contribution + _value;
+        if (contribution < investorMinCap) return (PURCHASE_BELOW_MIN_CAP, 0, 0);
+        if (contribution > investorMaxCap) return (PURCHASE_ABOVE_MAX_CAP, 0, 0);
+        raised = amountRaised + _value;
+        if (raised > cap) return (PURCHASE_CAP_EXCEEDED, 0, 0);
+    }
+
+    function _purchaseError(uint256 _reason)
+        internal
+        pure
+        returns (string memory)
+    {
+        if (_reason == PURCHASE_ZERO_VALUE) {
+            return "Ether amount should be more than 0";
+        }
+        if (_reason == PURCHASE_ZERO_BENEFICIARY) {
+            return "Beneficiary address is the zero address";
+        }
+        if (_reason == PURCHASE_BELOW_MIN_CAP) {
+            return "Ether amount is less than the minimum contribution amount";
+        }
+        if (_reason == PURCHASE_ABOVE_MAX_CAP) {
+            return "Ether amount is more than the max contribution amount";
+        }
+        return "Crowdsale cap exceeded";
+    }
 
-        emit TokensPurchased(
-            msg.sender,
+    // _purchaser only shows up in TokensPurchased, the ether is already held
+    // by the contract, sent with the call or taken from a relay deposit
+    function _buyToken(
+        address _purchaser,
+        address _beneficiary,
+        uint256 _value
+    ) internal {
+        (uint256 reason, uint256 contribution, uint256 raised) = _checkPurchase(
             _beneficiary,
-            msg.value,
-            tokensToIssue
+            _value
         );
-        return true;
+        if (reason != 0) revert(_purchaseError(reason));
+
+        // Tokens are minted once in finalize, purchases only record them
+        uint256 tokensToIssue = calculateTokens(_value);
+        // contribution and raised are bounded by cap, which fits in uint128
+        investors[_beneficiary] = Investor(
+            uint128(contribution),
+            SafeCast.toUint128(
+                investors[_beneficiary].tokensOwned + tokensToIssue
+            )
+        );
+        amountRaised = uint128(raised);
+        tokensSold = SafeCast.toUint128(tokensSold + tokensToIssue);
+
+        emit TokensPurchased(_purchaser, _beneficiary, _value, tokensToIssue);
     }
 
     function calculateTokens(uint256 weiAmount) public view returns (uint256) {
-        return weiAmount * rate;
+        return weiAmount * rate();
     }
 
     function goalReached() public view returns (bool) {
@@ -206,12 +572,9 @@ contract TokenCrowdsale is Ownable, TimeCapped, WhitelistedCrowdsale {
     function claimRefund() external returns (bool) {
         require(isClosed(), "Crowdsale not closed yet");
         require(!goalReached(), "Crowdsale: Goal has been acheived");
-        require(
-            contributions[msg.sender] > 0,
-            "Crowdsale: You haven't made any contributions"
-        );
-        uint256 balance = contributions[msg.sender];
-        contributions[msg.sender] = 0;
+        uint256 balance = investors[msg.sender].contribution;
+        require(balance > 0, "Crowdsale: You haven't made any contributions");
+        investors[msg.sender].contribution = 0;
 
         address payable _to = payable(msg.sender);
         (bool sent, ) = _to.call{value: balance}("");
@@ -220,38 +583,129 @@ contract TokenCrowdsale is Ownable, TimeCapped, WhitelistedCrowdsale {
         return sent;
     }
 
+    function refundBatch(address[] calldata _refundees)
+        external
+        onlyOwner
+        returns (bool)
+    {
+        require(isClosed(), "Crowdsale not closed yet");
+        require(!goalReached(), "Crowdsale: Goal has been acheived");
+        for (uint256 i = 0; i < _refundees.length; ) {
+            address refundee = _refundees[i];
+            uint256 balance = investors[refundee].contribution;
+            // Already refunded or unknown refundees are skipped like in
+            // claimTokensFor
+            if (balance > 0) {
+                investors[refundee].contribution = 0;
+                (bool sent, ) = payable(refundee).call{
+                    value: balance,
+                    gas: REFUND_CALL_GAS
+                }("");
+                if (sent) {
+                    emit RefundClaimed(refundee, balance);
+                } else {
+                    // The refundee can still claimRefund from a wallet that
+                    // accepts the transfer
+                    investors[refundee].contribution = uint128(balance);
+                    emit RefundFailed(refundee, balance);
+                }
+            }
+            unchecked {
+                ++i;
+            }
+        }
+        return true;
+    }
+
     function claimTokens() external returns (bool) {
-        uint256 tokensOwned = beneficiaryTokensOwned[msg.sender];
-        require(tokensOwned > 0, "Crowdsale: Beneficiary isn't due any tokens");
+        require(
+            investors[msg.sender].tokensOwned > 0,
+            "Crowdsale: Beneficiary isn't due any tokens"
+        );
+        _checkTokensClaimable();
+        _claimTokens(msg.sender);
+        return true;
+    }
+
+    function claimTokensFor(address[] calldata _beneficiaries)
+        external
+        returns (bool)
+    {
+        _checkTokensClaimable();
+        for (uint256 i = 0; i < _beneficiaries.length; ) {
+            // Already claimed or unknown beneficiaries are skipped so a stale
+            // page doesn't revert the whole batch
+            if (investors[_beneficiaries[i]].tokensOwned > 0) {
+                _claimTokens(_beneficiaries[i]);
+            }
+            unchecked {
+                ++i;
+            }
+        }
+        return true;
+    }
+
+    function _checkTokensClaimable() internal view {
         require(isClosed(), "Crowdsale not closed yet");
         require(goalReached(), "Crowdsale: Goal not reached");
         require(finalized, "Crowdsale: Not finalized");
+    }
 
-        beneficiaryTokensOwned[msg.sender] = 0;
+    function _claimTokens(address _beneficiary) internal {
+        uint256 tokensOwned = investors[_beneficiary].tokensOwned;
+        investors[_beneficiary].tokensOwned = 0;
         require(
-            token.transfer(msg.sender, tokensOwned),
+            token.transfer(_beneficiary, tokensOwned),
             "Failed to claim tokens"
         );
+        emit TokensClaimed(_beneficiary, tokensOwned);
+    }
+
+    function setVestingVault(address _vault) external onlyOwner returns (bool) {
+        require(!finalized, "Crowdsale already finalized");
+        VestingVault vault = VestingVault(_vault);
+        require(
+            address(vault.token()) == address(token),
+            "Crowdsale: Vault holds a different token"
+        );
+        require(
+            vault.depositor() == address(this),
+            "Crowdsale: Vault doesn't accept deposits from the crowdsale"
+        );
+        vestingVault = vault;
+        emit VestingVaultSet(_vault);
         return true;
     }
 
+    function _allocate(address _beneficiary, uint256 _amount) internal {
+        VestingVault vault = vestingVault;
+        if (address(vault) == address(0)) {
+            token.mint(_beneficiary, _amount);
+        } else {
+            token.mint(address(vault), _amount);
+            vault.deposit(_beneficiary, _amount);
+        }
+    }
+
     function finalize() public onlyOwner {
         require(!finalized, "Crowdsale already finalized");
         require(isClosed(), "Crowdsale not closed yet");
 
         finalized = true;
 
-        uint256 _mintedTokens = token.totalSupply();
-        uint256 _finalTotalSupply = (_mintedTokens * 100) / tokenSalePercentage;
-        token.mint(
+        uint256 _soldTokens = tokensSold;
+        token.mint(address(this), _soldTokens);
+
+        uint256 _finalTotalSupply = (_soldTokens * 100) / tokenSalePercentage;
+        _allocate(
             foundersAddress,
             (_finalTotalSupply * foundersPercentage) / 100
         );
-        token.mint(
+        _allocate(
             foundationAddress,
             (_finalTotalSupply * foundationPercentage) / 100
         );
-        token.mint(
+        _allocate(
             partnersAddress,
             (_finalTotalSupply * partnersPercentage) / 100
         );
@@ -0,0 +1,138 @@
+// SPDX-License-Identifier: MIT
+
+pragma solidity ^0.8.0;
+
+import "@openzeppelin/contracts/access/Ownable.sol";
+import "@openzeppelin/contracts/token/ERC20/IERC20.sol";
+import "@openzeppelin/contracts/utils/math/SafeCast.sol";
+
+contract VestingVault is Ownable {
+    // Two slots per beneficiary, the amounts and the schedule
+    struct Vesting {
+        uint128 total;
+        uint128 released;
+        uint64 start;
+        uint64 cliff;
+        uint64 duration;
+    }
+
+    IERC20 public immutable token;
+    // The crowdsale, which mints allocations to the vault on finalize
+    address public immutable depositor;
+
+    mapping(address => Vesting) private vestings;
+
+    event VestingScheduled(
+        address indexed beneficiary,
+        uint256 start,
+        uint256 cliff,
+        uint256 duration
+    );
+    event TokensVested(address indexed beneficiary, uint256 amount);
+    event TokensReleased(address indexed beneficiary, uint256 amount);
+
+    constructor(address _token, address _depositor) {
+        require(_token != address(0), "Token is the zero address");
+        require(_depositor != address(0), "Depositor is the zero address");
+        token = IERC20(_token);
+        depositor = _depositor;
+    }
+
+    function setVesting(
+        address _beneficiary,
+        uint256 _start,
+        uint256 _cliff,
+        uint256 _duration
+    ) external onlyOwner returns (bool) {
+        require(
+            _beneficiary != address(0),
+            "Vesting: Beneficiary is the zero address"
+        );
+        require(_duration > 0, "Vesting: Duration is zero");
+        require(
+            _cliff <= _duration,
+            "Vesting: Cliff should be less than/equal to the duration"
+        );
+        Vesting storage vesting = vestings[_beneficiary];
+        require(
+            vesting.total == 0,
+            "Vesting: Schedule cannot change once tokens are vesting"
+        );
+        vesting.start = SafeCast.toUint64(_start);
+        vesting.cliff = SafeCast.toUint64(_cliff);
+        vesting.duration = SafeCast.toUint64(_duration);
+        emit VestingScheduled(_beneficiary, _start, _cliff, _duration);
+        return true;
+    }
+
+    function deposit(address _beneficiary, uint256 _amount)
+        external
+        returns (bool)
+    {
+        require(msg.sender == depositor, "Vesting: Caller is not the depositor");
+        Vesting storage vesting = vestings[_beneficiary];
+        require(vesting.duration > 0, "Vesting: Beneficiary has no schedule");
+        vesting.total = SafeCast.toUint128(vesting.total + _amount);
+        emit TokensVested(_beneficiary, _amount);
+        return true;
+    }
+
+    function getVesting(address _beneficiary)
+        external
+        view
+        returns (Vesting memory)
+    {
+        return vestings[_beneficiary];
+    }
+
+    // Closed form over the schedule, so the cost doesn't grow with the time
+    // elapsed since the last release
+    function vestedAmount(address _beneficiary) public view returns (uint256) {
+        Vesting memory vesting = vestings[_beneficiary];
+        uint256 start = vesting.start;
+        if (block.timestamp < start + vesting.cliff) return 0;
+        if (block.timestamp >= start + vesting.duration) {
+            return vesting.total;
+        }
+        return
+            (uint256(vesting.total) * (block.timestamp - start)) /
+            vesting.duration;
+    }
+
+    function releasable(address _beneficiary) public view returns (uint256) {
+        return vestedAmount(_beneficiary) - vestings[_beneficiary].released;
+    }
+
+    function release(address _beneficiary) external returns (bool) {
+        require(
+            _release(_beneficiary) > 0,
+            "Vesting: Beneficiary has no tokens to release"
+        );
+        return true;
+    }
+
+    function releaseBatch(address[] calldata _beneficiaries)
+        external
+        returns (bool)
+    {
+        for (uint256 i = 0; i < _beneficiaries.length; ) {
+            // Beneficiaries with nothing vested yet are skipped so one of
+            // them doesn't revert the whole batch
+            _release(_beneficiaries[i]);
+            unchecked {
+                ++i;
+            }
+        }
+        return true;
+    }
+
+    function _release(address _beneficiary) internal returns (uint256) {
+        uint256 amount = releasable(_beneficiary);
+        if (amount == 0) return 0;
+        // released never exceeds total, which fits in uint128
+        vestings[_beneficiary].released += uint128(amount);
+        require(token.transfer(_beneficiary, amount), "Failed to release tokens");
+        emit TokensReleased(_beneficiary, amount);
+        return amount;
+    }
+}
@@ -3,9 +3,26 @@
 pragma solidity ^0.8.0;
 
 import "@openzeppelin/contracts/access/Ownable.sol";
+import "@openzeppelin/contracts/utils/cryptography/ECDSA.sol";
+import "@openzeppelin/contracts/utils/cryptography/MerkleProof.sol";
+import "@openzeppelin/contracts/utils/cryptography/draft-EIP712.sol";
+
+contract WhitelistedCrowdsale is Ownable, EIP712 {
+    bytes32 public constant VOUCHER_TYPEHASH =
+        keccak256(
+            "Voucher(address beneficiary,uint256 maxAmount,uint256 expiry)"
+        );
 
-contract WhitelistedCrowdsale is Ownable {
     mapping(address => bool) private whiteListedUsers;
+    bytes32 public whitelistMerkleRoot;
+    // Signs vouchers off-chain, which whitelist without any owner transaction
+    address public kycSigner;
+
+    event KycSignerSet(address indexed signer);
+
+    // EIP712 rebuilds its domain separator when address(this) differs from
+    // the deployed one, so factory clones sign under their own address
+    constructor() EIP712("Crowdsale", "1") {}
 
     function addWhitelistedUser(address _user) public onlyOwner returns (bool) {
         require(
@@ -16,6 +33,24 @@ contract WhitelistedCrowdsale is Ownable {
         return true;
     }
 
+    function addWhitelistedUsers(address[] calldata _users)
+        external
+        onlyOwner
+        returns (bool)
+    {
+        for (uint256 i = 0; i < _users.length; ) {
+            require(
+                _users[i] != address(0),
+                "Failed: Whitelisted user address is the zero address"
+            );
+            whiteListedUsers[_users[i]] = true;
+            unchecked {
+                ++i;
+            }
+        }
+        return true;
+    }
+
     function removeWhitelistedUser(address _user)
         public
         onlyOwner
@@ -26,7 +61,73 @@ contract WhitelistedCrowdsale is Ownable {
         return true;
     }
 
+    function removeWhitelistedUsers(address[] calldata _users)
+        external
+        onlyOwner
+        returns (bool)
+    {
+        for (uint256 i = 0; i < _users.length; ) {
+            require(
+                _users[i] != address(0),
+                "Failed: Address is the zero address"
+            );
+            whiteListedUsers[_users[i]] = false;
+            unchecked {
+                ++i;
+            }
+        }
+        return true;
+    }
+
+    function setWhitelistMerkleRoot(bytes32 _root)
+        external
+        onlyOwner
+        returns (bool)
+    {
+        whitelistMerkleRoot = _root;
+        return true;
+    }
+
+    function setKycSigner(address _signer) external onlyOwner returns (bool) {
+        kycSigner = _signer;
+        emit KycSignerSet(_signer);
+        return true;
+    }
+
     function checkWhitelistedUser(address _user) public view returns (bool) {
         return whiteListedUsers[_user];
     }
+
+    function checkWhitelistedProof(address _user, bytes32[] memory _proof)
+        public
+        view
+        returns (bool)
+    {
+        bytes32 root = whitelistMerkleRoot;
+        if (root == bytes32(0)) return false;
+        return
+            MerkleProof.verify(
+                _proof,
+                root,
+                keccak256(abi.encodePacked(_user))
+            );
+    }
+
+    function checkWhitelistedVoucher(
+        address _user,
+        uint256 _maxAmount,
+        uint256 _expiry,
+        bytes memory _signature
+    ) public view returns (bool) {
+        address signer = kycSigner;
+        if (signer == address(0) || block.timestamp > _expiry) return false;
+        bytes32 digest = _hashTypedDataV4(
+            keccak256(abi.encode(VOUCHER_TYPEHASH, _user, _maxAmount, _expiry))
+        );
+        (address recovered, ECDSA.RecoverError error) = ECDSA.tryRecover(
+            digest,
+            _signature
+        );
+        return error == ECDSA.RecoverError.NoError && recovered == signer;
+    }
 }
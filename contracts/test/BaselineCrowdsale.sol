@@ -0,0 +1,119 @@
+// SPDX-License-Identifier: MIT
+
+pragma solidity ^0.8.0;
+
+import "../Token.sol";
+import "@openzeppelin/contracts/access/Ownable.sol";
+
+// Test only: the purchase path of TokenCrowdsale with its storage layout from
+// before investor balances were packed and minting was deferred to finalize,
+// so the gas test can measure both layouts side by side. Storage declarations
+// follow the old TimeCapped, WhitelistedCrowdsale and TokenCrowdsale order.
+contract BaselineCrowdsale is Ownable {
+    uint256 private _openingTime;
+    uint256 private _closingTime;
+
+    mapping(address => bool) private whiteListedUsers;
+    bytes32 public whitelistMerkleRoot;
+
+    uint256 public rate;
+    address payable public wallet;
+    Token public token;
+
+    uint256 public cap;
+    uint256 public investorMinCap;
+    uint256 public investorMaxCap;
+    mapping(address => uint256) public contributions;
+
+    mapping(address => uint256) public beneficiaryTokensOwned;
+
+    uint256 public amountRaised;
+    uint256 public goal;
+    bool public didWithdrawFunds;
+    bool public finalized;
+
+    uint256 public tokenSalePercentage = 60;
+    uint256 public foundersPercentage = 20;
+    uint256 public foundationPercentage = 15;
+    uint256 public partnersPercentage = 5;
+
+    event TokensPurchased(
+        address indexed purchaser,
+        address indexed beneficiary,
+        uint256 weiAmount,
+        uint256 tokenAmount
+    );
+
+    constructor(
+        uint256 _rate,
+        address payable _wallet,
+        address _token,
+        uint256 _cap,
+        uint256 _investorMinCap,
+        uint256 _investorMaxCap,
+        uint256 _openingTime_,
+        uint256 _closingTime_,
+        uint256 _goal
+    ) {
+        _openingTime = _openingTime_;
+        _closingTime = _closingTime_;
+        rate = _rate;
+        wallet = _wallet;
+        token = Token(_token);
+        cap = _cap;
+        investorMinCap = _investorMinCap;
+        investorMaxCap = _investorMaxCap;
+        goal = _goal;
+    }
+
+    function isOpen() public view returns (bool) {
+        return (block.timestamp >= _openingTime &&
+            block.timestamp <= _closingTime);
+    }
+
+    function addWhitelistedUser(address _user) public onlyOwner returns (bool) {
+        whiteListedUsers[_user] = true;
+        return true;
+    }
+
+    function buyToken(address _beneficiary) public payable returns (bool) {
+        require(isOpen(), "Not Open");
+        require(
+            whiteListedUsers[_beneficiary],
+            "Crowdsale: Beneficiary is not whitelisted"
+        );
+        require(msg.value != 0, "Ether amount should be more than 0");
+        require(
+            _beneficiary != address(0),
+            "Beneficiary address is the zero address"
+        );
+
+        contributions[_beneficiary] += msg.value;
+        require(
+            contributions[_beneficiary] >= investorMinCap,
+            "Ether amount is less than the minimum contribution amount"
+        );
+        require(
+            contributions[_beneficiary] <= investorMaxCap,
+            "Ether amount is more than the max contribution amount"
+        );
+
+        amountRaised += msg.value;
+        require(amountRaised <= cap, "Crowdsale cap exceeded");
+
+        uint256 tokensToIssue = msg.value * rate;
+        require(
+            token.mint(address(this), tokensToIssue),
+            "Crowdsale: Token minting failed"
+        );
+        beneficiaryTokensOwned[_beneficiary] += tokensToIssue;
+
+        emit TokensPurchased(
+            msg.sender,
+            _beneficiary,
+            msg.value,
+            tokensToIssue
+        );
+        return true;
+    }
+}
@@ -0,0 +1,124 @@
+import hashlib
+import os
+import shutil
+import sys
+import time
+
+
+ARTIFACT_CACHE_DIR = os.path.expanduser("~/.cache/crowdsale-artifacts")
+# Cache entries kept, the least recently restored ones go first
+ARTIFACT_CACHE_ENTRIES = 5
+# Everything brownie's compile output depends on
+SOURCE_DIRS = ["contracts", "interfaces"]
+SOURCE_FILES = ["brownie-config.yaml"]
+BUILD_DIRS = ["build/contracts", "build/interfaces"]
+# The dependency from brownie-config.yaml, as brownie installs it
+PACKAGES_DIR = os.path.expanduser("~/.brownie/packages")
+DEPENDENCY = "OpenZeppelin/openzeppelin-contracts@4.6.0"
+SOURCES_HASH_FILE = "build/.sources_hash"
+
+
+def get_sources_hash(project_dir="."):
+    """Hashes the path and content of every source file, so any edit, rename
+    or compiler setting change gives a new cache key."""
+    paths = [os.path.join(project_dir, name) for name in SOURCE_FILES]
+    for source_dir in SOURCE_DIRS:
+        for root, _, files in os.walk(os.path.join(project_dir, source_dir)):
+            paths += [os.path.join(root, name) for name in files]
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        if not os.path.isfile(path):
+            continue
+        digest.update(os.path.relpath(path, project_dir).encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _copy_tree(source, destination):
+    if os.path.isdir(destination):
+        shutil.rmtree(destination)
+    if os.path.isdir(source):
+        shutil.copytree(source, destination)
+
+
+def restore_artifacts(project_dir=".", cache_dir=ARTIFACT_CACHE_DIR, packages_dir=PACKAGES_DIR):
+    """Copies the build artifacts cached for the current sources into the
+    project, and the dependency into brownie's packages if it's missing, so
+    brownie finds nothing to compile or install. Returns whether the sources
+    had a cache entry."""
+    sources_hash = get_sources_hash(project_dir)
+    entry = os.path.join(cache_dir, sources_hash)
+    dependency = os.path.join(packages_dir, DEPENDENCY)
+    if not os.path.isdir(dependency) and os.path.isdir(os.path.join(cache_dir, DEPENDENCY)):
+        _copy_tree(os.path.join(cache_dir, DEPENDENCY), dependency)
+    if not os.path.isdir(entry):
+        return False
+    # Marks the entry as recently used for eviction, also when the build is
+    # already current and nothing is copied
+    os.utime(entry)
+
+    hash_file = os.path.join(project_dir, SOURCES_HASH_FILE)
+    if os.path.isfile(hash_file):
+        with open(hash_file) as f:
+            if f.read() == sources_hash:
+                return True
+    for build_dir in BUILD_DIRS:
+        _copy_tree(os.path.join(entry, build_dir), os.path.join(project_dir, build_dir))
+    with open(hash_file, "w") as f:
+        f.write(sources_hash)
+    return True
+
+
+def save_artifacts(project_dir=".", cache_dir=ARTIFACT_CACHE_DIR, packages_dir=PACKAGES_DIR):
+    """Caches the project's build artifacts under the hash of its sources,
+    run after brownie compiled them."""
+    sources_hash = get_sources_hash(project_dir)
+    entry = os.path.join(cache_dir, sources_hash)
+    staging = f"{entry}.{os.getpid()}"
+    for build_dir in BUILD_DIRS:
+        _copy_tree(os.path.join(project_dir, build_dir), os.path.join(staging, build_dir))
+    if os.path.isdir(entry):
+        shutil.rmtree(entry)
+    # Renamed into place so a concurrent restore never sees a partial entry
+    os.makedirs(cache_dir, exist_ok=True)
+    os.replace(staging, entry)
+    with open(os.path.join(project_dir, SOURCES_HASH_FILE), "w") as f:
+        f.write(sources_hash)
+
+    dependency = os.path.join(packages_dir, DEPENDENCY)
+    if os.path.isdir(dependency) and not os.path.isdir(os.path.join(cache_dir, DEPENDENCY)):
+        _copy_tree(dependency, os.path.join(cache_dir, DEPENDENCY))
+    evict_artifacts(cache_dir)
+    return entry
+
+
+def evict_artifacts(cache_dir=ARTIFACT_CACHE_DIR, max_entries=ARTIFACT_CACHE_ENTRIES):
+    entries = [
+        os.path.join(cache_dir, name)
+        for name in os.listdir(cache_dir)
+        if len(name) == 64 and os.path.isdir(os.path.join(cache_dir, name))
+    ]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for entry in entries[max_entries:]:
+        shutil.rmtree(entry)
+
+
+def main(command="restore"):
+    """Run around brownie, which compiles as soon as it loads the project:
+
+        python -m scripts.artifact_cache restore
+        brownie compile
+        python -m scripts.artifact_cache save
+    """
+    start = time.time()
+    if command == "save":
+        print(f"Cached build artifacts in {save_artifacts()}")
+    elif restore_artifacts():
+        print(f"Restored build artifacts in {time.time() - start:.2f}s")
+    else:
+        print("No cached build artifacts for the current sources")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,40 @@
+from scripts.helpful_scripts import get_account, get_deployment_block, iter_event_logs
+from brownie import TokenCrowdsale
+import time
+
+
+CLAIM_PAGE_SIZE = 200
+
+
+def get_token_holders(crowdsale, from_block=None, to_block=None):
+    # Holders are derived from TokensPurchased logs instead of on-chain storage
+    if from_block is None:
+        from_block = get_deployment_block(crowdsale)
+    holders = {}
+    for log in iter_event_logs(crowdsale, "TokensPurchased", from_block, to_block):
+        holders[log.args.beneficiary] = True
+    return list(holders)
+
+
+def claim_tokens_for(crowdsale, holders, account=None, page_size=CLAIM_PAGE_SIZE):
+    if not account:
+        account = get_account()
+
+    start = time.time()
+    for i in range(0, len(holders), page_size):
+        page = holders[i : i + page_size]
+        tx = crowdsale.claimTokensFor(page, {"from": account})
+        tx.wait(1)
+        print(f"Claimed tokens for holders {i}-{i + len(page) - 1}, {tx.gas_used} gas")
+    print(f"Distributed tokens to {len(holders)} holders in {time.time() - start:.2f}s")
+
+
+def main(crowdsale_address=None, from_block=None):
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    holders = get_token_holders(
+        crowdsale, int(from_block) if from_block is not None else None
+    )
+    claim_tokens_for(crowdsale, holders)
@@ -0,0 +1,46 @@
+from scripts.deploy_crowdsale import build_sale_config, validate_sale_config
+from scripts.helpful_scripts import get_account, get_network_context
+from brownie import CrowdsaleFactory, Token, TokenCrowdsale
+
+
+def deploy_factory(account=None):
+    if not account:
+        account = get_account()
+    return CrowdsaleFactory.deploy(
+        {"from": account},
+        publish_source=get_network_context().verify,
+    )
+
+
+def get_factory(account=None):
+    if CrowdsaleFactory:
+        return CrowdsaleFactory[-1]
+    return deploy_factory(account)
+
+
+def deploy_sales(configs, factory=None, account=None):
+    """Deploys one sale per entry of `configs`, each a dict of
+    `build_sale_config` keyword arguments, in a single transaction. Returns a
+    (crowdsale, token) pair per sale, both already owned as deploy_crowdsale
+    leaves them."""
+    if not account:
+        account = get_account()
+    if not factory:
+        factory = get_factory(account)
+
+    sale_configs = [build_sale_config(**config) for config in configs]
+    # The factory fills in the token, every other rule applies as is
+    for sale_config in sale_configs:
+        validate_sale_config(sale_config, check_token=False)
+    tx = factory.createSales(sale_configs, {"from": account})
+    tx.wait(1)
+    print(f"Deployed {len(configs)} sales for {tx.gas_used} gas")
+    return [
+        (TokenCrowdsale.at(event["crowdsale"]), Token.at(event["token"]))
+        for event in tx.events["SaleCreated"]
+    ]
+
+
+def main(count=3):
+    for crowdsale, token in deploy_sales([{}] * int(count)):
+        print(f"Crowdsale {crowdsale} selling {token}")
@@ -1,11 +1,10 @@
-from threading import local
-from scripts.helpful_scripts import (
-    FORKED_LOCAL_ENVIRONMENTS,
-    LOCAL_BLOCKCHAIN_ENVIRONEMNTS,
-    FORKED_LOCAL_ENVIRONMENTS,
-    get_account,
-)
-from brownie import Token, TokenCrowdsale, chain, network, config, accounts
+from scripts.deployment_registry import DeploymentRegistry, get_config_hash
+from scripts.helpful_scripts import get_account, get_network_context, wait_until
+from scripts.investor_report import write_investor_report
+from scripts.metrics import StepMetrics
+from scripts.tx_pipeline import TxPipeline
+from brownie import Token, TokenCrowdsale, ZERO_ADDRESS, chain, exceptions
+from collections import namedtuple
 from web3 import Web3
 import time
 
@@ -15,20 +14,73 @@ CAP_LIMIT = Web3.toWei(8, "ether")
 INVESTOR_MIN_CAP = Web3.toWei(0.05, "ether")
 INVESTOR_MAX_CAP = Web3.toWei(5, "ether")
 STARTING_TIME = 10
+SALE_DURATION = 1000
 GOAL = Web3.toWei(7, "ether")
+WITHDRAW_FUNDS_GAS_LIMIT = 100_000
+DEPLOY_METRICS_PATH = "reports/deploy_metrics.jsonl"
+DEPLOY_REPORT_PATH = "reports/deploy_investors.csv"
+# Mirrors TokenCrowdsale.MAX_RATE_TIERS
+MAX_RATE_TIERS = 4
+
+# Field order of the TokenCrowdsale.CrowdsaleConfig struct
+SaleConfig = namedtuple(
+    "SaleConfig",
+    [
+        "rate",
+        "rate_schedule",
+        "wallet",
+        "token",
+        "cap",
+        "investor_min_cap",
+        "investor_max_cap",
+        "opening_time",
+        "closing_time",
+        "goal",
+        "founders",
+        "foundation",
+        "partners",
+    ],
+)
 
 
-def deploy_token():
+def deploy_token(metrics=None):
     account = get_account()
-    token = Token.deploy(
-        {"from": account},
-        publish_source=config["networks"][network.show_active()].get("verify", False),
+    token = (metrics or StepMetrics()).deploy(
+        "Token.deploy",
+        Token,
+        tx_params={"from": account},
+        publish_source=get_network_context().verify,
     )
     return token
 
 
-def deploy_crowdsale(
+def pack_rate_schedule(rate_tiers):
+    """Packs (seconds after opening, rate) tiers into TokenCrowdsale's
+    rateSchedule, the first tier starting at opening."""
+    if len(rate_tiers) > MAX_RATE_TIERS:
+        raise ValueError(f"A sale has at most {MAX_RATE_TIERS} rate tiers")
+    schedule = 0
+    for i, (start, rate) in enumerate(rate_tiers):
+        if not (0 <= start < 2**32 and 0 < rate < 2**32):
+            raise ValueError(f"Rate tier {(start, rate)} doesn't fit in 32 bits")
+        schedule |= ((start << 32) | rate) << (64 * i)
+    return schedule
+
+
+def unpack_rate_schedule(schedule):
+    rate_tiers = []
+    for i in range(MAX_RATE_TIERS):
+        tier = schedule >> (64 * i)
+        rate = tier & (2**32 - 1)
+        if not rate:
+            break
+        rate_tiers.append(((tier >> 32) & (2**32 - 1), rate))
+    return rate_tiers
+
+
+def build_sale_config(
     rate=RATE,
+    rate_tiers=None,
     wallet=None,
     token=None,
     cap_limit=CAP_LIMIT,
@@ -40,55 +92,37 @@ def deploy_crowdsale(
     foundersAddress=None,
     foundationAddress=None,
     partnersAddress=None,
-    account=None,
+    opening_delay=STARTING_TIME,
+    duration=SALE_DURATION,
 ):
+    """Returns the TokenCrowdsale.CrowdsaleConfig struct as a SaleConfig, filling in
+    local accounts for anything left out and, without explicit times, a sale
+    opening `opening_delay` seconds from now for `duration` seconds. With
+    `rate_tiers` the rate follows that schedule instead of the flat `rate`."""
+    context = get_network_context()
 
     if not wallet:
-        if (
-            network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS
-            or network.show_active() in FORKED_LOCAL_ENVIRONMENTS
-        ):
+        if context.is_development:
             wallet = get_account(index=1)
-    if not token:
-        if (
-            network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS
-            or network.show_active() in FORKED_LOCAL_ENVIRONMENTS
-        ):
-            token = deploy_token()
-        else:
-            if Token:
-                token = Token[-1]
-            else:
-                token = deploy_token()
     if not opening_time:
-        opening_time = chain.time() + STARTING_TIME
+        opening_time = chain.time() + opening_delay
     if not closing_time:
-        closing_time = opening_time + 1000
+        closing_time = opening_time + duration
     if not foundersAddress:
-        if (
-            network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS
-            or network.show_active() in FORKED_LOCAL_ENVIRONMENTS
-        ):
+        if context.is_development:
             foundersAddress = get_account(index=7)
     if not foundationAddress:
-        if (
-            network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS
-            or network.show_active() in FORKED_LOCAL_ENVIRONMENTS
-        ):
+        if context.is_development:
             foundationAddress = get_account(index=8)
     if not partnersAddress:
-        if (
-            network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS
-            or network.show_active() in FORKED_LOCAL_ENVIRONMENTS
-        ):
+        if context.is_development:
             partnersAddress = get_account(index=9)
-    if not account:
-        account = get_account()
 
-    crowdsale = TokenCrowdsale.deploy(
+    return SaleConfig(
         rate,
+        pack_rate_schedule(rate_tiers) if rate_tiers else 0,
         wallet,
-        token.address,
+        token or ZERO_ADDRESS,
         cap_limit,
         investor_min_cap,
         investor_max_cap,
@@ -98,31 +132,240 @@ def deploy_crowdsale(
         foundersAddress,
         foundationAddress,
         partnersAddress,
-        {"from": account},
-        publish_source=config["networks"][network.show_active()].get("verify", False),
     )
 
-    tx = token.transferOwnership(crowdsale, {"from": account})
-    tx.wait(1)
+
+def _is_zero_address(address):
+    return not address or str(address) == ZERO_ADDRESS
+
+
+def _uint32(value):
+    return value & (2**32 - 1)
+
+
+def _check_rate_schedule(schedule):
+    if _uint32(schedule >> 32):
+        return "Crowdsale: First rate tier should start at opening"
+    if not _uint32(schedule):
+        return "Crowdsale rate is 0"
+    previous_start, ended = 0, False
+    for i in range(1, MAX_RATE_TIERS):
+        tier = schedule >> (64 * i)
+        if not _uint32(tier):
+            ended = True
+        elif ended or _uint32(tier >> 32) <= previous_start:
+            return "Crowdsale: Rate tiers should start in increasing order"
+        else:
+            previous_start = _uint32(tier >> 32)
+    return None
+
+
+def validate_sale_config(config, now=None, check_token=True):
+    """Applies the TokenCrowdsale and TimeCapped constructor requires to a
+    SaleConfig and raises ValueError with the revert message of every rule it
+    breaks, before anything is broadcast."""
+    if now is None:
+        now = chain.time()
+    rules = [
+        (
+            config.opening_time >= now,
+            "Opening Time cannot be before the current time",
+        ),
+        (
+            config.closing_time > config.opening_time,
+            "Opening Time should be before closing time",
+        ),
+        (config.closing_time < 2**64, "SafeCast: value doesn't fit in 64 bits"),
+        (not _is_zero_address(config.wallet), "Wallet is the zero address"),
+        (
+            not check_token or not _is_zero_address(config.token),
+            "Token is the zero address",
+        ),
+        (config.cap > 0, "Cap limit is zero"),
+        (config.cap < 2**128, "Cap limit is too large"),
+        (
+            config.investor_min_cap < config.investor_max_cap,
+            "Investor minimum cap should be less than the max cap",
+        ),
+        (
+            0 < config.investor_max_cap < config.cap,
+            "Investor max cap should be less than the max cap of crowdsale and shouldn't be zero",
+        ),
+        (config.goal > 0, "Goal should be greater than zero"),
+        (
+            config.goal <= config.cap,
+            "Goal should be less than/equal to the crowdsale cap",
+        ),
+        (
+            not _is_zero_address(config.founders),
+            "Crowdsale: Founders address cannot be address 0",
+        ),
+        (
+            not _is_zero_address(config.foundation),
+            "Crowdsale: Foundation address cannot be address 0",
+        ),
+        (
+            not _is_zero_address(config.partners),
+            "Crowdsale: Partners address cannot be address 0",
+        ),
+    ]
+    errors = [message for passed, message in rules if not passed]
+    if config.rate_schedule:
+        schedule_error = _check_rate_schedule(config.rate_schedule)
+        if schedule_error:
+            errors.append(schedule_error)
+    elif config.rate <= 0:
+        errors.append("Crowdsale rate is 0")
+    elif config.rate >= 2**32:
+        errors.append("SafeCast: value doesn't fit in 32 bits")
+    if errors:
+        raise ValueError(f"Invalid crowdsale config: {'; '.join(errors)}")
+
+
+def estimate_crowdsale_deploy(config, account):
+    """Dry runs the constructor with eth_estimateGas, catching whatever the
+    Python rules don't cover, and returns the gas the deployment needs."""
+    try:
+        return TokenCrowdsale.deploy.estimate_gas(config, {"from": account})
+    except (ValueError, exceptions.VirtualMachineError) as e:
+        raise ValueError(f"TokenCrowdsale deployment would revert: {e}") from e
+
+
+def deploy_crowdsale(
+    token=None,
+    account=None,
+    metrics=None,
+    preflight=True,
+    registry=None,
+    **sale_config
+):
+    """Deploys a TokenCrowdsale selling `token` (a fresh one by default). With
+    `preflight` the config is validated before the token is deployed and the
+    constructor dry run before the sale is, so a bad config costs nothing.
+
+    A sale already in the DeploymentRegistry with the same config is returned
+    as is while it hasn't closed. The registry is used on live networks by
+    default, local chains are reset between runs so they need one passed
+    explicitly, and `registry=False` always deploys."""
+    context = get_network_context()
+    metrics = metrics or StepMetrics()
+    config = build_sale_config(**sale_config)
+    if registry is None and not context.is_development:
+        registry = DeploymentRegistry()
+    if registry:
+        # Times left to build_sale_config depend on when this runs, they are
+        # hashed as the delays they are derived from instead
+        config_hash = get_config_hash(
+            config,
+            times=(
+                sale_config.get("opening_time")
+                or f"+{sale_config.get('opening_delay', STARTING_TIME)}",
+                sale_config.get("closing_time")
+                or f"+{sale_config.get('duration', SALE_DURATION)}",
+            ),
+        )
+        deployment = registry.get(config_hash)
+        if (
+            deployment
+            and not deployment[0].isClosed()
+            and (not token or deployment[1].address == token.address)
+        ):
+            print(f"Reusing crowdsale {deployment[0]} deployed with the same config")
+            return deployment[0]
+    if preflight:
+        validate_sale_config(config, check_token=False)
+    if not account:
+        account = get_account()
+
+    if not token:
+        # A previous token is only reused while it hasn't been handed over to
+        # a crowdsale
+        if not context.is_development and Token and Token[-1].owner() == account:
+            token = Token[-1]
+        else:
+            token = deploy_token(metrics)
+
+    config = config._replace(token=token.address)
+    tx_params = {"from": account}
+    if preflight:
+        validate_sale_config(config)
+        # The estimate doubles as the gas limit, saving brownie a second one
+        tx_params["gas_limit"] = estimate_crowdsale_deploy(config, account)
+
+    crowdsale = metrics.deploy(
+        "TokenCrowdsale.deploy",
+        TokenCrowdsale,
+        config,
+        tx_params=tx_params,
+        publish_source=context.verify,
+    )
+
+    metrics.transact(
+        "transferOwnership",
+        token.transferOwnership,
+        crowdsale,
+        tx_params={"from": account},
+    )
     print("Token ownership transferred")
 
+    if registry:
+        registry.record(config_hash, crowdsale, token)
     return crowdsale
 
 
 def open_crowdsale():
-    if network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
+    if get_network_context().is_local:
         chain.sleep(STARTING_TIME)
         chain.mine()
 
 
-def main():
+def wait_for_opening(crowdsale):
+    wait_until(crowdsale.openingTime())
+
+
+def wait_for_closing(crowdsale):
+    # isClosed() only holds strictly after the closing time
+    wait_until(crowdsale.closingTime() + 1)
+
+
+def buy_planned_tokens(crowdsale, purchases, metrics):
+    """Sends each (purchaser, beneficiary, amount) purchase in order, skipping
+    the ones a beneficiary's contribution already covers. A re-run that gets
+    a registered sale back from deploy_crowdsale resumes where the previous
+    run stopped instead of going over the investor max cap."""
+    token = Token.at(crowdsale.token())
+    bought = {}
+    for purchaser, beneficiary, amount in purchases:
+        if beneficiary not in bought:
+            bought[beneficiary] = crowdsale.contributions(beneficiary)
+        if bought[beneficiary] >= amount:
+            bought[beneficiary] -= amount
+            print(f"{beneficiary} already bought {amount} wei of tokens, skipping")
+            continue
+        bought[beneficiary] = 0
+
+        metrics.transact(
+            "buyToken",
+            crowdsale.buyToken,
+            beneficiary,
+            tx_params={"from": purchaser, "value": amount},
+        )
+        token_received = crowdsale.calculateTokens(amount)
+        print(
+            f"{purchaser} deposited {amount} wei on behalf of {beneficiary}. \n{beneficiary} received {token_received} {token.symbol()}\n"
+        )
+
+
+def main(metrics_path=DEPLOY_METRICS_PATH, report_path=DEPLOY_REPORT_PATH):
+    context = get_network_context()
+    metrics = StepMetrics()
     account_1 = get_account()
-    if network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
+    if context.is_local:
         account_2 = get_account(index=1)
         account_3 = get_account(index=2)
     else:
-        account_2 = accounts.add(config["wallets"]["from_key_2"])
-        account_3 = accounts.add(config["wallets"]["from_key_3"])
+        account_2 = context.get_wallet_account("from_key_2")
+        account_3 = context.get_wallet_account("from_key_3")
 
     owner = account_1
     wallet = account_2
@@ -132,93 +375,79 @@ def main():
     cap_limit = Web3.toWei(10, "ether")
     investor_min_cap = Web3.toWei(0.001, "ether")
     investor_max_cap = Web3.toWei(0.1, "ether")
-    opening_time = chain.time() + 120
-    closing_time = opening_time + 120
     goal = investor_max_cap * 2
 
-    token = deploy_token()
-
+    # The token is deployed by deploy_crowdsale, and only when the registry
+    # has no open sale with this config
     crowdsale = deploy_crowdsale(
         rate=50,
         wallet=wallet,
-        token=token,
         cap_limit=cap_limit,
         investor_min_cap=investor_min_cap,
         investor_max_cap=investor_max_cap,
-        opening_time=opening_time,
-        closing_time=closing_time,
+        opening_delay=120,
+        duration=120,
         goal=goal,
         foundersAddress=account_1,
         foundationAddress=account_2,
         partnersAddress=account_3,
         account=owner,
+        metrics=metrics,
     )
+    token = Token.at(crowdsale.token())
+    # Whitelisting doesn't depend on the sale being open, so it is broadcast
+    # up front and confirmed while waiting for the opening time
+    pipeline = TxPipeline(owner, metrics=metrics)
+    pipeline.send(crowdsale.addWhitelistedUser, beneficiary_1)
+    pipeline.send(crowdsale.addWhitelistedUser, beneficiary_2)
+
     print("Waiting for crowdsale to open..............")
-    while not crowdsale.isOpen():
-        if network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-            chain.mine()
-        else:
-            pass
+    wait_for_opening(crowdsale)
     print("Crowdsale Opened...........................")
 
-    crowdsale.addWhitelistedUser(beneficiary_1, {"from": owner})
+    pipeline.wait()
     print(f"{beneficiary_1} has been whitelisted")
-    crowdsale.addWhitelistedUser(beneficiary_2, {"from": owner})
     print(f"{beneficiary_2} has been whitelisted\n")
 
     amount = Web3.toWei(0.1, "ether")
-
-    crowdsale.buyToken(beneficiary_1, {"from": owner, "value": amount})
-    token_received = crowdsale.calculateTokens(amount)
-    print(
-        f"{wallet} deposited {amount} ETH on behalf of {beneficiary_1}. \n{beneficiary_1} received {token_received} {token.symbol()}\n"
-    )
-
-    crowdsale.buyToken(beneficiary_2, {"from": beneficiary_2, "value": amount / 2})
-    token_received = crowdsale.calculateTokens(amount / 2)
-    print(
-        f"{beneficiary_2} deposited {amount/2} ETH on behalf of {account_3}. \n{beneficiary_2} received {token_received} {token.symbol()}\n"
-    )
-
-    crowdsale.buyToken(beneficiary_2, {"from": beneficiary_2, "value": amount / 2})
-    token_received = crowdsale.calculateTokens(amount / 2)
-    print(
-        f"{beneficiary_2} deposited {amount/2} ETH on behalf of {account_3}. \n{beneficiary_2} received {token_received} {token.symbol()}\n"
-    )
-
-    print(
-        f"Token balances before finalizing crowdsale:\nFounders: {token.balanceOf(account_1)}, Foundation: {token.balanceOf(account_2)}, Partners: {{token.balanceOf(account_3)}}\n"
+    buy_planned_tokens(
+        crowdsale,
+        [
+            (owner, beneficiary_1, amount),
+            (beneficiary_2, beneficiary_2, amount // 2),
+            (beneficiary_2, beneficiary_2, amount // 2),
+        ],
+        metrics,
     )
 
     print("Waiting for crowdsale to close..............")
-    while crowdsale.isOpen():
-        if network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-            chain.mine()
-        else:
-            pass
+    wait_for_closing(crowdsale)
     print("Crowdsale Closed............................\n")
 
-    tx = crowdsale.finalize({"from": owner})
-    tx.wait(1)
-    print("Crowdsale finalized...!!!!!\n")
+    goal_reached = crowdsale.goalReached()
+    if goal_reached:
+        print(f"Wallet Balance before withdrawal: {wallet.balance()} ETH")
 
-    print(
-        f"Token balances after finalizing crowdsale:\nFounders: {token.balanceOf(account_1)}, Foundation: {token.balanceOf(account_2)}, Partners: {token.balanceOf(account_3)}\n"
-    )
+    # withdrawFunds is ordered after finalize by its nonce, its gas is set
+    # explicitly because estimating it before finalize is mined would revert
+    pipeline.send(crowdsale.finalize)
+    if goal_reached:
+        pipeline.send(crowdsale.withdrawFunds, gas_limit=WITHDRAW_FUNDS_GAS_LIMIT)
+    pipeline.wait()
+    print("Crowdsale finalized...!!!!!\n")
 
-    if crowdsale.goalReached():
-        print(f"Wallet Balance before withdrawal: {wallet.balance()} ETH")
-        tx = crowdsale.withdrawFunds({"from": owner})
-        tx.wait(1)
+    if goal_reached:
         print(f"Wallet Balance after withdrawal: {wallet.balance()} ETH\n")
 
         print(
             f"Beneficiary token balances before claiming tokens \nBenefeciary 1: {token.balanceOf(beneficiary_1)} \nBenefeciary 2: {token.balanceOf(beneficiary_2)}"
         )
-        tx = crowdsale.claimTokens({"from": beneficiary_1})
-        tx.wait(1)
-        tx = crowdsale.claimTokens({"from": beneficiary_2})
-        tx.wait(1)
+        metrics.transact(
+            "claimTokens", crowdsale.claimTokens, tx_params={"from": beneficiary_1}
+        )
+        metrics.transact(
+            "claimTokens", crowdsale.claimTokens, tx_params={"from": beneficiary_2}
+        )
         print(
             f"Beneficiary token balances after claiming tokens \nBenefeciary 1: {token.balanceOf(beneficiary_1)} \nBenefeciary 2: {token.balanceOf(beneficiary_2)}"
         )
@@ -227,12 +456,17 @@ def main():
         print(
             f"Beneficiary token balances before refund \nBenefeciary 1: {beneficiary_1.balance()} \nBenefeciary 2: {beneficiary_2.balance()}"
         )
-        tx = crowdsale.claimRefund({"from": beneficiary_1})
-        tx.wait(1)
-        tx = crowdsale.claimRefund({"from": beneficiary_2})
-        tx.wait(1)
+        metrics.transact(
+            "claimRefund", crowdsale.claimRefund, tx_params={"from": beneficiary_1}
+        )
+        metrics.transact(
+            "claimRefund", crowdsale.claimRefund, tx_params={"from": beneficiary_2}
+        )
         print(
             f"Beneficiary token balances after refund \nBenefeciary 1: {beneficiary_1.balance()} \nBenefeciary 2: {beneficiary_2.balance()}"
         )
 
+    metrics.write(metrics_path)
+    print(f"Step metrics written to {metrics_path}")
+    write_investor_report(crowdsale, report_path)
     time.sleep(1)
@@ -0,0 +1,68 @@
+from brownie import Token, TokenCrowdsale, chain, web3
+import hashlib
+import json
+import os
+
+
+DEPLOYMENT_REGISTRY_PATH = "deployments/registry.json"
+
+
+def get_config_hash(config, times=None):
+    """Hashes a SaleConfig, minus the token it is paired with at deploy time,
+    together with the TokenCrowdsale bytecode so a contract change never
+    reuses an older deployment. `times` replaces the opening and closing
+    times in the hash, for configs whose times are relative to the current
+    time."""
+    if times:
+        config = config._replace(opening_time=times[0], closing_time=times[1])
+    fields = {
+        name: str(value).lower()
+        for name, value in config._asdict().items()
+        if name != "token"
+    }
+    fields["bytecode"] = hashlib.sha256(TokenCrowdsale.bytecode.encode()).hexdigest()
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+class DeploymentRegistry:
+    """Crowdsale and token addresses deployed per chain id and config hash, so
+    a script that is re-run with the same config picks up its sale instead of
+    deploying another one."""
+
+    def __init__(self, path=DEPLOYMENT_REGISTRY_PATH):
+        self.path = path
+        self.deployments = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.deployments = json.load(f)
+
+    def get(self, config_hash):
+        """Returns the registered (crowdsale, token) pair, or None if there is
+        none or its code is gone (a reset chain)."""
+        entry = self.deployments.get(str(chain.id), {}).get(config_hash)
+        if not entry:
+            return None
+        if not (web3.eth.get_code(entry["crowdsale"]) and web3.eth.get_code(entry["token"])):
+            return None
+        return TokenCrowdsale.at(entry["crowdsale"]), Token.at(entry["token"])
+
+    def get_block(self, address):
+        """Returns the block a registered crowdsale was deployed in, or None."""
+        for entry in self.deployments.get(str(chain.id), {}).values():
+            if entry["crowdsale"] == str(address):
+                return entry["block"]
+        return None
+
+    def record(self, config_hash, crowdsale, token):
+        self.deployments.setdefault(str(chain.id), {})[config_hash] = {
+            "crowdsale": crowdsale.address,
+            "token": token.address,
+            "block": crowdsale.tx.block_number if crowdsale.tx else None,
+        }
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Written to a temporary file first so an interrupted run can't leave
+        # a truncated registry behind
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(self.deployments, f, indent=2, sort_keys=True)
+        os.replace(f"{self.path}.tmp", self.path)
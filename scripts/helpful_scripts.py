@@ -1,20 +1,118 @@
-from brownie import accounts, config, network
+from scripts.deployment_registry import DeploymentRegistry
+from brownie import accounts, chain, config, network, web3
+import os
+import time
 
-FORKED_LOCAL_ENVIRONMENTS = ["mainnet-fork"]
+# mainnet-fork-cached forks through scripts/rpc_cache.py, see the README
+FORKED_LOCAL_ENVIRONMENTS = ["mainnet-fork", "mainnet-fork-cached"]
 LOCAL_BLOCKCHAIN_ENVIRONEMNTS = ["development", "ganache-local"]
+# Local networks brownie launches itself, so each xdist worker can get its own
+# chain (brownie offsets the port by the worker index). ganache-local is a single
+# externally launched instance and can't be shared between workers.
+PARALLEL_LOCAL_ENVIRONMENTS = ["development"]
+
+
+def get_worker_id():
+    # "gw0", "gw1", ... on pytest-xdist workers, None otherwise
+    return os.environ.get("PYTEST_XDIST_WORKER")
+
+
+class NetworkContext:
+    """Resolves what kind of network is active, its verify setting and its
+    accounts once, instead of on every deploy or get_account call."""
+
+    def __init__(self, name):
+        self.name = name
+        self.is_local = name in LOCAL_BLOCKCHAIN_ENVIRONEMNTS
+        self.is_forked = name in FORKED_LOCAL_ENVIRONMENTS
+        # Local and forked chains come with unlocked, funded accounts
+        self.is_development = self.is_local or self.is_forked
+        self.can_run_parallel = name in PARALLEL_LOCAL_ENVIRONMENTS
+        self.verify = config["networks"].get(name, {}).get("verify", False)
+        self._accounts = {}
+
+    def get_account(self, index=None, id=None):
+        if index is not None:
+            return accounts[index]
+        if id:
+            # accounts.load decrypts the keystore, which prompts for a password
+            return self._cached(("id", id), lambda: accounts.load(id))
+        if self.is_development:
+            return accounts[0]
+        return self.get_wallet_account("from_key_1")
+
+    def get_wallet_account(self, key):
+        return self._cached(("wallet", key), lambda: accounts.add(config["wallets"][key]))
+
+    def _cached(self, key, load):
+        account = self._accounts.get(key)
+        # brownie drops added accounts when it disconnects from a network
+        if account is None or account not in accounts:
+            account = self._accounts[key] = load()
+        return account
+
+
+_network_contexts = {}
+
+
+def get_network_context():
+    name = network.show_active()
+    if name not in _network_contexts:
+        _network_contexts[name] = NetworkContext(name)
+    return _network_contexts[name]
 
 
 def get_account(index=None, id=None):
-    if index is not None:
-        return accounts[index]
+    return get_network_context().get_account(index=index, id=id)
+
+
+def iter_event_logs(contract, event_name, from_block=0, to_block=None, chunk_size=5000):
+    # Node providers cap the block range of a single eth_getLogs request, so
+    # logs are fetched in fixed-size block windows
+    if to_block is None:
+        to_block = web3.eth.block_number
+    for start in range(from_block, to_block + 1, chunk_size):
+        end = min(start + chunk_size - 1, to_block)
+        for log in contract.events.get_sequence(start, end, event_type=event_name):
+            yield log
+
+
+def get_deployment_block(contract, registry=None):
+    """Returns the block `contract` was deployed in, from its deployment
+    transaction or the deployment registry. Contracts loaded by address have
+    no transaction, scanning them from genesis is only acceptable on local
+    chains."""
+    if getattr(contract, "tx", None) is not None:
+        return contract.tx.block_number
+    block = (registry or DeploymentRegistry()).get_block(contract.address)
+    if block is not None:
+        return block
+    if get_network_context().is_local:
+        return 0
+    raise ValueError(
+        f"Deployment block of {contract.address} is unknown, pass from_block"
+    )
 
-    if id:
-        return accounts.load(id)
 
-    if (
-        network.show_active() in LOCAL_BLOCKCHAIN_ENVIRONEMNTS
-        or network.show_active() in FORKED_LOCAL_ENVIRONMENTS
-    ):
-        return accounts[0]
+def wait_until(timestamp, poll_interval=1, max_poll_interval=60, margin=15):
+    # Local chains jump straight to the target time instead of mining block by block
+    if get_network_context().is_development:
+        remaining = timestamp - chain.time()
+        if remaining > 0:
+            chain.sleep(remaining)
+        chain.mine()
+        return
 
-    return accounts.add(config["wallets"]["from_key_1"])
+    # Live networks sleep through the bulk of the wait at once, stopping
+    # `margin` seconds early, then back off while polling for the first block
+    # past the target time
+    remaining = timestamp - web3.eth.get_block("latest").timestamp
+    if remaining > margin:
+        time.sleep(remaining - margin)
+    delay = poll_interval
+    while True:
+        remaining = timestamp - web3.eth.get_block("latest").timestamp
+        if remaining <= 0:
+            return
+        time.sleep(min(delay, max_poll_interval))
+        delay = min(delay * 2, max_poll_interval)
@@ -0,0 +1,179 @@
+from scripts.helpful_scripts import get_deployment_block, iter_event_logs
+from brownie import TokenCrowdsale, web3
+import sqlite3
+
+
+LEDGER_EVENTS = ["TokensPurchased", "RefundClaimed", "TokensClaimed", "FundsWithdrawn"]
+LEDGER_FIELDS = ["contributed", "tokens", "refunded", "claimed"]
+
+
+def encode_amount(value):
+    # Wei amounts overflow SQLite integers, fixed-width hex keeps them exact
+    # and still sorts correctly with ORDER BY
+    return f"{value:064x}"
+
+
+def decode_amount(value):
+    return int(value, 16)
+
+
+class InvestorLedger:
+    """Local per-beneficiary ledger built from crowdsale logs. `sync()` resumes
+    from the last indexed block; queries never touch the node."""
+
+    def __init__(self, path, crowdsale, from_block=None):
+        self.crowdsale = crowdsale
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS ledger (
+                beneficiary TEXT PRIMARY KEY,
+                contributed TEXT NOT NULL,
+                tokens TEXT NOT NULL,
+                refunded TEXT NOT NULL,
+                claimed TEXT NOT NULL,
+                purchases INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS withdrawals (
+                wallet TEXT NOT NULL,
+                amount TEXT NOT NULL,
+                block INTEGER NOT NULL
+            );
+            """
+        )
+        indexed = self._get_meta("crowdsale")
+        if indexed is None:
+            self._set_meta("crowdsale", crowdsale.address)
+            if from_block is None:
+                from_block = get_deployment_block(crowdsale)
+            self._set_meta("last_block", int(from_block) - 1)
+            self.db.commit()
+        elif indexed != crowdsale.address:
+            raise ValueError(f"{path} indexes crowdsale {indexed}, not {crowdsale.address}")
+
+    @property
+    def last_block(self):
+        return int(self._get_meta("last_block"))
+
+    def sync(self, to_block=None, chunk_size=5000, confirmations=0):
+        """Indexes logs up to `to_block` (default: latest minus `confirmations`)
+        one block range at a time, committing after each range so an
+        interrupted sync resumes where it stopped."""
+        if to_block is None:
+            to_block = web3.eth.block_number - confirmations
+        start = self.last_block + 1
+        while start <= to_block:
+            end = min(start + chunk_size - 1, to_block)
+            logs = [
+                log
+                for event in LEDGER_EVENTS
+                for log in iter_event_logs(self.crowdsale, event, start, end, chunk_size)
+            ]
+            logs.sort(key=lambda log: (log.blockNumber, log.logIndex))
+            with self.db:
+                self._apply(logs)
+                self._set_meta("last_block", end)
+            start = end + 1
+        return self.last_block
+
+    def get_investor(self, beneficiary):
+        row = self.db.execute(
+            "SELECT * FROM ledger WHERE beneficiary = ?", (beneficiary,)
+        ).fetchone()
+        return self._decode_row(row) if row else None
+
+    def investors(self, order_by="beneficiary", descending=False):
+        """Streams every indexed investor without loading the ledger in memory."""
+        if order_by not in ["beneficiary"] + LEDGER_FIELDS:
+            raise ValueError(f"Cannot order investors by {order_by}")
+        direction = "DESC" if descending else "ASC"
+        cursor = self.db.execute(f"SELECT * FROM ledger ORDER BY {order_by} {direction}")
+        for row in cursor:
+            yield self._decode_row(row)
+
+    def top_investors(self, count=10):
+        investors = self.investors(order_by="contributed", descending=True)
+        return [investor for _, investor in zip(range(count), investors)]
+
+    def totals(self):
+        totals = dict.fromkeys(LEDGER_FIELDS, 0)
+        totals["investors"] = 0
+        for investor in self.investors():
+            totals["investors"] += 1
+            for field in LEDGER_FIELDS:
+                totals[field] += investor[field]
+        totals["withdrawn"] = sum(
+            decode_amount(amount)
+            for (amount,) in self.db.execute("SELECT amount FROM withdrawals")
+        )
+        return totals
+
+    def _apply(self, logs):
+        deltas = {}
+        for log in logs:
+            if log.event == "FundsWithdrawn":
+                self.db.execute(
+                    "INSERT INTO withdrawals VALUES (?, ?, ?)",
+                    (log.args.wallet, encode_amount(log.args.amount), log.blockNumber),
+                )
+                continue
+            if log.event == "TokensPurchased":
+                delta = self._delta(deltas, log.args.beneficiary)
+                delta["contributed"] += log.args.weiAmount
+                delta["tokens"] += log.args.tokenAmount
+                delta["purchases"] += 1
+            elif log.event == "RefundClaimed":
+                self._delta(deltas, log.args.refundee)["refunded"] += log.args.amount
+            elif log.event == "TokensClaimed":
+                self._delta(deltas, log.args.beneficiary)["claimed"] += log.args.amount
+
+        for beneficiary, delta in deltas.items():
+            investor = self.get_investor(beneficiary)
+            if investor:
+                for field in LEDGER_FIELDS + ["purchases"]:
+                    delta[field] += investor[field]
+            self.db.execute(
+                "INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    beneficiary,
+                    *[encode_amount(delta[field]) for field in LEDGER_FIELDS],
+                    delta["purchases"],
+                ),
+            )
+
+    def _delta(self, deltas, beneficiary):
+        if beneficiary not in deltas:
+            deltas[beneficiary] = dict.fromkeys(LEDGER_FIELDS + ["purchases"], 0)
+        return deltas[beneficiary]
+
+    def _decode_row(self, row):
+        beneficiary, *amounts, purchases = row
+        investor = {"beneficiary": beneficiary, "purchases": purchases}
+        investor.update(zip(LEDGER_FIELDS, map(decode_amount, amounts)))
+        return investor
+
+    def _get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, str(value)))
+
+
+def main(db_path="ledger.db", crowdsale_address=None, from_block=None):
+    """`from_block` is only needed for the first sync of a crowdsale that is
+    neither in the deployment registry nor deployed by this brownie project."""
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    ledger = InvestorLedger(db_path, crowdsale, from_block)
+    last_block = ledger.sync()
+    totals = ledger.totals()
+    print(f"Indexed {crowdsale} up to block {last_block}")
+    print(
+        f"{totals['investors']} investors contributed {totals['contributed']} wei "
+        f"for {totals['tokens']} tokens, {totals['refunded']} wei refunded, "
+        f"{totals['claimed']} tokens claimed, {totals['withdrawn']} wei withdrawn"
+    )
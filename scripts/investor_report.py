@@ -0,0 +1,129 @@
+from scripts.indexer import InvestorLedger
+from scripts.state_reader import read_snapshot
+from brownie import TokenCrowdsale, web3
+from decimal import Decimal
+from itertools import islice
+import csv
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# Investors read per snapshot and rows per Parquet row group, the report only
+# ever holds one batch in memory
+REPORT_BATCH_SIZE = 10_000
+REPORT_PATH = "reports/investors.csv"
+REPORT_FIELDS = [
+    "beneficiary",
+    "purchases",
+    "contributed",
+    "tokens_bought",
+    "tokens_owed",
+    "tokens_claimed",
+    "refunded",
+    "contribution_held",
+]
+# Wei and token amounts overflow int64, Parquet keeps them as 38 digit decimals
+AMOUNT_FIELDS = REPORT_FIELDS[2:]
+
+
+def iter_report_rows(ledger, crowdsale, block=None, batch_size=REPORT_BATCH_SIZE):
+    """Yields a report row per investor of `ledger`, the totals indexed from
+    logs next to what the crowdsale still owes them, read in batches with
+    every batch pinned to the same block."""
+    if block is None:
+        block = web3.eth.block_number
+    investors = ledger.investors()
+    while True:
+        batch = list(islice(investors, batch_size))
+        if not batch:
+            return
+        state = read_snapshot(
+            crowdsale,
+            investors=[investor["beneficiary"] for investor in batch],
+            block=block,
+        )
+        for investor in batch:
+            balances = state["investors"][investor["beneficiary"]]
+            yield {
+                "beneficiary": investor["beneficiary"],
+                "purchases": investor["purchases"],
+                "contributed": investor["contributed"],
+                "tokens_bought": investor["tokens"],
+                "tokens_owed": balances["tokensOwned"],
+                "tokens_claimed": investor["claimed"],
+                "refunded": investor["refunded"],
+                "contribution_held": balances["contribution"],
+            }
+
+
+def write_csv(rows, path):
+    count = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_parquet(rows, path, batch_size=REPORT_BATCH_SIZE):
+    if pa is None:
+        raise ImportError("Parquet reports need pyarrow (pip install pyarrow)")
+    schema = pa.schema(
+        [
+            ("beneficiary", pa.string()),
+            ("purchases", pa.int64()),
+            *[(field, pa.decimal128(38, 0)) for field in AMOUNT_FIELDS],
+        ]
+    )
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            columns = {field: [row[field] for row in batch] for field in REPORT_FIELDS}
+            for field in AMOUNT_FIELDS:
+                columns[field] = [Decimal(value) for value in columns[field]]
+            writer.write_table(pa.table(columns, schema=schema))
+            count += len(batch)
+    return count
+
+
+def write_report(rows, path):
+    """Writes Parquet for `.parquet` paths and CSV otherwise, streaming `rows`
+    and returning how many were written."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.endswith(".parquet"):
+        return write_parquet(iter(rows), path)
+    return write_csv(rows, path)
+
+
+def write_investor_report(crowdsale, path=REPORT_PATH, ledger_path=None, from_block=None):
+    """Indexes the crowdsale's logs into a ledger (one per crowdsale under
+    reports/ by default), starting at `from_block` on the first run, and
+    writes its investor report to `path`."""
+    if not ledger_path:
+        ledger_path = os.path.join("reports", f"ledger_{crowdsale.address}.db")
+    if os.path.dirname(ledger_path):
+        os.makedirs(os.path.dirname(ledger_path), exist_ok=True)
+    ledger = InvestorLedger(ledger_path, crowdsale, from_block)
+    block = ledger.sync()
+    count = write_report(iter_report_rows(ledger, crowdsale, block), path)
+    print(f"Wrote {count} investors of {crowdsale} at block {block} to {path}")
+    return count
+
+
+def main(path=REPORT_PATH, crowdsale_address=None, ledger_path=None, from_block=None):
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    write_investor_report(crowdsale, path, ledger_path, from_block)
@@ -0,0 +1,172 @@
+from scripts.deploy_crowdsale import deploy_crowdsale, wait_for_opening
+from scripts.helpful_scripts import get_account, get_network_context
+from scripts.whitelist_users import whitelist_users
+from brownie import accounts, chain, exceptions, web3
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from web3 import Web3
+import math
+import random
+import threading
+import time
+
+
+INVESTOR_MIN_CAP = Web3.toWei(0.01, "ether")
+INVESTOR_MAX_CAP = Web3.toWei(1, "ether")
+# Fixed gas limit so purchases are broadcast without a gas estimation round trip
+BUY_TOKEN_GAS_LIMIT = 150_000
+# Automining puts every purchase in its own block, so the run mines blocks
+# itself this often and purchases queue up in between like on a live chain
+BLOCK_INTERVAL = 1
+
+
+def sample_contributions(count, distribution, min_cap, max_cap, seed=None):
+    rng = random.Random(seed)
+    if distribution == "min":
+        return [min_cap] * count
+    if distribution == "max":
+        return [max_cap] * count
+    if distribution == "uniform":
+        return [rng.randint(min_cap, max_cap) for _ in range(count)]
+    if distribution == "lognormal":
+        # Most investors close to the minimum with a long tail towards the max cap
+        median = math.log(min_cap * 4)
+        return [
+            min(max(int(rng.lognormvariate(median, 1)), min_cap), max_cap)
+            for _ in range(count)
+        ]
+    raise ValueError(f"Unknown contribution distribution: {distribution}")
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def fund_investors(count, amounts):
+    """Funds a fresh account per amount with the amount plus some gas money,
+    spread over the local funded accounts."""
+    funders = [get_account(index=i) for i in range(1, 10)]
+    investors = []
+    for i in range(count):
+        investor = accounts.add()
+        # Leave headroom for gas on top of the contribution
+        funders[i % len(funders)].transfer(
+            investor, amounts[i] + Web3.toWei(0.01, "ether"), silent=True
+        )
+        investors.append(investor)
+    return investors
+
+
+def buy_token(crowdsale, investor, amount):
+    start = time.perf_counter()
+    try:
+        tx = investor.transfer(
+            crowdsale,
+            amount,
+            gas_limit=BUY_TOKEN_GAS_LIMIT,
+            data=crowdsale.buyToken.encode_input(investor),
+            required_confs=0,
+            silent=True,
+        )
+        tx.wait(1)
+        result = "ok" if tx.status == 1 else tx.revert_msg or "reverted"
+        block = tx.block_number
+    except exceptions.VirtualMachineError as e:
+        result = e.revert_msg or "reverted"
+        block = None
+    return result, time.perf_counter() - start, block
+
+
+def _mine_blocks(stopped, block_interval):
+    while not stopped.wait(block_interval):
+        chain.mine()
+
+
+def run_load_test(crowdsale, investors, amounts, workers, block_interval=BLOCK_INTERVAL):
+    """Sends every purchase from `workers` threads while automining is off and
+    a block is mined every `block_interval` seconds, so latencies and
+    purchases per block reflect block gas limits."""
+    web3.provider.make_request("miner_stop", [])
+    stopped = threading.Event()
+    miner = threading.Thread(target=_mine_blocks, args=(stopped, block_interval), daemon=True)
+    miner.start()
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(
+                    lambda args: buy_token(crowdsale, *args), zip(investors, amounts)
+                )
+            )
+    finally:
+        elapsed = time.perf_counter() - start
+        stopped.set()
+        miner.join()
+        web3.provider.make_request("miner_start", [])
+
+    latencies = [latency for result, latency, _ in results if result == "ok"]
+    reverts = Counter(result for result, _, _ in results if result != "ok")
+    per_block = Counter(block for result, _, block in results if result == "ok")
+    return {
+        "purchases": len(results),
+        "succeeded": len(latencies),
+        "elapsed": elapsed,
+        "tps": len(latencies) / elapsed if elapsed else 0,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "max_per_block": max(per_block.values(), default=0),
+        "reverts": dict(reverts),
+    }
+
+
+def print_report(report):
+    print(
+        f"{report['succeeded']}/{report['purchases']} purchases in "
+        f"{report['elapsed']:.2f}s ({report['tps']:.1f} tx/s)"
+    )
+    print(
+        f"Latency p50 {report['p50']:.3f}s, p90 {report['p90']:.3f}s, "
+        f"p99 {report['p99']:.3f}s"
+    )
+    print(f"Most purchases in a single block: {report['max_per_block']}")
+    for reason, count in report["reverts"].items():
+        print(f"Reverted ({count}): {reason}")
+
+
+def main(
+    investor_count=100,
+    workers=16,
+    distribution="uniform",
+    seed=None,
+    block_interval=BLOCK_INTERVAL,
+):
+    if not get_network_context().is_development:
+        raise RuntimeError("The load test funds throwaway accounts and is local only")
+
+    investor_count = int(investor_count)
+    amounts = sample_contributions(
+        investor_count, distribution, INVESTOR_MIN_CAP, INVESTOR_MAX_CAP, seed
+    )
+    investors = fund_investors(investor_count, amounts)
+
+    opening_time = chain.time() + 10
+    crowdsale = deploy_crowdsale(
+        cap_limit=max(sum(amounts), INVESTOR_MAX_CAP + 1),
+        investor_min_cap=INVESTOR_MIN_CAP,
+        investor_max_cap=INVESTOR_MAX_CAP,
+        opening_time=opening_time,
+        closing_time=opening_time + 10**6,
+        goal=INVESTOR_MAX_CAP,
+    )
+    whitelist_users(crowdsale, investors)
+    wait_for_opening(crowdsale)
+
+    report = run_load_test(
+        crowdsale, investors, amounts, int(workers), float(block_interval)
+    )
+    print_report(report)
+    return report
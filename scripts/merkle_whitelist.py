@@ -0,0 +1,108 @@
+from scripts.helpful_scripts import get_account
+from scripts.whitelist_users import read_addresses
+from brownie import TokenCrowdsale
+import json
+import os
+
+try:
+    # pysha3 is several times faster than the eth_hash backends, which matters
+    # once the whitelist reaches millions of addresses
+    from sha3 import keccak_256
+
+    def keccak(data):
+        return keccak_256(data).digest()
+
+except ImportError:
+    from eth_hash.auto import keccak
+
+
+def hash_leaf(address):
+    # keccak256(abi.encodePacked(address))
+    return keccak(bytes.fromhex(address[2:]))
+
+
+def hash_pair(a, b):
+    # OpenZeppelin's MerkleProof hashes sorted pairs
+    return keccak(a + b) if a < b else keccak(b + a)
+
+
+def build_merkle_tree(addresses):
+    """Returns (addresses, levels) where levels[0] are the leaves and levels[-1]
+    holds the root. Addresses are deduplicated and sorted so the same list always
+    produces the same root."""
+    addresses = sorted({address.lower() for address in addresses})
+    if not addresses:
+        raise ValueError("Cannot build a merkle tree without addresses")
+
+    levels = [[hash_leaf(address) for address in addresses]]
+    while len(levels[-1]) > 1:
+        nodes = levels[-1]
+        parents = [hash_pair(nodes[i], nodes[i + 1]) for i in range(0, len(nodes) - 1, 2)]
+        if len(nodes) % 2:
+            # The odd node is promoted unchanged and contributes no proof element
+            parents.append(nodes[-1])
+        levels.append(parents)
+    return addresses, levels
+
+
+def get_proof(levels, index):
+    proof = []
+    for nodes in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(nodes):
+            proof.append(nodes[sibling])
+        index //= 2
+    return proof
+
+
+def verify_proof(address, proof, root):
+    node = hash_leaf(address)
+    for sibling in proof:
+        node = hash_pair(node, bytes.fromhex(sibling[2:]))
+    return "0x" + node.hex() == root.lower()
+
+
+def generate_proofs(addresses):
+    addresses, levels = build_merkle_tree(addresses)
+    # Hex-encode every node once instead of once per proof it appears in
+    levels = [["0x" + node.hex() for node in nodes] for nodes in levels]
+    proofs = {
+        address: get_proof(levels, index) for index, address in enumerate(addresses)
+    }
+    return levels[-1][0], proofs
+
+
+def write_proofs(out_dir, root, proofs):
+    """Writes `root.json` plus one proof shard per leading address byte, so a
+    frontend only fetches `proofs/<first two hex chars>.json` for a given user."""
+    shard_dir = os.path.join(out_dir, "proofs")
+    os.makedirs(shard_dir, exist_ok=True)
+
+    shards = {}
+    for address, proof in proofs.items():
+        shards.setdefault(address[2:4], {})[address] = proof
+    for prefix, shard in shards.items():
+        with open(os.path.join(shard_dir, f"{prefix}.json"), "w") as f:
+            json.dump(shard, f, separators=(",", ":"))
+
+    with open(os.path.join(out_dir, "root.json"), "w") as f:
+        json.dump({"root": root, "count": len(proofs)}, f, indent=2)
+
+
+def set_merkle_root(crowdsale, root, account=None):
+    if not account:
+        account = get_account()
+    tx = crowdsale.setWhitelistMerkleRoot(root, {"from": account})
+    tx.wait(1)
+    print(f"Whitelist merkle root set to {root}")
+    return tx
+
+
+def main(csv_path, out_dir="merkle", crowdsale_address=None):
+    addresses = read_addresses(csv_path)
+    root, proofs = generate_proofs(addresses)
+    write_proofs(out_dir, root, proofs)
+    print(f"Merkle root {root} for {len(proofs)} addresses written to {out_dir}")
+
+    if crowdsale_address:
+        set_merkle_root(TokenCrowdsale.at(crowdsale_address), root)
@@ -0,0 +1,95 @@
+import json
+import os
+import time
+
+
+PROMETHEUS_PREFIX = "crowdsale_step"
+# (name, type, record field, help) of the per step metrics next to latency
+PROMETHEUS_METRICS = [
+    ("gas_used_total", "counter", "gas_used", "Gas used by the step's transactions"),
+    ("gas_price_wei", "gauge", "gas_price", "Gas price of the step's latest transaction"),
+    (
+        "submitted_timestamp_seconds",
+        "gauge",
+        "submitted_at",
+        "Submit time of the step's latest transaction",
+    ),
+]
+
+
+class StepMetrics:
+    """Records submit time, confirmation latency, gas used and gas price of
+    every transaction a script sends, keyed by step name, and dumps them as
+    JSON lines or in the Prometheus text format."""
+
+    def __init__(self):
+        self.records = []
+
+    def transact(self, step, fn, *args, tx_params):
+        submitted_at = time.time()
+        tx = fn(*args, tx_params)
+        self.record(step, tx, submitted_at)
+        return tx
+
+    def deploy(self, step, container, *args, tx_params, **kwargs):
+        submitted_at = time.time()
+        contract = container.deploy(*args, tx_params, **kwargs)
+        self.record(step, contract.tx, submitted_at)
+        return contract
+
+    def record(self, step, tx, submitted_at, confirmed_at=None):
+        if confirmed_at is None:
+            confirmed_at = time.time()
+        self.records.append(
+            {
+                "step": step,
+                "tx": tx.txid,
+                "submitted_at": submitted_at,
+                "latency": confirmed_at - submitted_at,
+                "gas_used": tx.gas_used,
+                "gas_price": tx.gas_price,
+                "block": tx.block_number,
+                "status": int(tx.status),
+            }
+        )
+
+    def to_json_lines(self):
+        return "".join(json.dumps(record) + "\n" for record in self.records)
+
+    def to_prometheus(self):
+        steps = {}
+        for record in self.records:
+            step = steps.setdefault(
+                record["step"], {"count": 0, "latency": 0, "gas_used": 0}
+            )
+            step["count"] += 1
+            step["latency"] += record["latency"]
+            step["gas_used"] += record["gas_used"]
+            # Gauges report the step's latest transaction
+            step["gas_price"] = record["gas_price"]
+            step["submitted_at"] = record["submitted_at"]
+
+        lines = [
+            f"# HELP {PROMETHEUS_PREFIX}_latency_seconds Seconds from submit to confirmation",
+            f"# TYPE {PROMETHEUS_PREFIX}_latency_seconds summary",
+        ]
+        for step, values in steps.items():
+            lines.append(f'{PROMETHEUS_PREFIX}_latency_seconds_sum{{step="{step}"}} {values["latency"]}')
+            lines.append(f'{PROMETHEUS_PREFIX}_latency_seconds_count{{step="{step}"}} {values["count"]}')
+        for name, kind, field, description in PROMETHEUS_METRICS:
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for step, values in steps.items():
+                lines.append(f'{metric}{{step="{step}"}} {values[field]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Writes Prometheus text for `.prom` paths and JSON lines otherwise."""
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                f.write(self.to_json_lines())
@@ -0,0 +1,67 @@
+from scripts.claim_tokens import get_token_holders
+from scripts.helpful_scripts import get_account
+from scripts.state_reader import read_snapshot
+from scripts.whitelist_users import BLOCK_GAS_FRACTION, chunk
+from brownie import TokenCrowdsale, web3
+import time
+
+
+# Rough cost of refunding one contributor (storage write, value transfer with
+# REFUND_CALL_GAS forwarded, event)
+GAS_PER_REFUND = 45_000
+# Fixed cost of the batch transaction itself (intrinsic gas + call overhead)
+BASE_BATCH_GAS = 30_000
+
+
+def get_refund_batch_size(gas_limit=None):
+    if not gas_limit:
+        gas_limit = int(web3.eth.get_block("latest").gasLimit * BLOCK_GAS_FRACTION)
+    return max(1, (gas_limit - BASE_BATCH_GAS) // GAS_PER_REFUND)
+
+
+def get_pending_refunds(crowdsale, contributors):
+    # Contributors who already claimed their refund are dropped up front
+    state = read_snapshot(crowdsale, investors=contributors)
+    return [
+        contributor
+        for contributor in contributors
+        if state["investors"][contributor]["contribution"]
+    ]
+
+
+def refund_batch(crowdsale, contributors, account=None, batch_size=None):
+    """Refunds `contributors` in gas bounded batches and returns the
+    refundees whose transfer failed, they can still claimRefund themselves."""
+    if not account:
+        account = get_account()
+    if not batch_size:
+        batch_size = get_refund_batch_size()
+
+    start = time.time()
+    refunded = 0
+    failed = []
+    for i, batch in enumerate(chunk(contributors, batch_size)):
+        tx = crowdsale.refundBatch(batch, {"from": account})
+        tx.wait(1)
+        # Contributors with nothing to refund emit neither event
+        if "RefundClaimed" in tx.events:
+            refunded += len(tx.events["RefundClaimed"])
+        if "RefundFailed" in tx.events:
+            failed += [event["refundee"] for event in tx.events["RefundFailed"]]
+        print(f"Refund batch {i}: {len(batch)} contributors, {tx.gas_used} gas")
+    skipped = len(contributors) - refunded - len(failed)
+    print(
+        f"Refunded {refunded} contributors in {time.time() - start:.2f}s, "
+        f"{skipped} skipped with nothing to refund, {len(failed)} failed"
+    )
+    return failed
+
+
+def main(crowdsale_address=None):
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    contributors = get_pending_refunds(crowdsale, get_token_holders(crowdsale))
+    for refundee in refund_batch(crowdsale, contributors):
+        print(f"Refund to {refundee} failed")
@@ -0,0 +1,157 @@
+from scripts.claim_tokens import get_token_holders
+from scripts.helpful_scripts import get_account
+from scripts.whitelist_users import BLOCK_GAS_FRACTION
+from brownie import TokenCrowdsale, web3
+from brownie.exceptions import VirtualMachineError
+import json
+import queue
+import threading
+
+
+# Rough cost of one relayed purchase (signature check, nonce and deposit
+# writes, the purchase itself) and of one claim inside claimTokensFor
+GAS_PER_RELAYED_PURCHASE = 90_000
+GAS_PER_RELAYED_CLAIM = 40_000
+# Fixed cost of the batch transaction itself (intrinsic gas + call overhead)
+BASE_BATCH_GAS = 30_000
+RELAY_INTERVAL = 5
+# TokenCrowdsale.PurchaseIntent fields, in order
+INTENT_FIELDS = [
+    "purchaser",
+    "beneficiary",
+    "amount",
+    "deadline",
+    "signature",
+    "proof",
+    "voucherMaxAmount",
+    "voucherExpiry",
+    "voucherSignature",
+]
+# Reasons of RelayedPurchaseFailed
+RELAY_FAILURE_REASONS = {
+    1: "Ether amount should be more than 0",
+    2: "Ether amount is less than the minimum contribution amount",
+    3: "Ether amount is more than the max contribution amount",
+    4: "Crowdsale cap exceeded",
+    5: "Beneficiary address is the zero address",
+    6: "Intent expired",
+    7: "Invalid signature or nonce",
+    8: "Relay deposit too low",
+    9: "Beneficiary is not whitelisted",
+    10: "Voucher amount exceeded",
+}
+
+
+def get_relay_batch_size(gas_per_item, gas_budget=None):
+    if not gas_budget:
+        gas_budget = int(web3.eth.get_block("latest").gasLimit * BLOCK_GAS_FRACTION)
+    return max(1, (gas_budget - BASE_BATCH_GAS) // gas_per_item)
+
+
+class Relayer:
+    """Queues signed purchase intents (see voucher_signer.sign_purchase) and
+    token claims, and submits them as relayPurchases / claimTokensFor batches
+    sized to `gas_budget`, every `interval` seconds once started or on
+    flush(). The relayer account only pays the gas, every purchase is paid
+    from its purchaser's deposit (TokenCrowdsale.depositForRelay)."""
+
+    def __init__(self, crowdsale, account=None, gas_budget=None, interval=RELAY_INTERVAL):
+        self.crowdsale = crowdsale
+        self.account = account or get_account()
+        self.interval = interval
+        self.purchase_batch_size = get_relay_batch_size(GAS_PER_RELAYED_PURCHASE, gas_budget)
+        self.claim_batch_size = get_relay_batch_size(GAS_PER_RELAYED_CLAIM, gas_budget)
+        self.purchases = queue.Queue()
+        self.claims = queue.Queue()
+        # (intent, reason) of every intent that was not bought, either
+        # rejected by the crowdsale or part of a batch that reverted as a whole.
+        # Rejected intents keep their nonce and can be submitted again
+        self.failed = []
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def submit_purchase(self, intent):
+        self.purchases.put(intent)
+
+    def submit_claim(self, beneficiary):
+        self.claims.put(beneficiary)
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the timer and submits whatever is still queued."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        return self.flush()
+
+    def flush(self):
+        receipts = []
+        while not self.purchases.empty():
+            receipts.append(self._relay_purchases(_drain(self.purchases, self.purchase_batch_size)))
+        while not self.claims.empty():
+            receipts.append(self._relay_claims(_drain(self.claims, self.claim_batch_size)))
+        return [tx for tx in receipts if tx]
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.flush()
+
+    def _relay_purchases(self, intents):
+        batch = [tuple(intent[field] for field in INTENT_FIELDS) for intent in intents]
+        try:
+            tx = self.crowdsale.relayPurchases(batch, {"from": self.account})
+            tx.wait(1)
+        except (VirtualMachineError, ValueError) as e:
+            print(f"Relayed purchase batch of {len(intents)} reverted: {e}")
+            self.failed += [(intent, str(e)) for intent in intents]
+            return None
+
+        if "RelayedPurchaseFailed" in tx.events:
+            self.failed += [
+                (intents[event["index"]], RELAY_FAILURE_REASONS[event["reason"]])
+                for event in tx.events["RelayedPurchaseFailed"]
+            ]
+        print(f"Relayed {len(intents)} purchases, {tx.gas_used} gas")
+        return tx
+
+    def _relay_claims(self, beneficiaries):
+        try:
+            tx = self.crowdsale.claimTokensFor(beneficiaries, {"from": self.account})
+            tx.wait(1)
+        except (VirtualMachineError, ValueError) as e:
+            print(f"Relayed claim batch of {len(beneficiaries)} reverted: {e}")
+            return None
+        print(f"Relayed {len(beneficiaries)} claims, {tx.gas_used} gas")
+        return tx
+
+
+def _drain(items, size):
+    batch = []
+    while len(batch) < size:
+        try:
+            batch.append(items.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def main(intents_path=None, crowdsale_address=None, claim=False):
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    relayer = Relayer(crowdsale)
+    if intents_path:
+        with open(intents_path) as f:
+            for intent in json.load(f):
+                relayer.submit_purchase(intent)
+    if claim:
+        for holder in get_token_holders(crowdsale):
+            relayer.submit_claim(holder)
+    relayer.flush()
+    print(f"{len(relayer.failed)} relayed purchases failed")
@@ -0,0 +1,276 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import http.client
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+RPC_CACHE_PATH = ".rpc_cache/responses.sqlite"
+RPC_CACHE_PORT = 8546
+RPC_CACHE_MAX_AGE = 30 * 24 * 3600
+RPC_CACHE_MAX_BYTES = 512 * 1024 * 1024
+# Evict after this many new entries rather than on every write
+RPC_CACHE_EVICT_EVERY = 1000
+# Seconds a forwarded request may take before it is answered with an error
+RPC_CACHE_TIMEOUT = 30
+# Returned by RpcCache.get for requests it has no result for, since null is a
+# result that can be recorded (a receipt that doesn't exist yet)
+MISS = object()
+
+# Answers that never change for a given upstream
+STATIC_METHODS = {"eth_chainId", "net_version", "web3_clientVersion"}
+# Position of the block parameter, responses are only stable once it is pinned
+# to a block number (ganache always pins them to the fork block)
+BLOCK_PARAM_INDEX = {
+    "eth_getBalance": 1,
+    "eth_getCode": 1,
+    "eth_getTransactionCount": 1,
+    "eth_getStorageAt": 2,
+    "eth_call": 1,
+    "eth_getBlockByNumber": 0,
+    "eth_getProof": 2,
+}
+# Looked up by hash, stable once the result is not null
+HASH_METHODS = {
+    "eth_getBlockByHash",
+    "eth_getTransactionByHash",
+    "eth_getTransactionReceipt",
+}
+
+
+def get_pinned_block(method, params):
+    """Returns the block number a request is pinned to, -1 for requests that
+    are stable regardless of the block and None for ones that aren't stable."""
+    if method in STATIC_METHODS or method in HASH_METHODS:
+        return -1
+    index = BLOCK_PARAM_INDEX.get(method)
+    if index is None or len(params) <= index:
+        return None
+    block = params[index]
+    # "latest", "pending", ... move with the chain
+    if isinstance(block, str) and block.startswith("0x"):
+        return int(block, 16)
+    return None
+
+
+def get_request_key(method, params):
+    data = json.dumps([method, params], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class RpcCache:
+    """SQLite store of JSON-RPC results keyed by the request's method and
+    params, which include its block number. Unpinned results (the latest block
+    number, pending nonces, ...) are stored too, but only served in replay
+    mode, so an offline run sees what the recorded run last saw."""
+
+    def __init__(
+        self,
+        path=RPC_CACHE_PATH,
+        max_age=RPC_CACHE_MAX_AGE,
+        max_bytes=RPC_CACHE_MAX_BYTES,
+    ):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, method TEXT, block INTEGER, pinned INTEGER, "
+            "result TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self._db.commit()
+        self.evict()
+
+    def get(self, method, params, replay=False):
+        """Returns the recorded result, or MISS."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, pinned FROM responses WHERE key = ?",
+                (get_request_key(method, params),),
+            ).fetchone()
+            if row is None or not (row[1] or replay):
+                return MISS
+            self._db.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?",
+                (time.time(), get_request_key(method, params)),
+            )
+            self._db.commit()
+            return json.loads(row[0])
+
+    def put(self, method, params, result):
+        block = get_pinned_block(method, params)
+        pinned = block is not None and result is not None
+        data = json.dumps(result)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    get_request_key(method, params),
+                    method,
+                    block,
+                    int(pinned),
+                    data,
+                    len(data),
+                    now,
+                    now,
+                ),
+            )
+            self._db.commit()
+            self._writes += 1
+        if self._writes % RPC_CACHE_EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Drops entries recorded more than max_age seconds ago, then the least
+        recently used ones until the results fit in max_bytes."""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)
+            )
+            (total,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            if total > self.max_bytes:
+                rows = self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY accessed"
+                ).fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+            self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+class RpcCacheProxy(ThreadingHTTPServer):
+    """JSON-RPC endpoint that answers from an RpcCache and forwards misses to
+    `upstream`. With `replay` set it never touches the upstream, misses are
+    returned as JSON-RPC errors, as are upstream failures."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        cache,
+        upstream=None,
+        replay=False,
+        port=RPC_CACHE_PORT,
+        timeout=RPC_CACHE_TIMEOUT,
+    ):
+        super().__init__(("127.0.0.1", port), _RpcCacheHandler)
+        self.cache = cache
+        self.upstream = upstream
+        self.replay = replay
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def handle_rpc(self, request):
+        method, params = request["method"], request.get("params", [])
+        result = self.cache.get(method, params, replay=self.replay)
+        if result is not MISS:
+            self.hits += 1
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+        self.misses += 1
+        if self.replay:
+            return _rpc_error(request, f"{method} was not recorded")
+        response = self._forward(request)
+        if "error" not in response:
+            self.cache.put(method, params, response.get("result"))
+        return response
+
+    def _forward(self, request):
+        forwarded = urllib.request.Request(
+            self.upstream,
+            data=json.dumps(request).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        # An unreachable, hung or failing upstream answers this request with
+        # an error, like a replay miss, instead of dropping the connection.
+        # Dropped connections and timeouts surface as OSError or
+        # HTTPException, a body that isn't JSON as ValueError
+        try:
+            with urllib.request.urlopen(forwarded, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return _rpc_error(request, f"Upstream returned HTTP {e.code}")
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            return _rpc_error(request, f"Upstream request failed: {e!r}")
+
+
+def _rpc_error(request, message):
+    return {
+        "jsonrpc": "2.0",
+        "id": request.get("id"),
+        "error": {"code": -32000, "message": message},
+    }
+
+
+class _RpcCacheHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if isinstance(body, list):
+            response = [self.server.handle_rpc(request) for request in body]
+        else:
+            response = self.server.handle_rpc(body)
+        data = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_rpc_cache(upstream=None, replay=False, port=RPC_CACHE_PORT, path=RPC_CACHE_PATH):
+    """Serves the cache from a background thread and returns the proxy, point
+    the fork setting of a forked network at its url."""
+    proxy = RpcCacheProxy(RpcCache(path), upstream, replay, port)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    return proxy
+
+
+def main(upstream=None, replay=False, port=RPC_CACHE_PORT):
+    """Runs the proxy in the foreground. It has to be up before brownie launches
+    the forked chain, so it is started on its own:
+
+        python -m scripts.rpc_cache https://mainnet.infura.io/v3/<id>
+        python -m scripts.rpc_cache replay
+    """
+    if upstream == "replay":
+        upstream, replay = None, True
+    if not upstream and not replay:
+        upstream = os.environ["RPC_CACHE_UPSTREAM"]
+    proxy = RpcCacheProxy(RpcCache(), upstream, bool(replay), int(port))
+    print(f"{'Replaying' if proxy.replay else 'Recording'} RPC responses on {proxy.url}")
+    try:
+        proxy.serve_forever()
+    except KeyboardInterrupt:
+        print(f"{proxy.hits} cache hits, {proxy.misses} misses")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
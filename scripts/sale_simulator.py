@@ -0,0 +1,285 @@
+from scripts.deploy_crowdsale import (
+    CAP_LIMIT,
+    GOAL,
+    INVESTOR_MAX_CAP,
+    INVESTOR_MIN_CAP,
+    RATE,
+    deploy_crowdsale,
+    wait_for_closing,
+    wait_for_opening,
+)
+from scripts.helpful_scripts import get_account, get_network_context
+from scripts.load_test import fund_investors
+from scripts.whitelist_users import whitelist_users
+from brownie import Token, exceptions
+import numpy as np
+import time
+
+
+# Mirrors of TokenCrowdsale constants
+ICO_RATE = 10
+TOKEN_SALE_PERCENTAGE = 60
+ALLOCATION_PERCENTAGES = {"founders": 20, "foundation": 15, "partners": 5}
+
+# Purchase outcomes, in the order _buyToken checks them
+ACCEPTED = 0
+REJECT_REASONS = {
+    1: "Ether amount should be more than 0",
+    2: "Ether amount is less than the minimum contribution amount",
+    3: "Ether amount is more than the max contribution amount",
+    4: "Crowdsale cap exceeded",
+}
+# Amounts are simulated in gwei so token amounts stay exact in int64
+SIM_UNIT = 10**9
+SIM_CHUNK_SIZE = 100_000
+
+
+def to_units(value, unit=SIM_UNIT):
+    if value % unit:
+        raise ValueError(f"{value} wei is not a multiple of the {unit} wei unit")
+    return value // unit
+
+
+def sample_purchases(
+    scenarios,
+    purchases,
+    investors,
+    min_cap=INVESTOR_MIN_CAP,
+    max_cap=INVESTOR_MAX_CAP,
+    distribution="uniform",
+    seed=None,
+    unit=SIM_UNIT,
+):
+    """Random purchase sequences, returned as (investor index, amount in
+    `unit` wei) arrays of shape (scenarios, purchases)."""
+    rng = np.random.default_rng(seed)
+    shape = (scenarios, purchases)
+    buyers = rng.integers(0, investors, size=shape)
+    min_units, max_units = to_units(min_cap, unit), to_units(max_cap, unit)
+    if distribution == "min":
+        amounts = np.full(shape, min_units, dtype=np.int64)
+    elif distribution == "max":
+        amounts = np.full(shape, max_units, dtype=np.int64)
+    elif distribution == "uniform":
+        amounts = rng.integers(min_units, max_units, size=shape, endpoint=True)
+    elif distribution == "lognormal":
+        # Same shape as the load test: most buys close to the minimum
+        amounts = rng.lognormal(np.log(min_units * 4), 1, size=shape)
+        amounts = np.clip(amounts.astype(np.int64), min_units, max_units)
+    else:
+        raise ValueError(f"Unknown contribution distribution: {distribution}")
+    return buyers, amounts
+
+
+def sample_purchase_times(scenarios, purchases, duration, seed=None):
+    """Seconds after opening of every purchase, in increasing order within a
+    scenario, for pricing purchases against a rate schedule."""
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.integers(0, duration, size=(scenarios, purchases)), axis=1)
+
+
+def simulate_sales(
+    buyers,
+    amounts,
+    rate=RATE,
+    rate_tiers=None,
+    times=None,
+    cap_limit=CAP_LIMIT,
+    investor_min_cap=INVESTOR_MIN_CAP,
+    investor_max_cap=INVESTOR_MAX_CAP,
+    goal=GOAL,
+    ico_step=None,
+    unit=SIM_UNIT,
+    chunk_size=SIM_CHUNK_SIZE,
+):
+    """Runs every scenario (row) of `buyers`/`amounts` through the buyToken
+    rules and the finalize split. Purchases are priced at the flat `rate`, or
+    with `rate_tiers` (the (seconds after opening, rate) tiers of
+    pack_rate_schedule) at the tier each purchase's entry of `times` falls in.
+    Purchases from index `ico_step` on (a scalar or one per scenario) are
+    priced at ICO_RATE, as after setCrowdsaleState.
+
+    Returns per scenario arrays: raised and tokensSold in wei, goalReached,
+    the outcome of every purchase, and the finalize mints per allocation.
+    """
+    buyers = np.asarray(buyers)
+    amounts = np.asarray(amounts, dtype=np.int64)
+    scenarios, purchases = amounts.shape
+    if ico_step is None:
+        ico_step = purchases
+    ico_step = np.broadcast_to(np.asarray(ico_step), (scenarios,))
+    if rate_tiers:
+        if times is None:
+            raise ValueError("Tiered rates need the time of every purchase")
+        times = np.asarray(times)
+        tier_starts = np.array([start for start, _ in rate_tiers])
+        tier_rates = np.array([tier_rate for _, tier_rate in rate_tiers], dtype=np.int64)
+
+    cap = to_units(cap_limit, unit)
+    min_cap = to_units(investor_min_cap, unit)
+    max_cap = to_units(investor_max_cap, unit)
+    raised = np.zeros(scenarios, dtype=np.int64)
+    sold = np.zeros(scenarios, dtype=np.int64)
+    outcomes = np.zeros((scenarios, purchases), dtype=np.int8)
+
+    # Purchases depend on earlier ones in the same sale, so steps run in order
+    # while every scenario of a chunk advances at once
+    for start in range(0, scenarios, chunk_size):
+        rows = slice(start, start + chunk_size)
+        index = np.arange(len(raised[rows]))
+        contributions = np.zeros((len(index), buyers.max() + 1), dtype=np.int64)
+        for step in range(purchases):
+            buyer = buyers[rows, step]
+            value = amounts[rows, step]
+            contribution = contributions[index, buyer] + value
+
+            outcome = np.zeros(len(index), dtype=np.int8)
+            outcome[raised[rows] + value > cap] = 4
+            outcome[contribution > max_cap] = 3
+            outcome[contribution < min_cap] = 2
+            outcome[value == 0] = 1
+            outcomes[rows, step] = outcome
+
+            accepted = outcome == ACCEPTED
+            base_rate = rate
+            if rate_tiers:
+                # Last tier that started at or before the purchase, as rate()
+                tier = np.searchsorted(tier_starts, times[rows, step], side="right") - 1
+                base_rate = tier_rates[tier]
+            step_rate = np.where(step >= ico_step[rows], ICO_RATE, base_rate)
+            contributions[index[accepted], buyer[accepted]] = contribution[accepted]
+            raised[rows] += np.where(accepted, value, 0)
+            sold[rows] += np.where(accepted, value * step_rate, 0)
+
+    # Wei amounts overflow int64, the final math runs on exact Python ints
+    raised_wei = raised.astype(object) * unit
+    sold_wei = sold.astype(object) * unit
+    total_supply = sold_wei * 100 // TOKEN_SALE_PERCENTAGE
+    results = {
+        "raised": raised_wei,
+        "tokensSold": sold_wei,
+        "goalReached": raised_wei >= goal,
+        "outcomes": outcomes,
+    }
+    for name, percentage in ALLOCATION_PERCENTAGES.items():
+        results[name] = total_supply * percentage // 100
+    return results
+
+
+def summarize(results):
+    outcomes = results["outcomes"]
+    raised = results["raised"].astype(float)
+    return {
+        "scenarios": len(raised),
+        "goal_reached": float(np.mean(results["goalReached"])),
+        "raised_p50": float(np.percentile(raised, 50)),
+        "raised_p90": float(np.percentile(raised, 90)),
+        "accepted": float(np.mean(outcomes == ACCEPTED)),
+        "rejected": {
+            reason: float(np.mean(outcomes == code))
+            for code, reason in REJECT_REASONS.items()
+        },
+    }
+
+
+def replay_scenario(crowdsale, investors, buyers, amounts, ico_step=None, unit=SIM_UNIT):
+    """Replays one simulated scenario against a deployed, whitelisted and open
+    crowdsale, then closes and finalizes it. Returns the results in the
+    simulator's layout so the two can be compared directly. Purchases are
+    replayed back to back, so only flat-rate sales can be verified this way."""
+    owner = get_account()
+    codes = {reason: code for code, reason in REJECT_REASONS.items()}
+    outcomes = []
+    for step, (buyer, amount) in enumerate(zip(buyers, amounts)):
+        if step == ico_step:
+            crowdsale.setCrowdsaleState(1, {"from": owner})
+        investor = investors[buyer]
+        try:
+            crowdsale.buyToken(investor, {"from": investor, "value": int(amount) * unit})
+            outcomes.append(ACCEPTED)
+        except exceptions.VirtualMachineError as e:
+            outcomes.append(codes[e.revert_msg])
+
+    raised, sold, goal_reached = (
+        crowdsale.amountRaised(),
+        crowdsale.tokensSold(),
+        crowdsale.goalReached(),
+    )
+    wait_for_closing(crowdsale)
+    crowdsale.finalize({"from": owner})
+    token = Token.at(crowdsale.token())
+    results = {
+        "raised": raised,
+        "tokensSold": sold,
+        "goalReached": goal_reached,
+        "outcomes": outcomes,
+    }
+    for name in ALLOCATION_PERCENTAGES:
+        results[name] = token.balanceOf(getattr(crowdsale, f"{name}Address")())
+    return results
+
+
+def verify_scenario(results, index, crowdsale, investors, buyers, amounts, ico_step=None):
+    """Returns the fields where scenario `index` of `results` differs from
+    replaying it against `crowdsale`, empty when the simulator matches."""
+    if ico_step is not None:
+        ico_step = int(np.broadcast_to(ico_step, (len(amounts),))[index])
+    chain_results = replay_scenario(
+        crowdsale, investors, buyers[index], amounts[index], ico_step
+    )
+    mismatches = {}
+    for key, value in chain_results.items():
+        simulated = results[key][index]
+        simulated = simulated.tolist() if hasattr(simulated, "tolist") else simulated
+        if simulated != value:
+            mismatches[key] = (simulated, value)
+    return mismatches
+
+
+def verify_sample(results, buyers, amounts, ico_step=None, sample=3, seed=None, **sale_config):
+    """Replays `sample` random scenarios on fresh local crowdsales deployed
+    with `sale_config` and returns the mismatches of each, keyed by index."""
+    max_cap = sale_config.get("investor_max_cap", INVESTOR_MAX_CAP)
+    count = int(buyers.max()) + 1
+    # Every sampled sale can take up to the max cap from each investor
+    investors = fund_investors(count, [max_cap * sample] * count)
+    indexes = np.random.default_rng(seed).choice(len(amounts), sample, replace=False)
+    mismatches = {}
+    for index in indexes.tolist():
+        crowdsale = deploy_crowdsale(**sale_config)
+        whitelist_users(crowdsale, investors)
+        wait_for_opening(crowdsale)
+        mismatches[index] = verify_scenario(
+            results, index, crowdsale, investors, buyers, amounts, ico_step
+        )
+    return mismatches
+
+
+def main(
+    scenarios=1_000_000,
+    purchases=20,
+    investors=10,
+    distribution="lognormal",
+    seed=None,
+    verify=0,
+):
+    start = time.perf_counter()
+    buyers, amounts = sample_purchases(
+        int(scenarios), int(purchases), int(investors), distribution=distribution, seed=seed
+    )
+    ico_step = int(purchases) // 2
+    results = simulate_sales(buyers, amounts, ico_step=ico_step)
+    elapsed = time.perf_counter() - start
+    summary = summarize(results)
+    print(f"Simulated {summary['scenarios']} sales in {elapsed:.2f}s")
+    print(f"Goal reached in {summary['goal_reached']:.1%} of sales")
+    print(f"Raised p50 {summary['raised_p50']:.3e} wei, p90 {summary['raised_p90']:.3e} wei")
+    print(f"Accepted {summary['accepted']:.1%} of purchases")
+    for reason, share in summary["rejected"].items():
+        print(f"Rejected {share:.1%}: {reason}")
+
+    if int(verify) and get_network_context().is_development:
+        mismatches = verify_sample(results, buyers, amounts, ico_step, int(verify), seed)
+        for index, fields in mismatches.items():
+            print(f"Scenario {index}: {fields or 'matches the contract'}")
+    return summary
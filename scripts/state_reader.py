@@ -0,0 +1,68 @@
+from brownie import Token, TokenCrowdsale, multicall
+
+
+CROWDSALE_VIEWS = {
+    "amountRaised": int,
+    "tokensSold": int,
+    "rate": int,
+    "goalReached": bool,
+    "capLimitReached": bool,
+    "isOpen": bool,
+    "isClosed": bool,
+    "finalized": bool,
+}
+# Calls per aggregate eth_call, keeps a single request under node gas caps
+MULTICALL_BATCH_SIZE = 600
+
+
+def resolve(value, cast):
+    # Multicall results are proxies around the decoded value, failed calls
+    # wrap None
+    value = getattr(value, "__wrapped__", value)
+    if value is None:
+        return None
+    return cast(value)
+
+
+def read_snapshot(crowdsale, token=None, investors=(), block=None, batch_size=MULTICALL_BATCH_SIZE):
+    """Reads the crowdsale views and the balances of `investors` through
+    Multicall2, with every batch pinned to the same block."""
+    with multicall(block_identifier=block):
+        block = multicall.block_number
+        views = {name: getattr(crowdsale, name)() for name in CROWDSALE_VIEWS}
+
+        balances = {}
+        calls = len(views)
+        for investor in investors:
+            balances[investor] = {
+                "contribution": crowdsale.contributions(investor),
+                "tokensOwned": crowdsale.beneficiaryTokensOwned(investor),
+            }
+            if token:
+                balances[investor]["balance"] = token.balanceOf(investor)
+            calls += len(balances[investor])
+            if calls >= batch_size:
+                multicall.flush()
+                calls = 0
+
+    state = {name: resolve(views[name], cast) for name, cast in CROWDSALE_VIEWS.items()}
+    state["block"] = block
+    state["investors"] = {
+        investor: {key: resolve(value, int) for key, value in values.items()}
+        for investor, values in balances.items()
+    }
+    return state
+
+
+def main(crowdsale_address=None, *investors):
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    token = Token.at(crowdsale.token())
+    state = read_snapshot(crowdsale, token, investors)
+    for name in CROWDSALE_VIEWS:
+        print(f"{name}: {state[name]}")
+    for investor, values in state["investors"].items():
+        print(f"{investor}: {values}")
+    print(f"Snapshot at block {state['block']}")
@@ -0,0 +1,133 @@
+from scripts.helpful_scripts import get_account
+from brownie import chain, web3
+from brownie.network.transaction import Status
+from web3.exceptions import TransactionNotFound
+import time
+
+
+# Node errors for a nonce that is already taken by a mined transaction
+NONCE_USED_ERRORS = ("nonce too low", "correct nonce")
+
+
+class TxPipeline:
+    """Sends owner transactions back-to-back with locally assigned nonces and
+    waits for all of them at once, resubmitting any that get dropped or stay
+    pending for too long with a higher gas price."""
+
+    def __init__(
+        self,
+        account=None,
+        required_confs=1,
+        timeout=120,
+        gas_price_bump=1.125,
+        max_resubmits=3,
+        metrics=None,
+    ):
+        self.account = account or get_account()
+        self.required_confs = required_confs
+        self.timeout = timeout
+        self.gas_price_bump = gas_price_bump
+        self.max_resubmits = max_resubmits
+        # Optional StepMetrics, steps are named after the called function
+        self.metrics = metrics
+        self.nonce = None
+        self.pending = []
+
+    def send(self, fn, *args, **tx_params):
+        """Broadcasts `fn(*args)` without waiting for it to be mined. Pass
+        `gas_limit` for calls that depend on an earlier pipelined transaction,
+        since their gas estimation would run against the unmined state."""
+        # Re-read whenever nothing is in flight, the account may have sent
+        # transactions outside the pipeline since the last batch
+        if not self.pending:
+            self.nonce = web3.eth.get_transaction_count(self.account.address, "pending")
+        call = {"fn": fn, "args": args, "params": tx_params, "nonce": self.nonce}
+        call["submitted_at"] = time.time()
+        call["tx"] = self._broadcast(call)
+        self.nonce += 1
+        self.pending.append(call)
+        return call["tx"]
+
+    def wait(self):
+        """Waits for every pending transaction in nonce order and returns the
+        receipts. Latencies run from send to the block each transaction was
+        mined in, not to this call."""
+        receipts = []
+        for call in self.pending:
+            tx = self._confirm(call)
+            if self.metrics:
+                self.metrics.record(
+                    call["fn"].abi["name"],
+                    tx,
+                    call["submitted_at"],
+                    get_confirmed_at(tx, call["submitted_at"]),
+                )
+            receipts.append(tx)
+        self.pending = []
+        return receipts
+
+    def _broadcast(self, call, gas_price=None):
+        params = {
+            **call["params"],
+            "from": self.account,
+            "nonce": call["nonce"],
+            "required_confs": 0,
+        }
+        if gas_price:
+            params["gas_price"] = gas_price
+        for _ in range(self.max_resubmits):
+            try:
+                return call["fn"](*call["args"], params)
+            except ValueError as e:
+                if "underpriced" not in str(e):
+                    raise
+                params["gas_price"] = self._bumped_gas_price(params.get("gas_price"))
+        return call["fn"](*call["args"], params)
+
+    def _confirm(self, call):
+        tx = call["tx"]
+        submitted = [tx]
+        for _ in range(self.max_resubmits):
+            deadline = time.time() + self.timeout
+            while tx.status == Status.Pending and time.time() < deadline:
+                time.sleep(1)
+            if tx.status in (Status.Confirmed, Status.Reverted):
+                break
+            # Dropped, or stuck behind the current gas price: replace it using
+            # the same nonce so later pipelined transactions are not orphaned
+            try:
+                tx = self._broadcast(call, self._bumped_gas_price(tx.gas_price))
+            except ValueError as e:
+                if not any(error in str(e) for error in NONCE_USED_ERRORS):
+                    raise
+                # An earlier submission was mined while this one was built
+                tx = self._mined_submission(submitted, e)
+                call["tx"] = tx
+                break
+            submitted.append(tx)
+            call["tx"] = tx
+        tx.wait(self.required_confs)
+        return tx
+
+    def _mined_submission(self, submitted, error):
+        for tx in reversed(submitted):
+            try:
+                web3.eth.get_transaction_receipt(tx.txid)
+            except TransactionNotFound:
+                continue
+            return chain.get_transaction(tx.txid)
+        raise error
+
+    def _bumped_gas_price(self, gas_price):
+        if not gas_price:
+            gas_price = web3.eth.gas_price
+        return int(gas_price * self.gas_price_bump)
+
+
+def get_confirmed_at(tx, submitted_at):
+    """Wall-clock time `tx` was mined at. Block timestamps follow chain.time(),
+    which local chains move ahead with chain.sleep, so that offset is taken
+    back out. Timestamps only have second precision, a transaction mined in
+    the second it was sent never counts as confirmed before it was sent."""
+    offset = chain.time() - time.time()
+    return max(tx.timestamp - offset, submitted_at)
@@ -0,0 +1,75 @@
+from scripts.helpful_scripts import get_account, get_network_context
+from scripts.tx_pipeline import TxPipeline
+from brownie import TokenCrowdsale, VestingVault
+
+
+# Default schedule of the founders/foundation/partners allocations
+VESTING_CLIFF = 180 * 24 * 3600
+VESTING_DURATION = 2 * 365 * 24 * 3600
+
+
+def get_allocation_addresses(crowdsale):
+    return [
+        crowdsale.foundersAddress(),
+        crowdsale.foundationAddress(),
+        crowdsale.partnersAddress(),
+    ]
+
+
+def deploy_vesting_vault(crowdsale, schedules=None, account=None):
+    """Deploys a vault for the crowdsale's allocations and attaches it, so
+    finalize mints them into the vault. `schedules` maps a beneficiary to its
+    (start, cliff, duration), the default vests every allocation from the
+    sale's closing time."""
+    if not account:
+        account = get_account()
+    if schedules is None:
+        start = crowdsale.closingTime()
+        schedules = {
+            beneficiary: (start, VESTING_CLIFF, VESTING_DURATION)
+            for beneficiary in get_allocation_addresses(crowdsale)
+        }
+
+    vault = VestingVault.deploy(
+        crowdsale.token(),
+        crowdsale,
+        {"from": account},
+        publish_source=get_network_context().verify,
+    )
+    pipeline = TxPipeline(account)
+    for beneficiary, (start, cliff, duration) in schedules.items():
+        pipeline.send(vault.setVesting, beneficiary, start, cliff, duration)
+    pipeline.send(crowdsale.setVestingVault, vault)
+    pipeline.wait()
+    print(f"Vesting vault {vault} holds the allocations of {crowdsale}")
+    return vault
+
+
+def release_vested(vault, beneficiaries, account=None):
+    if not account:
+        account = get_account()
+    tx = vault.releaseBatch(beneficiaries, {"from": account})
+    tx.wait(1)
+    released = {}
+    if "TokensReleased" in tx.events:
+        released = {
+            event["beneficiary"]: event["amount"]
+            for event in tx.events["TokensReleased"]
+        }
+    print(f"Released tokens to {len(released)} beneficiaries, {tx.gas_used} gas")
+    return released
+
+
+def main(crowdsale_address=None):
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    vault = crowdsale.vestingVault()
+    if int(vault, 16) == 0:
+        deploy_vesting_vault(crowdsale)
+        return
+    vault = VestingVault.at(vault)
+    beneficiaries = get_allocation_addresses(crowdsale)
+    for beneficiary, amount in release_vested(vault, beneficiaries).items():
+        print(f"{beneficiary} received {amount} tokens")
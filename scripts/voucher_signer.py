@@ -0,0 +1,194 @@
+from scripts.helpful_scripts import get_account
+from scripts.merkle_whitelist import keccak
+from scripts.whitelist_users import read_addresses
+from brownie import TokenCrowdsale, chain, config
+from concurrent.futures import ProcessPoolExecutor
+from eth_keys import keys
+import json
+import os
+
+
+# Mirrors the EIP712 domain and VOUCHER_TYPEHASH of WhitelistedCrowdsale, and
+# PURCHASE_TYPEHASH of TokenCrowdsale's relayed purchases
+DOMAIN_TYPEHASH = keccak(
+    b"EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"
+)
+DOMAIN_NAME = "Crowdsale"
+DOMAIN_VERSION = "1"
+VOUCHER_TYPEHASH = keccak(b"Voucher(address beneficiary,uint256 maxAmount,uint256 expiry)")
+PURCHASE_TYPEHASH = keccak(
+    b"Purchase(address purchaser,address beneficiary,uint256 amount,uint256 nonce,uint256 deadline)"
+)
+VOUCHER_CHUNK_SIZE = 1000
+VOUCHER_VALIDITY = 30 * 24 * 3600
+
+
+def _word(value):
+    return value.to_bytes(32, "big")
+
+
+def _address_word(address):
+    return bytes(12) + bytes.fromhex(address[2:])
+
+
+def get_domain_separator(crowdsale_address, chain_id):
+    return keccak(
+        DOMAIN_TYPEHASH
+        + keccak(DOMAIN_NAME.encode())
+        + keccak(DOMAIN_VERSION.encode())
+        + _word(chain_id)
+        + _address_word(crowdsale_address)
+    )
+
+
+def get_voucher_digest(domain_separator, beneficiary, max_amount, expiry):
+    struct_hash = keccak(
+        VOUCHER_TYPEHASH + _address_word(beneficiary) + _word(max_amount) + _word(expiry)
+    )
+    return keccak(b"\x19\x01" + domain_separator + struct_hash)
+
+
+def get_purchase_digest(domain_separator, purchaser, beneficiary, amount, nonce, deadline):
+    struct_hash = keccak(
+        PURCHASE_TYPEHASH
+        + _address_word(purchaser)
+        + _address_word(beneficiary)
+        + _word(amount)
+        + _word(nonce)
+        + _word(deadline)
+    )
+    return keccak(b"\x19\x01" + domain_separator + struct_hash)
+
+
+def _sign_digest(private_key, digest):
+    signature = private_key.sign_msg_hash(digest)
+    # ECDSA.recover expects v as 27 or 28
+    signature = _word(signature.r) + _word(signature.s) + bytes([signature.v + 27])
+    return "0x" + signature.hex()
+
+
+def sign_voucher(private_key, domain_separator, beneficiary, max_amount, expiry):
+    return {
+        "beneficiary": beneficiary,
+        "maxAmount": max_amount,
+        "expiry": expiry,
+        "signature": _sign_digest(
+            private_key,
+            get_voucher_digest(domain_separator, beneficiary, max_amount, expiry),
+        ),
+    }
+
+
+def sign_purchase(
+    private_key_hex,
+    crowdsale,
+    amount,
+    deadline,
+    beneficiary=None,
+    proof=None,
+    voucher=None,
+    nonce=None,
+):
+    """Signs a purchase of `amount` wei, paid from the relay deposit of the
+    key's address, for a relayer to submit. The beneficiary defaults to the
+    purchaser and is whitelisted by `proof` or `voucher` (as sign_voucher
+    returns it) when given, and the purchaser's next relay nonce is used
+    unless one is given."""
+    private_key = keys.PrivateKey(bytes.fromhex(private_key_hex.replace("0x", "")))
+    purchaser = private_key.public_key.to_checksum_address()
+    beneficiary = str(beneficiary or purchaser)
+    if nonce is None:
+        nonce = crowdsale.relayNonces(purchaser)
+    domain_separator = get_domain_separator(crowdsale.address, chain.id)
+    voucher = voucher or {"maxAmount": 0, "expiry": 0, "signature": "0x"}
+    return {
+        "purchaser": purchaser,
+        "beneficiary": beneficiary,
+        "amount": amount,
+        "deadline": deadline,
+        "signature": _sign_digest(
+            private_key,
+            get_purchase_digest(
+                domain_separator, purchaser, beneficiary, amount, nonce, deadline
+            ),
+        ),
+        "proof": list(proof or []),
+        "voucherMaxAmount": voucher["maxAmount"],
+        "voucherExpiry": voucher["expiry"],
+        "voucherSignature": voucher["signature"],
+    }
+
+
+def _sign_chunk(private_key_hex, domain_separator, entries):
+    private_key = keys.PrivateKey(bytes.fromhex(private_key_hex.replace("0x", "")))
+    return [
+        sign_voucher(private_key, domain_separator, beneficiary, max_amount, expiry)
+        for beneficiary, max_amount, expiry in entries
+    ]
+
+
+def sign_vouchers(
+    private_key_hex,
+    crowdsale_address,
+    chain_id,
+    entries,
+    workers=None,
+    chunk_size=VOUCHER_CHUNK_SIZE,
+):
+    """Signs a voucher per (beneficiary, max amount, expiry) entry, spreading
+    chunks of entries over `workers` processes (default: one per core)."""
+    domain_separator = get_domain_separator(crowdsale_address, chain_id)
+    entries = list(entries)
+    chunks = [entries[i : i + chunk_size] for i in range(0, len(entries), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        return [
+            voucher
+            for entries_chunk in chunks
+            for voucher in _sign_chunk(private_key_hex, domain_separator, entries_chunk)
+        ]
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        signed = executor.map(
+            _sign_chunk,
+            [private_key_hex] * len(chunks),
+            [domain_separator] * len(chunks),
+            chunks,
+        )
+        return [voucher for vouchers in signed for voucher in vouchers]
+
+
+def write_vouchers(out_path, vouchers):
+    # Keyed by lowercase address like the merkle proofs
+    with open(out_path, "w") as f:
+        json.dump({voucher["beneficiary"].lower(): voucher for voucher in vouchers}, f)
+
+
+def set_kyc_signer(crowdsale, signer, account=None):
+    if not account:
+        account = get_account()
+    tx = crowdsale.setKycSigner(signer, {"from": account})
+    tx.wait(1)
+    print(f"KYC signer of {crowdsale} set to {signer}")
+
+
+def main(
+    csv_path,
+    max_amount,
+    out_path="vouchers.json",
+    crowdsale_address=None,
+    validity=VOUCHER_VALIDITY,
+):
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    private_key_hex = config["wallets"]["kyc_signer"]
+    signer = keys.PrivateKey(bytes.fromhex(private_key_hex.replace("0x", "")))
+    if crowdsale.kycSigner() != signer.public_key.to_checksum_address():
+        set_kyc_signer(crowdsale, signer.public_key.to_checksum_address())
+
+    expiry = chain.time() + int(validity)
+    entries = [(address, int(max_amount), expiry) for address in read_addresses(csv_path)]
+    vouchers = sign_vouchers(private_key_hex, crowdsale.address, chain.id, entries)
+    write_vouchers(out_path, vouchers)
+    print(f"Signed {len(vouchers)} vouchers into {out_path}")
@@ -0,0 +1,77 @@
+from scripts.helpful_scripts import get_account
+from brownie import TokenCrowdsale, web3
+from web3 import Web3
+import csv
+import time
+
+
+# Rough cost of whitelisting one fresh address (cold SSTORE + calldata + loop)
+GAS_PER_USER = 25_000
+# Fixed cost of the batch transaction itself (intrinsic gas + call overhead)
+BASE_BATCH_GAS = 30_000
+# Fraction of the block gas limit a single batch is allowed to consume
+BLOCK_GAS_FRACTION = 0.5
+
+
+def read_addresses(csv_path):
+    addresses = []
+    with open(csv_path, newline="") as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            address = row[0].strip()
+            if not Web3.isAddress(address):
+                # Header rows and comments are skipped
+                continue
+            addresses.append(Web3.toChecksumAddress(address))
+    return addresses
+
+
+def get_batch_size(gas_limit=None):
+    if not gas_limit:
+        gas_limit = int(web3.eth.get_block("latest").gasLimit * BLOCK_GAS_FRACTION)
+    return max(1, (gas_limit - BASE_BATCH_GAS) // GAS_PER_USER)
+
+
+def chunk(items, size):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def whitelist_users(crowdsale, addresses, account=None, batch_size=None, remove=False):
+    if not account:
+        account = get_account()
+    if not batch_size:
+        batch_size = get_batch_size()
+    method = crowdsale.removeWhitelistedUsers if remove else crowdsale.addWhitelistedUsers
+
+    total_gas = 0
+    start = time.time()
+    for n, batch in enumerate(chunk(addresses, batch_size)):
+        batch_start = time.time()
+        tx = method(batch, {"from": account})
+        tx.wait(1)
+        elapsed = time.time() - batch_start
+        total_gas += tx.gas_used
+        print(
+            f"Batch {n}: {len(batch)} addresses, {tx.gas_used} gas "
+            f"({tx.gas_used // len(batch)} per address), {elapsed:.2f}s"
+        )
+
+    elapsed = time.time() - start
+    if addresses:
+        print(
+            f"Processed {len(addresses)} addresses in {elapsed:.2f}s "
+            f"({len(addresses) / max(elapsed, 1e-9):.1f} addresses/s), "
+            f"total gas {total_gas}"
+        )
+    return total_gas
+
+
+def main(csv_path, crowdsale_address=None, remove=False):
+    if crowdsale_address:
+        crowdsale = TokenCrowdsale.at(crowdsale_address)
+    else:
+        crowdsale = TokenCrowdsale[-1]
+    addresses = read_addresses(csv_path)
+    whitelist_users(crowdsale, addresses, remove=remove)
@@ -0,0 +1,105 @@
+from scripts.deploy_crowdsale import (
+    CAP_LIMIT,
+    GOAL,
+    INVESTOR_MAX_CAP,
+    INVESTOR_MIN_CAP,
+    RATE,
+    deploy_crowdsale,
+    deploy_token,
+)
+from scripts.helpful_scripts import (
+    get_account,
+    get_network_context,
+    get_worker_id,
+    PARALLEL_LOCAL_ENVIRONMENTS,
+)
+from brownie import Token, chain, web3
+from brownie._config import CONFIG
+import pytest
+
+
+# Module scoped sales open this far in the future so wall-clock time spent
+# running a module never opens them by accident; tests jump time explicitly
+OPENING_DELAY = 3600
+SALE_DURATION = 3600
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: gas benchmarks, run with -m benchmark")
+
+
+def pytest_collection_modifyitems(config, items):
+    # Benchmarks are deselected unless the marker expression asks for them
+    if "benchmark" in (config.option.markexpr or ""):
+        return
+    skip_benchmark = pytest.mark.skip(reason="Gas benchmarks only run with -m benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def worker_network():
+    context = get_network_context()
+    if get_worker_id() and not context.can_run_parallel:
+        pytest.exit(
+            f"Parallel runs need a chain per worker, use one of "
+            f"{PARALLEL_LOCAL_ENVIRONMENTS} instead of {context.name}",
+            returncode=4,
+        )
+
+
+@pytest.fixture(scope="session")
+def local_network():
+    if not get_network_context().is_local:
+        pytest.skip("Only for local testing")
+
+
+@pytest.fixture
+def isolation(local_network, fn_isolation):
+    """Chain-backed modules use this through `pytestmark`: every test starts
+    from the snapshot taken after the module scoped deployments below and is
+    reverted once it finishes. Pure Python tests don't need a chain at all."""
+    # brownie caches the address of the Multicall2 it deploys for
+    # read_snapshot, which a reverted snapshot can leave without code
+    cached = CONFIG.active_network.get("multicall2")
+    if cached and not web3.eth.get_code(cached):
+        del CONFIG.active_network["multicall2"]
+
+
+def sale_config(**overrides):
+    opening_time = chain.time() + OPENING_DELAY
+    config = {
+        "rate": RATE,
+        "cap_limit": CAP_LIMIT,
+        "investor_min_cap": INVESTOR_MIN_CAP,
+        "investor_max_cap": INVESTOR_MAX_CAP,
+        "opening_time": opening_time,
+        "closing_time": opening_time + SALE_DURATION,
+        "goal": GOAL,
+        "wallet": get_account(index=1),
+    }
+    config.update(overrides)
+    return config
+
+
+@pytest.fixture(scope="module")
+def crowdsale_config(request, local_network, module_isolation):
+    """Deployment parameters of the module's crowdsale. Variants are selected
+    with `@pytest.mark.parametrize("crowdsale_config", [...], indirect=True)`."""
+    return sale_config(**getattr(request, "param", {}))
+
+
+@pytest.fixture(scope="module")
+def crowdsale(crowdsale_config):
+    return deploy_crowdsale(token=deploy_token(), **crowdsale_config)
+
+
+@pytest.fixture(scope="module")
+def token(crowdsale):
+    return Token.at(crowdsale.token())
+
+
+@pytest.fixture(scope="module")
+def owner():
+    return get_account()
@@ -0,0 +1,61 @@
+from scripts.artifact_cache import (
+    DEPENDENCY,
+    SOURCES_HASH_FILE,
+    evict_artifacts,
+    get_sources_hash,
+    restore_artifacts,
+    save_artifacts,
+)
+import os
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_artifacts_restored_by_sources_hash(tmp_path):
+    project, cache, packages = tmp_path / "project", tmp_path / "cache", tmp_path / "packages"
+    write(str(project / "contracts/Token.sol"), "contract Token {}")
+    write(str(project / "build/contracts/Token.json"), "{}")
+    write(str(packages / DEPENDENCY / "contracts/ERC20.sol"), "contract ERC20 {}")
+    sources_hash = get_sources_hash(str(project))
+
+    save_artifacts(str(project), str(cache), str(packages))
+
+    # A fresh checkout of the same sources gets the artifacts and dependency back
+    clone, clone_packages = tmp_path / "clone", tmp_path / "clone_packages"
+    write(str(clone / "contracts/Token.sol"), "contract Token {}")
+    assert restore_artifacts(str(clone), str(cache), str(clone_packages))
+    assert read(str(clone / "build/contracts/Token.json")) == "{}"
+    assert read(str(clone / SOURCES_HASH_FILE)) == sources_hash
+    assert os.path.isfile(str(clone_packages / DEPENDENCY / "contracts/ERC20.sol"))
+
+    # Restoring an already current build still marks the entry as used
+    entry = str(cache / sources_hash)
+    os.utime(entry, (0, 0))
+    assert restore_artifacts(str(clone), str(cache), str(clone_packages))
+    assert os.path.getmtime(entry) > 0
+
+    # Any source change is a cache miss
+    write(str(clone / "contracts/Token.sol"), "contract Token { uint256 x; }")
+    assert get_sources_hash(str(clone)) != sources_hash
+    assert not restore_artifacts(str(clone), str(cache), str(clone_packages))
+
+
+def test_artifacts_eviction(tmp_path):
+    cache = tmp_path / "cache"
+    for i in range(3):
+        entry = cache / (f"{i}" * 64)
+        os.makedirs(str(entry))
+        os.utime(str(entry), (i, i))
+
+    evict_artifacts(str(cache), max_entries=2)
+
+    assert sorted(os.listdir(str(cache))) == ["1" * 64, "2" * 64]
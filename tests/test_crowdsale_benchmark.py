@@ -0,0 +1,158 @@
+from scripts.deploy_crowdsale import deploy_crowdsale
+from scripts.helpful_scripts import get_account
+from scripts.load_test import fund_investors
+from web3 import Web3
+import pytest
+from brownie import chain
+import fcntl
+import json
+import os
+import uuid
+
+
+# Benchmarks send thousands of transactions, they only run with -m benchmark
+pytestmark = [pytest.mark.benchmark, pytest.mark.usefixtures("isolation")]
+
+# Investor counts to benchmark, override with e.g. BENCHMARK_INVESTORS=10,100,1000
+INVESTOR_COUNTS = [
+    int(n) for n in os.environ.get("BENCHMARK_INVESTORS", "10").split(",")
+]
+# The report stays in pytest's temporary directory unless a path is given
+REPORT_PATH = os.environ.get("GAS_REPORT_PATH")
+# xdist workers of one run share this id and merge their results into one
+# report, a report left by any other run is replaced
+RUN_ID = os.environ.get("PYTEST_XDIST_TESTRUNUID") or uuid.uuid4().hex
+
+CONTRIBUTION = Web3.toWei(0.01, "ether")
+WHITELIST_BATCH_SIZE = 200
+CLAIM_BATCH_SIZE = 100
+
+
+@pytest.fixture(scope="module")
+def gas_report(tmp_path_factory):
+    report = {}
+    yield report
+    report_path = REPORT_PATH or str(tmp_path_factory.mktemp("benchmark") / "gas_benchmark.json")
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    # xdist workers may finish at the same time, merge into the report under a lock
+    with open(report_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        merged = {"run": RUN_ID, "investor_counts": {}}
+        if os.path.exists(report_path):
+            with open(report_path) as f:
+                previous = json.load(f)
+            if previous.get("run") == RUN_ID:
+                merged = previous
+        # Each worker ran some of the calls of an investor count, they are
+        # merged call by call and the totals summed over the merged calls
+        for investor_count, results in report.items():
+            calls = merged["investor_counts"].setdefault(investor_count, {"calls": {}})["calls"]
+            calls.update(results["calls"])
+        for results in merged["investor_counts"].values():
+            results["total"] = sum(call["total"] for call in results["calls"].values())
+        with open(report_path, "w") as f:
+            json.dump(merged, f, indent=2, sort_keys=True)
+            f.write("\n")
+    print(f"Gas benchmark written to {report_path}")
+
+
+def summarize(gas_used):
+    if not gas_used:
+        return {"calls": 0, "min": 0, "max": 0, "mean": 0, "total": 0}
+    return {
+        "calls": len(gas_used),
+        "min": min(gas_used),
+        "max": max(gas_used),
+        "mean": sum(gas_used) // len(gas_used),
+        "total": sum(gas_used),
+    }
+
+
+def open_benchmark_crowdsale(investors, goal):
+    owner = get_account()
+    opening_time = chain.time() + 10
+    closing_time = opening_time + 10**6
+    crowdsale = deploy_crowdsale(
+        cap_limit=CONTRIBUTION * len(investors) * 2,
+        investor_min_cap=CONTRIBUTION // 2,
+        investor_max_cap=CONTRIBUTION * 2,
+        opening_time=opening_time,
+        closing_time=closing_time,
+        goal=goal,
+    )
+    for i in range(0, len(investors), WHITELIST_BATCH_SIZE):
+        crowdsale.addWhitelistedUsers(
+            investors[i : i + WHITELIST_BATCH_SIZE], {"from": owner}
+        )
+    chain.sleep(opening_time - chain.time() + 1)
+    chain.mine()
+    return crowdsale
+
+
+def buy_tokens(crowdsale, investors):
+    return [
+        crowdsale.buyToken(
+            investor, {"from": investor, "value": CONTRIBUTION}
+        ).gas_used
+        for investor in investors
+    ]
+
+
+def close_crowdsale(crowdsale):
+    chain.sleep(crowdsale.closingTime() - chain.time() + 1)
+    chain.mine()
+
+
+@pytest.mark.parametrize("investor_count", INVESTOR_COUNTS)
+def test_benchmark_goal_reached(investor_count, gas_report):
+    owner = get_account()
+    investors = fund_investors(investor_count, [CONTRIBUTION] * investor_count)
+    crowdsale = open_benchmark_crowdsale(investors, CONTRIBUTION * investor_count)
+
+    buy_gas = buy_tokens(crowdsale, investors)
+    close_crowdsale(crowdsale)
+    finalize_gas = [crowdsale.finalize({"from": owner}).gas_used]
+    withdraw_gas = [crowdsale.withdrawFunds({"from": owner}).gas_used]
+
+    # Half the holders claim themselves, the rest are pushed in batches
+    half = investor_count // 2
+    claim_gas = [
+        crowdsale.claimTokens({"from": investor}).gas_used
+        for investor in investors[:half]
+    ]
+    claim_for_gas = [
+        crowdsale.claimTokensFor(
+            investors[i : i + CLAIM_BATCH_SIZE], {"from": owner}
+        ).gas_used
+        for i in range(half, investor_count, CLAIM_BATCH_SIZE)
+    ]
+
+    assert crowdsale.goalReached()
+    assert crowdsale.beneficiaryTokensOwned(investors[-1]) == 0
+
+    calls = {
+        "buyToken": summarize(buy_gas),
+        "finalize": summarize(finalize_gas),
+        "withdrawFunds": summarize(withdraw_gas),
+        "claimTokens": summarize(claim_gas),
+        "claimTokensFor": summarize(claim_for_gas),
+    }
+    gas_report.setdefault(str(investor_count), {"calls": {}})["calls"].update(calls)
+
+
+@pytest.mark.parametrize("investor_count", INVESTOR_COUNTS)
+def test_benchmark_goal_not_reached(investor_count, gas_report):
+    investors = fund_investors(investor_count, [CONTRIBUTION] * investor_count)
+    crowdsale = open_benchmark_crowdsale(investors, CONTRIBUTION * investor_count + 1)
+
+    buy_tokens(crowdsale, investors)
+    close_crowdsale(crowdsale)
+    refund_gas = [
+        crowdsale.claimRefund({"from": investor}).gas_used for investor in investors
+    ]
+
+    assert not crowdsale.goalReached()
+    assert crowdsale.balance() == 0
+
+    calls = {"claimRefund": summarize(refund_gas)}
+    gas_report.setdefault(str(investor_count), {"calls": {}})["calls"].update(calls)
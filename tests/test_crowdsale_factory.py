@@ -0,0 +1,55 @@
+import brownie
+from scripts.crowdsale_factory import deploy_factory, deploy_sales
+from scripts.deploy_crowdsale import build_sale_config, wait_for_opening
+from scripts.helpful_scripts import get_account
+from brownie import Token, TokenCrowdsale
+from web3 import Web3
+import pytest
+
+
+pytestmark = pytest.mark.usefixtures("isolation")
+
+
+def test_factory_deploys_sales_in_one_transaction():
+    owner = get_account()
+    beneficiary = get_account(index=2)
+    factory = deploy_factory(owner)
+    sales = deploy_sales([{"rate": 20}, {"rate": 30}], factory, owner)
+
+    assert len(sales) == 2
+    assert len({crowdsale.address for crowdsale, _ in sales}) == 2
+    for (crowdsale, token), rate in zip(sales, [20, 30]):
+        assert crowdsale.owner() == owner
+        assert crowdsale.rate() == rate
+        assert crowdsale.token() == token
+        assert token.owner() == crowdsale
+        assert token.name() == "ICO Token"
+        assert token.symbol() == "iTok"
+        assert token.canMint()
+
+    crowdsale, token = sales[1]
+    crowdsale.addWhitelistedUser(beneficiary, {"from": owner})
+    wait_for_opening(crowdsale)
+    eth_amount = Web3.toWei(1, "ether")
+    crowdsale.buyToken(beneficiary, {"from": beneficiary, "value": eth_amount})
+    assert crowdsale.beneficiaryTokensOwned(beneficiary) == eth_amount * 30
+    assert sales[0][0].beneficiaryTokensOwned(beneficiary) == 0
+
+
+def test_factory_clones_cannot_be_reinitialized():
+    owner = get_account()
+    attacker = get_account(index=3)
+    factory = deploy_factory(owner)
+    ((crowdsale, token),) = deploy_sales([{}], factory, owner)
+    config = build_sale_config(token=token.address)
+
+    with brownie.reverts("Initializable: contract is already initialized"):
+        crowdsale.initialize(config, attacker, {"from": attacker})
+    with brownie.reverts("Initializable: contract is already initialized"):
+        token.initialize(attacker, {"from": attacker})
+
+    implementation = TokenCrowdsale.at(factory.crowdsaleImplementation())
+    with brownie.reverts("Initializable: contract is already initialized"):
+        implementation.initialize(config, attacker, {"from": attacker})
+    with brownie.reverts("Initializable: contract is already initialized"):
+        Token.at(factory.tokenImplementation()).initialize(attacker, {"from": attacker})
@@ -0,0 +1,143 @@
+from scripts.deploy_crowdsale import deploy_crowdsale, wait_for_closing, wait_for_opening
+from scripts.helpful_scripts import get_account
+from scripts.indexer import InvestorLedger
+from scripts.investor_report import iter_report_rows, write_report
+from scripts.metrics import StepMetrics
+from scripts.state_reader import read_snapshot
+from web3 import Web3
+import csv
+import json
+import pytest
+
+
+pytestmark = pytest.mark.usefixtures("isolation")
+
+
+@pytest.mark.parametrize(
+    "crowdsale_config", [{"goal": Web3.toWei(1, "ether")}], indirect=True
+)
+def test_investor_ledger_indexes_purchases_and_claims(crowdsale, owner, tmp_path):
+    # Arrange
+    wait_for_opening(crowdsale)
+    investor1 = get_account(index=2)
+    investor2 = get_account(index=3)
+    eth_amount = Web3.toWei(0.5, "ether")
+    crowdsale.addWhitelistedUsers([investor1, investor2], {"from": owner})
+    crowdsale.buyToken(investor1, {"from": investor1, "value": eth_amount})
+    crowdsale.buyToken(investor2, {"from": investor2, "value": eth_amount})
+
+    ledger = InvestorLedger(str(tmp_path / "ledger.db"), crowdsale)
+    ledger.sync(chunk_size=2)
+
+    crowdsale.buyToken(investor1, {"from": investor1, "value": eth_amount})
+    wait_for_closing(crowdsale)
+    crowdsale.finalize({"from": owner})
+    crowdsale.withdrawFunds({"from": owner})
+    crowdsale.claimTokens({"from": investor1})
+
+    # Act
+    # Reopening the database resumes from the last indexed block
+    ledger = InvestorLedger(str(tmp_path / "ledger.db"), crowdsale)
+    ledger.sync(chunk_size=2)
+
+    # Assert
+    first = ledger.get_investor(investor1.address)
+    assert first["contributed"] == crowdsale.contributions(investor1)
+    assert first["tokens"] == crowdsale.calculateTokens(eth_amount * 2)
+    assert first["claimed"] == first["tokens"]
+    assert first["purchases"] == 2
+
+    second = ledger.get_investor(investor2.address)
+    assert second["contributed"] == eth_amount
+    assert second["claimed"] == 0
+
+    assert ledger.top_investors(1)[0]["beneficiary"] == investor1.address
+
+    totals = ledger.totals()
+    assert totals["investors"] == 2
+    assert totals["contributed"] == crowdsale.amountRaised()
+    assert totals["withdrawn"] == crowdsale.amountRaised()
+
+
+@pytest.mark.parametrize(
+    "crowdsale_config", [{"goal": Web3.toWei(1, "ether")}], indirect=True
+)
+def test_investor_report(crowdsale, owner, tmp_path):
+    # Arrange
+    wait_for_opening(crowdsale)
+    investors = [get_account(index=i) for i in range(2, 5)]
+    eth_amount = Web3.toWei(0.5, "ether")
+    crowdsale.addWhitelistedUsers(investors, {"from": owner})
+    for investor in investors:
+        crowdsale.buyToken(investor, {"from": investor, "value": eth_amount})
+    wait_for_closing(crowdsale)
+    crowdsale.finalize({"from": owner})
+    crowdsale.claimTokens({"from": investors[0]})
+    ledger = InvestorLedger(str(tmp_path / "ledger.db"), crowdsale)
+    block = ledger.sync()
+
+    # Act
+    # Batches smaller than the investor count exercise the batch boundary
+    rows = iter_report_rows(ledger, crowdsale, block, batch_size=2)
+    count = write_report(rows, str(tmp_path / "investors.csv"))
+
+    # Assert
+    assert count == len(investors)
+    with open(tmp_path / "investors.csv") as f:
+        report = {row["beneficiary"]: row for row in csv.DictReader(f)}
+    tokens = crowdsale.calculateTokens(eth_amount)
+    for investor in investors:
+        row = report[investor.address]
+        assert int(row["contributed"]) == eth_amount
+        assert int(row["tokens_bought"]) == tokens
+        assert int(row["refunded"]) == 0
+    assert int(report[investors[0].address]["tokens_claimed"]) == tokens
+    assert int(report[investors[0].address]["tokens_owed"]) == 0
+    assert int(report[investors[1].address]["tokens_owed"]) == tokens
+
+
+def test_read_snapshot_matches_individual_calls(crowdsale, token, owner):
+    # Arrange
+    wait_for_opening(crowdsale)
+    investors = [get_account(index=i) for i in range(2, 6)]
+    crowdsale.addWhitelistedUsers(investors, {"from": owner})
+    for investor in investors[:3]:
+        crowdsale.buyToken(
+            investor, {"from": investor, "value": crowdsale.investorMinCap()}
+        )
+
+    # Act
+    state = read_snapshot(crowdsale, token, investors, batch_size=4)
+
+    # Assert
+    assert state["amountRaised"] == crowdsale.amountRaised()
+    assert state["tokensSold"] == crowdsale.tokensSold()
+    assert state["rate"] == crowdsale.rate()
+    assert state["isOpen"] == True
+    assert state["isClosed"] == False
+    assert state["finalized"] == False
+    for investor in investors:
+        assert state["investors"][investor] == {
+            "contribution": crowdsale.contributions(investor),
+            "tokensOwned": crowdsale.beneficiaryTokensOwned(investor),
+            "balance": token.balanceOf(investor),
+        }
+
+
+def test_deploy_step_metrics(tmp_path):
+    metrics = StepMetrics()
+    deploy_crowdsale(metrics=metrics)
+
+    steps = [record["step"] for record in metrics.records]
+    assert steps == ["Token.deploy", "TokenCrowdsale.deploy", "transferOwnership"]
+    assert all(record["gas_used"] > 0 and record["status"] == 1 for record in metrics.records)
+
+    metrics.write(str(tmp_path / "metrics.jsonl"))
+    lines = (tmp_path / "metrics.jsonl").read_text().splitlines()
+    assert [json.loads(line)["tx"] for line in lines] == [r["tx"] for r in metrics.records]
+
+    metrics.write(str(tmp_path / "metrics.prom"))
+    prometheus = (tmp_path / "metrics.prom").read_text()
+    assert 'crowdsale_step_latency_seconds_count{step="transferOwnership"} 1' in prometheus
+    gas_used = metrics.records[1]["gas_used"]
+    assert f'crowdsale_step_gas_used_total{{step="TokenCrowdsale.deploy"}} {gas_used}' in prometheus
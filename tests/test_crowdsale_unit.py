@@ -1,17 +1,55 @@
 import brownie
-from scripts.deploy_crowdsale import deploy_crowdsale, deploy_token, open_crowdsale
-from scripts.helpful_scripts import get_account, LOCAL_BLOCKCHAIN_ENVIRONEMNTS
+from scripts.deploy_crowdsale import (
+    CAP_LIMIT,
+    deploy_crowdsale,
+    pack_rate_schedule,
+    unpack_rate_schedule,
+    wait_for_closing,
+    wait_for_opening,
+)
+from scripts.deployment_registry import DeploymentRegistry
+from scripts.helpful_scripts import get_account, get_deployment_block, wait_until
+from scripts.merkle_whitelist import generate_proofs
+from scripts.claim_tokens import get_token_holders
+from scripts.refund_batch import get_pending_refunds, refund_batch
+from scripts.relayer import Relayer
+from scripts.voucher_signer import sign_purchase, sign_vouchers
 from web3 import Web3
 import pytest
-from brownie import chain, network, exceptions, reverts
-import time
-
-
-def test_token_has_correct_attributes():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
-    token = deploy_token()
+from brownie import (
+    BaselineCrowdsale,
+    Contract,
+    Token,
+    TokenCrowdsale,
+    accounts,
+    chain,
+    exceptions,
+    reverts,
+)
+import json
+import os
+
+
+pytestmark = pytest.mark.usefixtures("isolation")
+
+
+# Measured buyToken gas, recorded by running the gas tests with
+# UPDATE_GAS_SNAPSHOT=1 and compared within GAS_SNAPSHOT_TOLERANCE afterwards
+GAS_SNAPSHOT_PATH = os.path.join(os.path.dirname(__file__), "gas_snapshot.json")
+GAS_SNAPSHOT_TOLERANCE = 0.02
+
+# Crowdsale variants, deployed once per module through the crowdsale fixture
+GOAL_5_ETH = {"goal": Web3.toWei(5, "ether")}
+GOAL_1_ETH = {"goal": Web3.toWei(1, "ether")}
+SMALL_CAP = {
+    "cap_limit": Web3.toWei(3, "ether"),
+    "investor_max_cap": Web3.toWei(2, "ether"),
+    "goal": Web3.toWei(3, "ether"),
+}
+RATE_TIERS = {"rate_tiers": [(0, 30), (600, 20), (1200, 10)]}
+
+
+def test_token_has_correct_attributes(token):
     tokenName = "ICO Token"
     tokenSymbol = "iTok"
     tokenDecimals = 18
@@ -21,50 +59,19 @@ def test_token_has_correct_attributes():
     assert token.decimals() == tokenDecimals
 
 
-def test_crowdsale_attributes():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
-    wallet = get_account(index=1)
-    rate = 20
-    cap_limit = Web3.toWei(8, "ether")
-    investor_min_cap = Web3.toWei(0.05, "ether")
-    investor_max_cap = Web3.toWei(5, "ether")
-    opening_time = chain.time()
-    closing_time = opening_time + 10
-    goal = Web3.toWei(7, "ether")
-
-    token = deploy_token()
-    crowdsale = deploy_crowdsale(
-        rate=rate,
-        token=token,
-        cap_limit=cap_limit,
-        investor_min_cap=investor_min_cap,
-        investor_max_cap=investor_max_cap,
-        opening_time=opening_time,
-        closing_time=closing_time,
-        goal=goal,
-    )
-
-    assert crowdsale.rate() == rate
-    assert crowdsale.wallet() == wallet
+def test_crowdsale_attributes(crowdsale, crowdsale_config, token):
+    assert crowdsale.rate() == crowdsale_config["rate"]
+    assert crowdsale.wallet() == crowdsale_config["wallet"]
     assert crowdsale.token() == token.address
-    assert crowdsale.cap() == cap_limit
-    assert crowdsale.investorMinCap() == investor_min_cap
-    assert crowdsale.investorMaxCap() == investor_max_cap
-    assert crowdsale.openingTime() == opening_time
-    assert crowdsale.closingTime() == closing_time
-    assert crowdsale.goal() == goal
-
+    assert crowdsale.cap() == crowdsale_config["cap_limit"]
+    assert crowdsale.investorMinCap() == crowdsale_config["investor_min_cap"]
+    assert crowdsale.investorMaxCap() == crowdsale_config["investor_max_cap"]
+    assert crowdsale.openingTime() == crowdsale_config["opening_time"]
+    assert crowdsale.closingTime() == crowdsale_config["closing_time"]
+    assert crowdsale.goal() == crowdsale_config["goal"]
 
-def test_crowdsale_state():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
-    owner = get_account()
-    rate = 10
-    crowdsale = deploy_crowdsale(rate=rate)
 
+def test_crowdsale_state(crowdsale, owner):
     assert crowdsale.getCrowdsaleState() == 0
 
     with brownie.reverts("Crowdsale: Cannot set ICO state to an older state"):
@@ -81,26 +88,117 @@ def test_crowdsale_state():
     assert crowdsale.rate() == 10
 
 
-def test_token_owner_is_crowdsale():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
+@pytest.mark.parametrize("crowdsale_config", [RATE_TIERS], indirect=True)
+def test_crowdsale_rate_follows_schedule(crowdsale, crowdsale_config, owner):
+    beneficiary = get_account(index=2)
+    eth_amount = Web3.toWei(0.1, "ether")
+    crowdsale.addWhitelistedUser(beneficiary, {"from": owner})
+    opening_time = crowdsale.openingTime()
+    rate_tiers = crowdsale_config["rate_tiers"]
+    assert unpack_rate_schedule(pack_rate_schedule(rate_tiers)) == rate_tiers
+    assert unpack_rate_schedule(crowdsale.rateSchedule()) == rate_tiers
+
+    previous_rate = None
+    for start, rate in rate_tiers:
+        if previous_rate:
+            # The previous tier holds right up to this tier's start
+            wait_until(opening_time + start - 5)
+            assert crowdsale.rate() == previous_rate
+        wait_until(opening_time + start)
+        assert crowdsale.rate() == rate
+        previous_rate = rate
+        tx = crowdsale.buyToken(beneficiary, {"from": beneficiary, "value": eth_amount})
+        assert tx.events["TokensPurchased"]["tokenAmount"] == eth_amount * rate
+
+    # The manual switch to ICO still overrides the schedule
+    crowdsale.setCrowdsaleState(1, {"from": owner})
+    assert crowdsale.rate() == 10
 
-    token = deploy_token()
-    crowdsale = deploy_crowdsale(token=token)
-    assert token.owner() == crowdsale
 
+def test_crowdsale_rate_schedule_validation():
+    with brownie.reverts("Crowdsale: First rate tier should start at opening"):
+        deploy_crowdsale(rate_tiers=[(60, 30), (600, 20)], preflight=False)
+
+    with brownie.reverts("Crowdsale: Rate tiers should start in increasing order"):
+        deploy_crowdsale(rate_tiers=[(0, 30), (600, 20), (600, 10)], preflight=False)
+
+
+def test_crowdsale_preflight_rejects_invalid_config():
+    owner = get_account()
+    nonce = owner.nonce
+
+    with pytest.raises(ValueError, match="Goal should be less than/equal to the crowdsale cap"):
+        deploy_crowdsale(goal=CAP_LIMIT + 1)
+    with pytest.raises(ValueError, match="Crowdsale: Rate tiers should start in increasing order"):
+        deploy_crowdsale(rate_tiers=[(0, 30), (600, 20), (600, 10)])
+    with pytest.raises(ValueError, match="Opening Time cannot be before the current time"):
+        deploy_crowdsale(opening_time=chain.time() - 60)
 
-def test_crowdsale_buy_tokens():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
+    # Nothing was broadcast, not even the token deployment
+    assert owner.nonce == nonce
 
+
+def test_crowdsale_deployment_registry(tmp_path):
     # Arrange
-    token = deploy_token()
-    crowdsale = deploy_crowdsale(token=token)
+    registry = DeploymentRegistry(str(tmp_path / "registry.json"))
+    opening_time = chain.time() + 60
+    sale_config = {"opening_time": opening_time, "closing_time": opening_time + 60}
+    crowdsale = deploy_crowdsale(registry=registry, **sale_config)
+    nonce = get_account().nonce
 
-    open_crowdsale()
+    # Act
+    reused = deploy_crowdsale(registry=DeploymentRegistry(registry.path), **sale_config)
+    other = deploy_crowdsale(registry=registry, goal=GOAL_1_ETH["goal"], **sale_config)
+
+    # Assert
+    assert reused == crowdsale
+    assert other != crowdsale
+    # Only the sale with the new goal was deployed (token, sale, ownership)
+    assert get_account().nonce == nonce + 3
+
+
+def test_crowdsale_deployment_block(tmp_path):
+    # Arrange
+    registry = DeploymentRegistry(str(tmp_path / "registry.json"))
+    crowdsale = deploy_crowdsale(registry=registry)
+    block = crowdsale.tx.block_number
+
+    # Act
+    # Loaded by address, so without its deployment transaction
+    loaded = Contract.from_abi("TokenCrowdsale", crowdsale.address, TokenCrowdsale.abi)
+
+    # Assert
+    assert get_deployment_block(crowdsale) == block
+    assert get_deployment_block(loaded, registry) == block
+    assert get_deployment_block(loaded, DeploymentRegistry(str(tmp_path / "empty.json"))) == 0
+
+
+def test_crowdsale_deployment_registry_relative_times(tmp_path):
+    # Arrange
+    registry = DeploymentRegistry(str(tmp_path / "registry.json"))
+    crowdsale = deploy_crowdsale(registry=registry)
+    nonce = get_account().nonce
+    chain.sleep(5)
+    chain.mine()
+
+    # Act
+    # The default times are later now, the config is still the same
+    reused = deploy_crowdsale(registry=DeploymentRegistry(registry.path))
+
+    # Assert
+    assert reused == crowdsale
+    assert reused.token() == crowdsale.token()
+    assert get_account().nonce == nonce
+
+
+def test_token_owner_is_crowdsale(crowdsale, token):
+    assert token.owner() == crowdsale
+
+
+def test_crowdsale_buy_tokens(crowdsale, token, owner):
+    # Arrange
+    wait_for_opening(crowdsale)
 
-    owner = get_account()
     investor1 = get_account(index=2)
     beneficiary = get_account(index=3)
     eth_amount = Web3.toWei(2, "ether")
@@ -116,21 +214,87 @@ def test_crowdsale_buy_tokens():
         crowdsale.beneficiaryTokensOwned(beneficiary) == crowdsale.rate() * eth_amount
     )
     assert crowdsale.beneficiaryTokensOwned(investor1) == 0
-    assert new_token_supply == init_token_supply + (crowdsale.rate() * eth_amount)
+    assert crowdsale.tokensSold() == crowdsale.rate() * eth_amount
+    # Sold tokens are only minted when the crowdsale is finalized
+    assert new_token_supply == init_token_supply
+
+
+def measure_buy_token_gas(sale, owner, investors):
+    """Returns buyToken gas of a new investor and of their repeat purchase,
+    after a first purchase so the sale's totals are already non-zero."""
+    eth_amount = Web3.toWei(1, "ether")
+    for investor in investors:
+        sale.addWhitelistedUser(investor, {"from": owner})
+    sale.buyToken(investors[0], {"from": investors[0], "value": eth_amount})
+    new_investor_tx = sale.buyToken(investors[1], {"from": investors[1], "value": eth_amount})
+    repeat_investor_tx = sale.buyToken(investors[1], {"from": investors[1], "value": eth_amount})
+    return {"new_investor": new_investor_tx.gas_used, "repeat_investor": repeat_investor_tx.gas_used}
+
+
+def deploy_baseline_crowdsale(crowdsale, owner):
+    # Same sale parameters as the fixture's crowdsale, old storage layout
+    token = Token.deploy({"from": owner})
+    baseline = BaselineCrowdsale.deploy(
+        crowdsale.rate(),
+        crowdsale.wallet(),
+        token,
+        crowdsale.cap(),
+        crowdsale.investorMinCap(),
+        crowdsale.investorMaxCap(),
+        crowdsale.openingTime(),
+        crowdsale.closingTime(),
+        crowdsale.goal(),
+        {"from": owner},
+    )
+    token.transferOwnership(baseline, {"from": owner})
+    return baseline
+
+
+def test_crowdsale_buy_tokens_gas(crowdsale, owner):
+    # Arrange
+    baseline = deploy_baseline_crowdsale(crowdsale, owner)
+    wait_for_opening(crowdsale)
+    investors = [get_account(index=2), get_account(index=3)]
 
+    # Act
+    before = measure_buy_token_gas(baseline, owner, investors)
+    after = measure_buy_token_gas(crowdsale, owner, investors)
+
+    # Assert
+    assert after["new_investor"] < before["new_investor"]
+    assert after["repeat_investor"] < before["repeat_investor"]
 
-def test_crowdsale_amount_raised():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
 
+def test_crowdsale_buy_tokens_gas_snapshot(crowdsale, owner):
     # Arrange
-    crowdsale = deploy_crowdsale()
-    open_crowdsale()
+    wait_for_opening(crowdsale)
+    investors = [get_account(index=2), get_account(index=3)]
+
+    # Act
+    after = measure_buy_token_gas(crowdsale, owner, investors)
+
+    # Assert
+    snapshot = {}
+    if os.path.exists(GAS_SNAPSHOT_PATH):
+        with open(GAS_SNAPSHOT_PATH) as f:
+            snapshot = json.load(f)
+    if os.environ.get("UPDATE_GAS_SNAPSHOT"):
+        snapshot["buyToken"] = after
+        with open(GAS_SNAPSHOT_PATH, "w") as f:
+            json.dump(snapshot, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if "buyToken" not in snapshot:
+        pytest.skip("No buyToken gas snapshot, record one with UPDATE_GAS_SNAPSHOT=1")
+    for case, gas_used in after.items():
+        assert gas_used == pytest.approx(snapshot["buyToken"][case], rel=GAS_SNAPSHOT_TOLERANCE)
+
+
+def test_crowdsale_amount_raised(crowdsale):
+    # Arrange
+    wait_for_opening(crowdsale)
 
-    wallet = get_account(index=1)
     investor1 = get_account(index=2)
     eth_amount = Web3.toWei(2, "ether")
-    # init_wallet_balance = wallet.balance()
     crowdsale.addWhitelistedUser(investor1, {"from": crowdsale.owner()})
 
     # Act
@@ -141,19 +305,12 @@ def test_crowdsale_amount_raised():
     assert crowdsale.balance() == eth_amount
 
 
-def test_crowdsale_cap_limit():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
+@pytest.mark.parametrize("crowdsale_config", [SMALL_CAP], indirect=True)
+def test_crowdsale_cap_limit(crowdsale):
     # Arrange
-    cap_limit = Web3.toWei(3, "ether")
-    investor_max_cap = Web3.toWei(2, "ether")
-    goal = Web3.toWei(3, "ether")
-    crowdsale = deploy_crowdsale(
-        investor_max_cap=investor_max_cap, cap_limit=cap_limit, goal=goal
-    )
-    open_crowdsale()
+    wait_for_opening(crowdsale)
 
+    investor_max_cap = crowdsale.investorMaxCap()
     investor1 = get_account(index=2)
     investor2 = get_account(index=3)
 
@@ -175,12 +332,8 @@ def test_crowdsale_cap_limit():
         )
 
 
-def test_crowdsale_investor_min_cap_limit():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
-    crowdsale = deploy_crowdsale()
-    open_crowdsale()
+def test_crowdsale_investor_min_cap_limit(crowdsale):
+    wait_for_opening(crowdsale)
 
     investor1 = get_account(index=2)
     investor_min_cap = crowdsale.investorMinCap()
@@ -199,12 +352,8 @@ def test_crowdsale_investor_min_cap_limit():
     )
 
 
-def test_crowdsale_investor_max_cap_limit():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
-    crowdsale = deploy_crowdsale()
-    open_crowdsale()
+def test_crowdsale_investor_max_cap_limit(crowdsale):
+    wait_for_opening(crowdsale)
 
     investor1 = get_account(index=2)
     investor_max_cap = crowdsale.investorMaxCap()
@@ -216,52 +365,32 @@ def test_crowdsale_investor_max_cap_limit():
         crowdsale.buyToken(investor1, {"from": investor1, "value": 1})
 
 
-def test_crowdsale_contribute_before_after_opening():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-    opening_time = chain.time() + 10
-    closing_time = opening_time + 100
-    crowdsale = deploy_crowdsale(opening_time=opening_time, closing_time=closing_time)
-
+def test_crowdsale_contribute_before_after_opening(crowdsale):
     investor1 = get_account(index=2)
     investor_min_cap = crowdsale.investorMinCap()
     crowdsale.addWhitelistedUser(investor1, {"from": crowdsale.owner()})
 
-    # with pytest.raises(exceptions.VirtualMachineError):
     with reverts("Not Open"):
         crowdsale.buyToken(investor1, {"from": investor1, "value": investor_min_cap})
 
-    chain.sleep(20)
-    chain.mine()
+    wait_for_opening(crowdsale)
 
     assert crowdsale.buyToken(investor1, {"from": investor1, "value": investor_min_cap})
 
 
-def test_crowdsale_contribute_after_closed():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-    opening_time = chain.time() + 5
-    closing_time = opening_time + 20
-    crowdsale = deploy_crowdsale(opening_time=opening_time, closing_time=closing_time)
-
+def test_crowdsale_contribute_after_closed(crowdsale):
     investor1 = get_account(index=2)
     investor_min_cap = crowdsale.investorMinCap()
 
-    chain.sleep(200)
-    chain.mine()
+    wait_for_closing(crowdsale)
 
     with reverts("Not Open"):
         crowdsale.buyToken(investor1, {"from": investor1, "value": investor_min_cap})
 
 
-def test_crowdsale_buy_tokens_non_whitelisted():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
+def test_crowdsale_buy_tokens_non_whitelisted(crowdsale):
     # Arrange
-    token = deploy_token()
-    crowdsale = deploy_crowdsale(token=token)
-    open_crowdsale()
+    wait_for_opening(crowdsale)
 
     beneficiary = get_account(index=2)
     investor_min_cap = crowdsale.investorMinCap()
@@ -274,14 +403,9 @@ def test_crowdsale_buy_tokens_non_whitelisted():
     assert not crowdsale.checkWhitelistedUser(beneficiary)
 
 
-def test_crowdsale_whitelist_user():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
+def test_crowdsale_whitelist_user(crowdsale):
     # Arrange
-    token = deploy_token()
-    crowdsale = deploy_crowdsale(token=token)
-    open_crowdsale()
+    wait_for_opening(crowdsale)
 
     owner = crowdsale.owner()
     beneficiary = get_account(index=2)
@@ -296,14 +420,9 @@ def test_crowdsale_whitelist_user():
     )
 
 
-def test_crowdsale_remove_whitelist_user():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
+def test_crowdsale_remove_whitelist_user(crowdsale):
     # Arrange
-    token = deploy_token()
-    crowdsale = deploy_crowdsale(token=token)
-    open_crowdsale()
+    wait_for_opening(crowdsale)
 
     owner = crowdsale.owner()
     beneficiary = get_account(index=2)
@@ -321,29 +440,197 @@ def test_crowdsale_remove_whitelist_user():
         )
 
 
-def test_crowdsale_claim_refund_withdraw_goal_not_reached():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
+def test_crowdsale_buy_tokens_with_merkle_proof(crowdsale):
+    # Arrange
+    wait_for_opening(crowdsale)
+
+    owner = crowdsale.owner()
+    beneficiary = get_account(index=2)
+    outsider = get_account(index=3)
+    investor_min_cap = crowdsale.investorMinCap()
+
+    root, proofs = generate_proofs([beneficiary.address, get_account(index=4).address])
+    proof = proofs[beneficiary.address.lower()]
+    crowdsale.setWhitelistMerkleRoot(root, {"from": owner})
+
+    # Act / Assert
+    with brownie.reverts("Crowdsale: Beneficiary is not whitelisted"):
+        crowdsale.buyTokenWithProof(
+            outsider, proof, {"from": outsider, "value": investor_min_cap}
+        )
+
+    with brownie.reverts("Crowdsale: Beneficiary is not whitelisted"):
+        crowdsale.buyToken(
+            beneficiary, {"from": beneficiary, "value": investor_min_cap}
+        )
+
+    assert crowdsale.buyTokenWithProof(
+        beneficiary, proof, {"from": beneficiary, "value": investor_min_cap}
+    )
+    assert crowdsale.contributions(beneficiary) == investor_min_cap
+
 
+def test_crowdsale_buy_tokens_with_voucher(crowdsale, owner):
     # Arrange
-    cap_limit = Web3.toWei(8, "ether")
-    investor_min_cap = Web3.toWei(0.05, "ether")
-    investor_max_cap = Web3.toWei(5, "ether")
-    opening_time = chain.time()
-    closing_time = opening_time + 20
-    goal = Web3.toWei(5, "ether")
-
-    crowdsale = deploy_crowdsale(
-        cap_limit=cap_limit,
-        investor_min_cap=investor_min_cap,
-        investor_max_cap=investor_max_cap,
-        opening_time=opening_time,
-        closing_time=closing_time,
-        goal=goal,
+    wait_for_opening(crowdsale)
+    signer = accounts.add()
+    beneficiary = get_account(index=2)
+    outsider = get_account(index=3)
+    investor_min_cap = crowdsale.investorMinCap()
+    expiry = chain.time() + 600
+    voucher, expired = sign_vouchers(
+        signer.private_key,
+        crowdsale.address,
+        chain.id,
+        [
+            (beneficiary.address, investor_min_cap * 2, expiry),
+            (outsider.address, investor_min_cap, chain.time() - 1),
+        ],
+        workers=1,
     )
-    open_crowdsale()
+    args = [voucher["beneficiary"], voucher["maxAmount"], voucher["expiry"], voucher["signature"]]
 
-    owner = get_account()
+    # Act / Assert
+    # Nothing verifies until the owner trusts the signer
+    with brownie.reverts("Crowdsale: Beneficiary is not whitelisted"):
+        crowdsale.buyTokenWithVoucher(*args, {"from": beneficiary, "value": investor_min_cap})
+    crowdsale.setKycSigner(signer, {"from": owner})
+
+    with brownie.reverts("Crowdsale: Beneficiary is not whitelisted"):
+        crowdsale.buyTokenWithVoucher(
+            outsider, *args[1:], {"from": outsider, "value": investor_min_cap}
+        )
+    with brownie.reverts("Crowdsale: Beneficiary is not whitelisted"):
+        crowdsale.buyTokenWithVoucher(
+            outsider,
+            expired["maxAmount"],
+            expired["expiry"],
+            expired["signature"],
+            {"from": outsider, "value": investor_min_cap},
+        )
+
+    for _ in range(2):
+        assert crowdsale.buyTokenWithVoucher(
+            *args, {"from": beneficiary, "value": investor_min_cap}
+        )
+    assert crowdsale.contributions(beneficiary) == investor_min_cap * 2
+    assert not crowdsale.checkWhitelistedUser(beneficiary)
+
+    with brownie.reverts("Crowdsale: Voucher amount exceeded"):
+        crowdsale.buyTokenWithVoucher(*args, {"from": beneficiary, "value": investor_min_cap})
+
+
+def test_crowdsale_relay_purchases(crowdsale, owner):
+    # Arrange
+    wait_for_opening(crowdsale)
+    relayer_account = get_account(index=4)
+    whitelisted, purchaser, outsider = accounts.add(), accounts.add(), accounts.add()
+    voucher_beneficiary, proof_beneficiary = get_account(index=2), get_account(index=3)
+    amount = crowdsale.investorMinCap()
+    deadline = chain.time() + 600
+
+    crowdsale.addWhitelistedUser(whitelisted, {"from": owner})
+    signer = accounts.add()
+    crowdsale.setKycSigner(signer, {"from": owner})
+    (voucher,) = sign_vouchers(
+        signer.private_key,
+        crowdsale.address,
+        chain.id,
+        [(voucher_beneficiary.address, amount, deadline)],
+        workers=1,
+    )
+    root, proofs = generate_proofs([proof_beneficiary.address, outsider.address])
+    crowdsale.setWhitelistMerkleRoot(root, {"from": owner})
+
+    for account in [whitelisted, purchaser, outsider]:
+        get_account().transfer(account, amount * 4)
+        crowdsale.depositForRelay({"from": account, "value": amount * 3})
+
+    intents = [
+        sign_purchase(whitelisted.private_key, crowdsale, amount, deadline),
+        # The purchaser pays for two other beneficiaries, whitelisted by
+        # voucher and by proof
+        sign_purchase(
+            purchaser.private_key, crowdsale, amount, deadline, voucher_beneficiary, voucher=voucher
+        ),
+        sign_purchase(
+            purchaser.private_key,
+            crowdsale,
+            amount,
+            deadline,
+            proof_beneficiary,
+            proof=proofs[proof_beneficiary.address.lower()],
+            nonce=1,
+        ),
+        # Over the voucher's max amount
+        sign_purchase(
+            purchaser.private_key,
+            crowdsale,
+            amount,
+            deadline,
+            voucher_beneficiary,
+            voucher=voucher,
+            nonce=2,
+        ),
+        # Not whitelisted
+        sign_purchase(outsider.private_key, crowdsale, amount, deadline),
+        # Signed for a nonce the first intent already uses
+        sign_purchase(whitelisted.private_key, crowdsale, amount, deadline, nonce=0),
+        # More than the purchaser's remaining deposit
+        sign_purchase(whitelisted.private_key, crowdsale, amount * 3, deadline, nonce=1),
+    ]
+    relayer = Relayer(crowdsale, relayer_account)
+    for intent in intents:
+        relayer.submit_purchase(intent)
+    initial_balance = relayer_account.balance()
+
+    # Act
+    (tx,) = relayer.flush()
+
+    # Assert
+    assert tx.return_value == 3
+    purchases = [(event["purchaser"], event["beneficiary"]) for event in tx.events["TokensPurchased"]]
+    assert purchases == [
+        (whitelisted, whitelisted),
+        (purchaser, voucher_beneficiary),
+        (purchaser, proof_beneficiary),
+    ]
+    assert crowdsale.contributions(whitelisted) == amount
+    assert crowdsale.contributions(voucher_beneficiary) == amount
+    assert crowdsale.contributions(proof_beneficiary) == amount
+    assert crowdsale.contributions(outsider) == 0
+    assert crowdsale.relayDeposits(whitelisted) == amount * 2
+    assert crowdsale.relayDeposits(purchaser) == amount
+    assert crowdsale.relayDeposits(outsider) == amount * 3
+    # Nonces are only consumed by purchases that went through
+    assert crowdsale.relayNonces(whitelisted) == 1
+    assert crowdsale.relayNonces(purchaser) == 2
+    assert crowdsale.relayNonces(outsider) == 0
+    assert relayer.failed == [
+        (intents[3], "Voucher amount exceeded"),
+        (intents[4], "Beneficiary is not whitelisted"),
+        (intents[5], "Invalid signature or nonce"),
+        (intents[6], "Relay deposit too low"),
+    ]
+    # The relayer only pays for gas
+    assert relayer_account.balance() == initial_balance - tx.gas_used * tx.gas_price
+
+    outsider_balance = outsider.balance()
+    withdraw_tx = crowdsale.withdrawRelayDeposit(amount * 3, {"from": outsider})
+    assert crowdsale.relayDeposits(outsider) == 0
+    assert outsider.balance() == (
+        outsider_balance + amount * 3 - withdraw_tx.gas_used * withdraw_tx.gas_price
+    )
+    with brownie.reverts("Crowdsale: Relay deposit too low"):
+        crowdsale.withdrawRelayDeposit(1, {"from": outsider})
+
+
+@pytest.mark.parametrize("crowdsale_config", [GOAL_5_ETH], indirect=True)
+def test_crowdsale_claim_refund_withdraw_goal_not_reached(crowdsale, owner):
+    # Arrange
+    wait_for_opening(crowdsale)
+
+    goal = crowdsale.goal()
     beneficiary = get_account(index=2)
 
     crowdsale.addWhitelistedUser(beneficiary, {"from": owner})
@@ -363,8 +650,7 @@ def test_crowdsale_claim_refund_withdraw_goal_not_reached():
     with brownie.reverts("Crowdsale: Beneficiary isn't due any tokens"):
         crowdsale.claimTokens({"from": get_account(index=5)})
 
-    chain.sleep(30)
-    chain.mine()
+    wait_for_closing(crowdsale)
 
     with brownie.reverts("Crowdsale: Goal not reached"):
         crowdsale.claimTokens({"from": beneficiary})
@@ -378,41 +664,54 @@ def test_crowdsale_claim_refund_withdraw_goal_not_reached():
     assert crowdsale.claimRefund({"from": beneficiary})
 
 
-def test_crowdsale_claim_refund_withdraw_after_goal_met():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
+@pytest.mark.parametrize("crowdsale_config", [GOAL_5_ETH], indirect=True)
+def test_crowdsale_refund_batch(crowdsale, token, owner):
+    # Arrange
+    wait_for_opening(crowdsale)
+    investors = [get_account(index=2), get_account(index=3)]
+    eth_amount = Web3.toWei(1, "ether")
+    # Token has no payable fallback, so a refund sent to it fails
+    crowdsale.addWhitelistedUsers(investors + [token], {"from": owner})
+    for investor in investors:
+        crowdsale.buyToken(investor, {"from": investor, "value": eth_amount})
+    crowdsale.buyToken(token, {"from": investors[0], "value": eth_amount})
 
+    with brownie.reverts("Crowdsale not closed yet"):
+        crowdsale.refundBatch(investors, {"from": owner})
+
+    wait_for_closing(crowdsale)
+    with brownie.reverts("Ownable: caller is not the owner"):
+        crowdsale.refundBatch(investors, {"from": investors[0]})
+    balances = [investor.balance() for investor in investors]
+
+    # Act
+    contributors = get_pending_refunds(crowdsale, get_token_holders(crowdsale))
+    failed = refund_batch(crowdsale, contributors, owner, batch_size=2)
+
+    # Assert
+    assert contributors == [investors[0], investors[1], token.address]
+    assert failed == [token.address]
+    for investor, balance in zip(investors, balances):
+        assert investor.balance() == balance + eth_amount
+        assert crowdsale.contributions(investor) == 0
+    assert crowdsale.contributions(token) == eth_amount
+    assert get_pending_refunds(crowdsale, contributors) == [token.address]
+
+
+@pytest.mark.parametrize("crowdsale_config", [GOAL_5_ETH], indirect=True)
+def test_crowdsale_claim_refund_withdraw_after_goal_met(crowdsale, token, owner):
     # Arrange
-    wallet = get_account(index=1)
-    cap_limit = Web3.toWei(8, "ether")
-    investor_min_cap = Web3.toWei(0.05, "ether")
-    investor_max_cap = Web3.toWei(5, "ether")
-    opening_time = chain.time()
-    closing_time = opening_time + 20
-    goal = Web3.toWei(5, "ether")
-    token = deploy_token()
-
-    crowdsale = deploy_crowdsale(
-        token=token,
-        wallet=wallet,
-        cap_limit=cap_limit,
-        investor_min_cap=investor_min_cap,
-        investor_max_cap=investor_max_cap,
-        opening_time=opening_time,
-        closing_time=closing_time,
-        goal=goal,
-    )
-    open_crowdsale()
+    wait_for_opening(crowdsale)
 
-    owner = get_account()
+    wallet = get_account(index=1)
+    goal = crowdsale.goal()
     beneficiary = get_account(index=2)
     initial_wallet_balance = wallet.balance()
 
     crowdsale.addWhitelistedUser(beneficiary, {"from": owner})
     crowdsale.buyToken(beneficiary, {"from": beneficiary, "value": goal})
 
-    chain.sleep(30)
-    chain.mine()
+    wait_for_closing(crowdsale)
 
     tokens_owned = crowdsale.calculateTokens(goal)
 
@@ -440,56 +739,69 @@ def test_crowdsale_claim_refund_withdraw_after_goal_met():
 
     assert token.balanceOf(beneficiary) == tokens_owned
     assert crowdsale.beneficiaryTokensOwned(beneficiary) == 0
-    time.sleep(2)
-
 
-def test_crowdsale_token_owner_after_funds_withdraw():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
 
+@pytest.mark.parametrize("crowdsale_config", [GOAL_1_ETH], indirect=True)
+def test_crowdsale_claim_tokens_for_holders(crowdsale, token, owner):
     # Arrange
-    wallet = get_account(index=1)
-    cap_limit = Web3.toWei(8, "ether")
-    investor_min_cap = Web3.toWei(0.05, "ether")
-    investor_max_cap = Web3.toWei(5, "ether")
-    opening_time = chain.time()
-    closing_time = opening_time + 20
-    goal = investor_max_cap
-
-    token = deploy_token()
-
-    crowdsale = deploy_crowdsale(
-        token=token,
-        wallet=wallet,
-        cap_limit=cap_limit,
-        investor_min_cap=investor_min_cap,
-        investor_max_cap=investor_max_cap,
-        opening_time=opening_time,
-        closing_time=closing_time,
-        goal=goal,
+    wait_for_opening(crowdsale)
+
+    beneficiaries = [get_account(index=i) for i in range(2, 5)]
+    outsider = get_account(index=5)
+    eth_amount = Web3.toWei(0.5, "ether")
+
+    crowdsale.addWhitelistedUsers(beneficiaries, {"from": owner})
+    for beneficiary in beneficiaries:
+        crowdsale.buyToken(beneficiary, {"from": beneficiary, "value": eth_amount})
+    crowdsale.buyToken(
+        beneficiaries[0], {"from": beneficiaries[0], "value": eth_amount}
     )
-    open_crowdsale()
 
-    owner = get_account()
+    holders = get_token_holders(crowdsale)
+    assert holders == beneficiaries
+
+    with brownie.reverts("Crowdsale not closed yet"):
+        crowdsale.claimTokensFor(holders, {"from": outsider})
+
+    wait_for_closing(crowdsale)
+    crowdsale.finalize({"from": owner})
+
+    # Act
+    crowdsale.claimTokens({"from": beneficiaries[1]})
+    tx = crowdsale.claimTokensFor(holders + [outsider], {"from": outsider})
+
+    # Assert
+    assert len(tx.events["TokensClaimed"]) == 2
+    assert token.balanceOf(beneficiaries[0]) == crowdsale.calculateTokens(
+        eth_amount * 2
+    )
+    assert token.balanceOf(beneficiaries[1]) == crowdsale.calculateTokens(eth_amount)
+    assert token.balanceOf(beneficiaries[2]) == crowdsale.calculateTokens(eth_amount)
+    assert token.balanceOf(outsider) == 0
+    for beneficiary in beneficiaries:
+        assert crowdsale.beneficiaryTokensOwned(beneficiary) == 0
+
+
+@pytest.mark.parametrize("crowdsale_config", [GOAL_5_ETH], indirect=True)
+def test_crowdsale_token_owner_after_funds_withdraw(crowdsale, token, owner):
+    # Arrange
+    wait_for_opening(crowdsale)
+
+    wallet = get_account(index=1)
+    goal = crowdsale.goal()
     beneficiary = get_account(index=2)
 
     crowdsale.addWhitelistedUser(beneficiary, {"from": owner})
     crowdsale.buyToken(beneficiary, {"from": beneficiary, "value": goal})
 
-    chain.sleep(30)
-    chain.mine()
+    wait_for_closing(crowdsale)
 
     crowdsale.finalize({"from": owner})
     crowdsale.withdrawFunds({"from": owner})
     assert token.owner() == wallet
 
 
-def test_crowdsale_token_distribution():
-
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
-    crowdsale = deploy_crowdsale()
+def test_crowdsale_token_distribution(crowdsale):
 
     tokenSalePercentage = 60
     foundersPercentage = 20
@@ -515,32 +827,11 @@ def test_crowdsale_token_distribution():
     assert totalPercentage == 100
 
 
-def test_crowdsale_finalize():
-
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
-    cap_limit = Web3.toWei(8, "ether")
-    investor_min_cap = Web3.toWei(0.05, "ether")
-    investor_max_cap = Web3.toWei(5, "ether")
-    opening_time = chain.time()
-    closing_time = opening_time + 20
-    goal = investor_max_cap
+@pytest.mark.parametrize("crowdsale_config", [GOAL_5_ETH], indirect=True)
+def test_crowdsale_finalize(crowdsale, token, owner):
 
-    token = deploy_token()
+    wait_for_opening(crowdsale)
 
-    crowdsale = deploy_crowdsale(
-        token=token,
-        cap_limit=cap_limit,
-        investor_min_cap=investor_min_cap,
-        investor_max_cap=investor_max_cap,
-        opening_time=opening_time,
-        closing_time=closing_time,
-        goal=goal,
-    )
-    open_crowdsale()
-
-    owner = get_account()
     investor1 = get_account(index=2)
     beneficiary = get_account(index=3)
     eth_amount = crowdsale.investorMaxCap()
@@ -552,14 +843,13 @@ def test_crowdsale_finalize():
     foundationPercentage = 15
     partnersPercentage = 5
 
-    mintedTokens = token.totalSupply() / (10**18)
+    mintedTokens = crowdsale.tokensSold() / (10**18)
     total_tokens = mintedTokens / tokenSalePercentage
     founders_tokens = total_tokens * foundersPercentage
     foundation_tokens = total_tokens * foundationPercentage
     partners_tokens = total_tokens * partnersPercentage
 
-    chain.sleep(30)
-    chain.mine()
+    wait_for_closing(crowdsale)
 
     crowdsale.finalize({"from": owner})
 
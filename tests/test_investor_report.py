@@ -0,0 +1,18 @@
+from scripts.investor_report import AMOUNT_FIELDS, REPORT_FIELDS, write_report
+import pytest
+
+
+def test_investor_report_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    rows = [
+        dict(zip(REPORT_FIELDS, [f"0x{i:040x}", 1] + [10**30 + i] * len(AMOUNT_FIELDS)))
+        for i in range(5)
+    ]
+
+    count = write_report(iter(rows), str(tmp_path / "investors.parquet"))
+
+    table = pq.read_table(str(tmp_path / "investors.parquet"))
+    assert count == table.num_rows == 5
+    assert [int(value) for value in table.column("refunded").to_pylist()] == [
+        10**30 + i for i in range(5)
+    ]
@@ -0,0 +1,158 @@
+from scripts.rpc_cache import MISS, RpcCache, RpcCacheProxy, get_pinned_block
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+import urllib.request
+import pytest
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.calls += 1
+        if self.server.mode == "error":
+            self.send_error(500)
+            return
+        if self.server.mode == "drop":
+            # Closes the connection without a response
+            self.close_connection = True
+            return
+        if self.server.mode == "hang":
+            time.sleep(1)
+        if self.server.mode == "garbage":
+            data = b"<html>Bad Gateway</html>"
+        else:
+            data = json.dumps(
+                {"jsonrpc": "2.0", "id": request["id"], "result": hex(self.server.calls)}
+            ).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), UpstreamHandler)
+    server.calls = 0
+    server.mode = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def start_proxy(cache, upstream=None, replay=False, timeout=5):
+    url = f"http://127.0.0.1:{upstream.server_address[1]}" if upstream else None
+    proxy = RpcCacheProxy(cache, url, replay, port=0, timeout=timeout)
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    return proxy
+
+
+def rpc(proxy, method, params):
+    request = urllib.request.Request(
+        proxy.url,
+        data=json.dumps({"jsonrpc": "2.0", "id": 1, "method": method, "params": params}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+BALANCE_AT_BLOCK = ("eth_getBalance", ["0x" + "11" * 20, "0x10"])
+LATEST_BLOCK = ("eth_blockNumber", [])
+
+
+def test_pinned_block():
+    assert get_pinned_block(*BALANCE_AT_BLOCK) == 16
+    assert get_pinned_block("eth_getBalance", ["0x" + "11" * 20, "latest"]) is None
+    assert get_pinned_block("eth_chainId", []) == -1
+    assert get_pinned_block(*LATEST_BLOCK) is None
+
+
+def test_record_then_replay(upstream, tmp_path):
+    cache = RpcCache(str(tmp_path / "cache.sqlite"))
+    proxy = start_proxy(cache, upstream)
+
+    # Pinned requests are served from the cache once recorded, unpinned ones
+    # always go upstream
+    assert rpc(proxy, *BALANCE_AT_BLOCK)["result"] == "0x1"
+    assert rpc(proxy, *BALANCE_AT_BLOCK)["result"] == "0x1"
+    assert rpc(proxy, *LATEST_BLOCK)["result"] == "0x2"
+    assert rpc(proxy, *LATEST_BLOCK)["result"] == "0x3"
+    assert upstream.calls == 3
+    proxy.shutdown()
+
+    # Replay answers everything recorded without the upstream
+    replay = start_proxy(cache, replay=True)
+    assert rpc(replay, *BALANCE_AT_BLOCK)["result"] == "0x1"
+    assert rpc(replay, *LATEST_BLOCK)["result"] == "0x3"
+    assert "error" in rpc(replay, "eth_getCode", ["0x" + "22" * 20, "0x10"])
+    assert upstream.calls == 3
+    replay.shutdown()
+
+
+def test_eviction(tmp_path):
+    cache = RpcCache(str(tmp_path / "cache.sqlite"), max_age=3600, max_bytes=20)
+    for block in range(3):
+        cache.put("eth_getBalance", ["0x" + "11" * 20, hex(block)], "0x" + "f" * 8)
+        time.sleep(0.01)
+    cache.get("eth_getBalance", ["0x" + "11" * 20, "0x0"])
+
+    # Each result is 12 bytes of JSON, so only the most recently used stays
+    cache.evict()
+    assert cache.get("eth_getBalance", ["0x" + "11" * 20, "0x0"]) == "0x" + "f" * 8
+    assert cache.get("eth_getBalance", ["0x" + "11" * 20, "0x1"]) is MISS
+    assert cache.get("eth_getBalance", ["0x" + "11" * 20, "0x2"]) is MISS
+
+    cache.max_age = -1
+    cache.evict()
+    assert cache.get("eth_getBalance", ["0x" + "11" * 20, "0x0"]) is MISS
+
+
+@pytest.mark.parametrize(
+    "mode, message",
+    [
+        ("error", "Upstream returned HTTP 500"),
+        ("drop", "RemoteDisconnected"),
+        ("hang", "timed out"),
+        ("garbage", "JSONDecodeError"),
+    ],
+)
+def test_upstream_failure(upstream, tmp_path, mode, message):
+    cache = RpcCache(str(tmp_path / "cache.sqlite"))
+    proxy = start_proxy(cache, upstream, timeout=0.5)
+
+    # A failing upstream comes back as a JSON-RPC error and isn't cached
+    upstream.mode = mode
+    response = rpc(proxy, *BALANCE_AT_BLOCK)
+    assert message in response["error"]["message"]
+    assert response["id"] == 1
+    upstream.mode = None
+    assert rpc(proxy, *BALANCE_AT_BLOCK)["result"] == "0x2"
+    proxy.shutdown()
+
+
+def test_upstream_unreachable(upstream, tmp_path):
+    cache = RpcCache(str(tmp_path / "cache.sqlite"))
+    proxy = start_proxy(cache, upstream)
+    upstream.shutdown()
+    upstream.server_close()
+    assert "Upstream request failed" in rpc(proxy, *LATEST_BLOCK)["error"]["message"]
+    proxy.shutdown()
+
+
+def test_replay_recorded_null(tmp_path):
+    cache = RpcCache(str(tmp_path / "cache.sqlite"))
+    receipt = ("eth_getTransactionReceipt", ["0x" + "33" * 32])
+    cache.put(*receipt, None)
+
+    # A recorded null is a result, not a miss
+    assert cache.get(*receipt) is MISS
+    assert cache.get(*receipt, replay=True) is None
+    replay = start_proxy(cache, replay=True)
+    assert rpc(replay, *receipt) == {"jsonrpc": "2.0", "id": 1, "result": None}
+    replay.shutdown()
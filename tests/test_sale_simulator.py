@@ -0,0 +1,75 @@
+from scripts.deploy_crowdsale import wait_for_opening
+from scripts.helpful_scripts import get_account
+from web3 import Web3
+import pytest
+
+np = pytest.importorskip("numpy")
+from scripts.sale_simulator import (  # noqa: E402
+    ACCEPTED,
+    ICO_RATE,
+    SIM_UNIT,
+    simulate_sales,
+    verify_scenario,
+)
+
+
+def to_sim_units(ether):
+    return Web3.toWei(ether, "ether") // SIM_UNIT
+
+
+# One purchase of each outcome, then a purchase after the switch to ICO
+BUYERS = [0, 1, 0, 0, 1, 2, 2]
+AMOUNTS = [0, 0.01, 3, 3, 4, 2, 1]
+ICO_STEP = 6
+
+
+@pytest.mark.usefixtures("isolation")
+def test_simulator_matches_contract(crowdsale, crowdsale_config, owner):
+    # Arrange
+    investors = [get_account(index=i) for i in range(2, 5)]
+    crowdsale.addWhitelistedUsers(investors, {"from": owner})
+    wait_for_opening(crowdsale)
+    buyers = np.array([BUYERS])
+    amounts = np.array([[to_sim_units(amount) for amount in AMOUNTS]])
+    sale_config = {
+        key: crowdsale_config[key]
+        for key in ["rate", "cap_limit", "investor_min_cap", "investor_max_cap", "goal"]
+    }
+
+    # Act
+    results = simulate_sales(buyers, amounts, ico_step=ICO_STEP, **sale_config)
+    mismatches = verify_scenario(
+        results, 0, crowdsale, investors, buyers, amounts, ICO_STEP
+    )
+
+    # Assert
+    assert mismatches == {}
+    assert results["outcomes"][0].tolist() == [1, 2, ACCEPTED, 3, ACCEPTED, 4, ACCEPTED]
+    assert results["raised"][0] == Web3.toWei(8, "ether")
+    assert results["tokensSold"][0] == (
+        Web3.toWei(7, "ether") * crowdsale_config["rate"] + Web3.toWei(1, "ether") * ICO_RATE
+    )
+
+
+def test_simulator_scenarios_are_independent():
+    buyers = np.zeros((3, 2), dtype=np.int64)
+    amounts = np.array(
+        [[to_sim_units(1), to_sim_units(1)], [to_sim_units(5), to_sim_units(1)], [0, 0]]
+    )
+
+    results = simulate_sales(buyers, amounts, chunk_size=2)
+
+    assert results["raised"].tolist() == [Web3.toWei(2, "ether"), Web3.toWei(5, "ether"), 0]
+    assert results["outcomes"].tolist() == [[ACCEPTED, ACCEPTED], [ACCEPTED, 3], [1, 1]]
+
+
+def test_simulator_prices_purchases_by_rate_tier():
+    rate_tiers = [(0, 30), (600, 20), (1200, 10)]
+    buyers = np.array([[0, 1, 2, 3]])
+    amounts = np.full((1, 4), to_sim_units(1))
+    # Opening, just before and at the second tier, well into the third
+    times = np.array([[0, 599, 600, 5000]])
+
+    results = simulate_sales(buyers, amounts, rate_tiers=rate_tiers, times=times)
+
+    assert results["tokensSold"][0] == Web3.toWei(1, "ether") * (30 + 30 + 20 + 10)
@@ -1,11 +1,12 @@
-from scripts.helpful_scripts import get_account, LOCAL_BLOCKCHAIN_ENVIRONEMNTS
-from brownie import network, TimeCapped, exceptions, chain
+from scripts.helpful_scripts import get_account, wait_until
+from brownie import TimeCapped, exceptions, chain
 import pytest
 
 
+pytestmark = pytest.mark.usefixtures("isolation")
+
+
 def test_timecapped_attributes():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
     account = get_account()
     opening_time = chain.time()
     closing_time = opening_time + 1000
@@ -18,8 +19,6 @@ def test_timecapped_attributes():
 
 
 def test_timecapped_is_not_open():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
     account = get_account()
     opening_time = chain.time() + 5
     closing_time = opening_time + 5
@@ -29,8 +28,6 @@ def test_timecapped_is_not_open():
 
 
 def test_timecapped_is_closed():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
     account = get_account()
     opening_time = chain.time()
     closing_time = opening_time + 1
@@ -41,8 +38,6 @@ def test_timecapped_is_closed():
 
 
 def test_timecapped_opening_time_before_now():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
     account = get_account()
     opening_time = chain.time() - 1
     closing_time = opening_time + 1000
@@ -52,11 +47,25 @@ def test_timecapped_opening_time_before_now():
 
 
 def test_timecapped_opening_time_after_closing_time():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
     account = get_account()
     closing_time = chain.time() + 1
     opening_time = closing_time + 10
 
     with pytest.raises(exceptions.VirtualMachineError):
         TimeCapped.deploy(opening_time, closing_time, {"from": account})
+
+
+def test_wait_until_opening_and_closing_time():
+    account = get_account()
+    opening_time = chain.time() + 1000
+    closing_time = opening_time + 1000
+    timecapped = TimeCapped.deploy(opening_time, closing_time, {"from": account})
+    start_height = chain.height
+
+    wait_until(opening_time)
+    assert timecapped.isOpen() == True
+    # The wait jumps time forward with a single block instead of mining up to it
+    assert chain.height == start_height + 1
+
+    wait_until(closing_time + 1)
+    assert timecapped.isClosed() == True
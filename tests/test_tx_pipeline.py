@@ -0,0 +1,114 @@
+from scripts.helpful_scripts import get_account
+from scripts.metrics import StepMetrics
+from scripts.tx_pipeline import TxPipeline
+from brownie import Token
+from brownie.network.transaction import Status
+import pytest
+import time
+
+
+pytestmark = pytest.mark.usefixtures("isolation")
+
+
+class FakeFunction:
+    """Stands in for a contract function, answering each broadcast with the
+    next of `results`: a string is raised as the node's error, anything else
+    returned as the transaction."""
+
+    abi = {"name": "fake"}
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.broadcasts = []
+
+    def __call__(self, *args):
+        self.broadcasts.append(dict(args[-1]))
+        result = self.results.pop(0)
+        if isinstance(result, str):
+            raise ValueError(result)
+        return result
+
+
+class StaleTx:
+    """A submission brownie still reports as pending."""
+
+    def __init__(self, txid):
+        self.txid = txid
+        self.status = Status.Pending
+        self.gas_price = 1
+
+
+def test_pipeline_nonce_order():
+    # Arrange
+    owner = get_account()
+    token = Token.deploy({"from": owner})
+    pipeline = TxPipeline(owner)
+
+    # Act
+    first = [pipeline.send(token.mint, owner, 1) for _ in range(3)]
+    pipeline.wait()
+    # Sent outside the pipeline between two of its batches
+    token.mint(owner, 1, {"from": owner})
+    second = [pipeline.send(token.mint, owner, 1) for _ in range(2)]
+    receipts = pipeline.wait()
+
+    # Assert
+    nonces = [tx.nonce for tx in first + second]
+    assert nonces == list(range(nonces[0], nonces[0] + 3)) + [nonces[0] + 4, nonces[0] + 5]
+    assert all(tx.status == Status.Confirmed for tx in first + receipts)
+    assert token.balanceOf(owner) == 6
+
+
+def test_pipeline_retries_underpriced():
+    # Arrange
+    owner = get_account()
+    token = Token.deploy({"from": owner})
+    tx = token.mint(owner, 1, {"from": owner})
+    fn = FakeFunction(["replacement transaction underpriced", tx])
+    pipeline = TxPipeline(owner, gas_price_bump=1.5)
+
+    # Act
+    assert pipeline.send(fn, gas_price=1000) == tx
+
+    # Assert
+    assert [broadcast["gas_price"] for broadcast in fn.broadcasts] == [1000, 1500]
+    assert fn.broadcasts[0]["nonce"] == fn.broadcasts[1]["nonce"]
+
+
+def test_pipeline_replacement_of_mined_transaction():
+    # Arrange
+    owner = get_account()
+    token = Token.deploy({"from": owner})
+    mined = token.mint(owner, 1, {"from": owner})
+    # The original submission is mined while the pipeline still sees it
+    # pending, so its replacement is rejected for reusing the nonce
+    fn = FakeFunction([StaleTx(mined.txid), "nonce too low"])
+    pipeline = TxPipeline(owner, timeout=0)
+    pipeline.send(fn)
+
+    # Act
+    (receipt,) = pipeline.wait()
+
+    # Assert
+    assert receipt.txid == mined.txid
+    assert receipt.status == Status.Confirmed
+    assert len(fn.broadcasts) == 2
+
+
+def test_pipeline_latency_ends_at_mining():
+    # Arrange
+    owner = get_account()
+    token = Token.deploy({"from": owner})
+    metrics = StepMetrics()
+    pipeline = TxPipeline(owner, metrics=metrics)
+
+    # Act
+    pipeline.send(token.mint, owner, 1)
+    # Mined on send, so the time before wait isn't part of the latency
+    time.sleep(2)
+    pipeline.wait()
+
+    # Assert
+    (record,) = metrics.records
+    assert record["step"] == "mint"
+    assert 0 <= record["latency"] < 1.5
@@ -0,0 +1,74 @@
+import brownie
+from scripts.deploy_crowdsale import wait_for_closing, wait_for_opening
+from scripts.helpful_scripts import get_account, wait_until
+from scripts.vesting_vault import (
+    deploy_vesting_vault,
+    get_allocation_addresses,
+    release_vested,
+)
+from brownie import VestingVault, chain
+from web3 import Web3
+import pytest
+
+
+pytestmark = pytest.mark.usefixtures("isolation")
+
+
+CLIFF = 100
+DURATION = 1000
+
+
+@pytest.mark.parametrize(
+    "crowdsale_config", [{"goal": Web3.toWei(1, "ether")}], indirect=True
+)
+def test_finalize_vests_allocations(crowdsale, token, owner):
+    # Arrange
+    beneficiaries = get_allocation_addresses(crowdsale)
+    start = crowdsale.closingTime()
+    vault = deploy_vesting_vault(
+        crowdsale, {b: (start, CLIFF, DURATION) for b in beneficiaries}, owner
+    )
+    investor = get_account(index=2)
+    crowdsale.addWhitelistedUser(investor, {"from": owner})
+    wait_for_opening(crowdsale)
+    crowdsale.buyToken(investor, {"from": investor, "value": Web3.toWei(1, "ether")})
+    wait_for_closing(crowdsale)
+
+    # Act
+    crowdsale.finalize({"from": owner})
+
+    # Assert
+    totals = [vault.getVesting(b)["total"] for b in beneficiaries]
+    assert token.balanceOf(vault) == sum(totals)
+    assert all(token.balanceOf(b) == 0 for b in beneficiaries)
+    assert release_vested(vault, beneficiaries, owner) == {}
+    with brownie.reverts("Vesting: Beneficiary has no tokens to release"):
+        vault.release(beneficiaries[0], {"from": owner})
+
+    wait_until(start + DURATION // 2)
+    tx = vault.releaseBatch(beneficiaries, {"from": owner})
+    elapsed = chain[tx.block_number].timestamp - start
+    for beneficiary, total in zip(beneficiaries, totals):
+        assert token.balanceOf(beneficiary) == total * elapsed // DURATION
+
+    wait_until(start + DURATION)
+    release_vested(vault, beneficiaries, owner)
+    for beneficiary, total in zip(beneficiaries, totals):
+        assert token.balanceOf(beneficiary) == total
+    assert token.balanceOf(vault) == 0
+
+
+def test_vesting_vault_access(crowdsale, token, owner):
+    other = get_account(index=2)
+    vault = VestingVault.deploy(token, crowdsale, {"from": owner})
+
+    with brownie.reverts("Vesting: Caller is not the depositor"):
+        vault.deposit(other, 1, {"from": owner})
+    with brownie.reverts("Ownable: caller is not the owner"):
+        vault.setVesting(other, chain.time(), CLIFF, DURATION, {"from": other})
+    with brownie.reverts("Vesting: Cliff should be less than/equal to the duration"):
+        vault.setVesting(other, chain.time(), DURATION + 1, DURATION, {"from": owner})
+
+    unrelated = VestingVault.deploy(token, owner, {"from": owner})
+    with brownie.reverts("Crowdsale: Vault doesn't accept deposits from the crowdsale"):
+        crowdsale.setVestingVault(unrelated, {"from": owner})
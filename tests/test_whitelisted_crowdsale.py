@@ -1,13 +1,14 @@
 import brownie
 import pytest
-from brownie import WhitelistedCrowdsale, network
-from scripts.helpful_scripts import LOCAL_BLOCKCHAIN_ENVIRONEMNTS, get_account
+from brownie import WhitelistedCrowdsale, ZERO_ADDRESS
+from scripts.helpful_scripts import get_account
+from scripts.merkle_whitelist import generate_proofs, verify_proof
 
 
-def test_add_remove_whitelist_user_owner():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
+pytestmark = pytest.mark.usefixtures("isolation")
+
 
+def test_add_remove_whitelist_user_owner():
     owner = get_account()
     user1 = get_account(index=1)
     user2 = get_account(index=2)
@@ -26,9 +27,6 @@ def test_add_remove_whitelist_user_owner():
 
 
 def test_add_remove_whitelist_user_non_owner():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
     owner = get_account()
     non_owner = get_account(index=1)
     user = get_account(index=2)
@@ -44,11 +42,73 @@ def test_add_remove_whitelist_user_non_owner():
 
 
 def test_check_non_whitelisted_user():
-    if network.show_active() not in LOCAL_BLOCKCHAIN_ENVIRONEMNTS:
-        pytest.skip("Only for local testing")
-
     owner = get_account()
     user1 = get_account(index=1)
     wl_crowdsale = WhitelistedCrowdsale.deploy({"from": owner})
 
     assert wl_crowdsale.checkWhitelistedUser(user1) == False
+
+
+def test_add_remove_whitelist_users_batch():
+    owner = get_account()
+    users = [get_account(index=i) for i in range(1, 5)]
+    wl_crowdsale = WhitelistedCrowdsale.deploy({"from": owner})
+
+    assert wl_crowdsale.addWhitelistedUsers(users, {"from": owner})
+    for user in users:
+        assert wl_crowdsale.checkWhitelistedUser(user)
+
+    assert wl_crowdsale.removeWhitelistedUsers(users[:2], {"from": owner})
+    assert wl_crowdsale.checkWhitelistedUser(users[0]) == False
+    assert wl_crowdsale.checkWhitelistedUser(users[1]) == False
+    assert wl_crowdsale.checkWhitelistedUser(users[2])
+    assert wl_crowdsale.checkWhitelistedUser(users[3])
+
+
+def test_add_remove_whitelist_users_batch_non_owner():
+    owner = get_account()
+    non_owner = get_account(index=1)
+    users = [get_account(index=2), get_account(index=3)]
+    wl_crowdsale = WhitelistedCrowdsale.deploy({"from": owner})
+
+    with brownie.reverts("Ownable: caller is not the owner"):
+        wl_crowdsale.addWhitelistedUsers(users, {"from": non_owner})
+
+    with brownie.reverts("Ownable: caller is not the owner"):
+        wl_crowdsale.removeWhitelistedUsers(users, {"from": non_owner})
+
+
+def test_add_whitelist_users_batch_zero_address():
+    owner = get_account()
+    users = [get_account(index=1), ZERO_ADDRESS]
+    wl_crowdsale = WhitelistedCrowdsale.deploy({"from": owner})
+
+    with brownie.reverts("Failed: Whitelisted user address is the zero address"):
+        wl_crowdsale.addWhitelistedUsers(users, {"from": owner})
+
+    assert wl_crowdsale.checkWhitelistedUser(users[0]) == False
+
+
+def test_whitelist_merkle_root_proofs():
+    owner = get_account()
+    users = [get_account(index=i) for i in range(1, 6)]
+    outsider = get_account(index=6)
+    wl_crowdsale = WhitelistedCrowdsale.deploy({"from": owner})
+
+    root, proofs = generate_proofs([user.address for user in users])
+    proof = proofs[users[0].address.lower()]
+
+    assert wl_crowdsale.checkWhitelistedProof(users[0], proof) == False
+
+    with brownie.reverts("Ownable: caller is not the owner"):
+        wl_crowdsale.setWhitelistMerkleRoot(root, {"from": outsider})
+
+    assert wl_crowdsale.setWhitelistMerkleRoot(root, {"from": owner})
+    assert wl_crowdsale.whitelistMerkleRoot() == root
+
+    for user in users:
+        assert verify_proof(user.address.lower(), proofs[user.address.lower()], root)
+        assert wl_crowdsale.checkWhitelistedProof(user, proofs[user.address.lower()])
+
+    assert wl_crowdsale.checkWhitelistedProof(outsider, proof) == False
+    assert wl_crowdsale.checkWhitelistedUser(users[0]) == False